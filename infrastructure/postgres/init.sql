@@ -31,10 +31,19 @@ CREATE TABLE workflow_instances (
   data JSONB,
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  -- Optimistic concurrency: bumped on every engine and API write
+  row_version INTEGER NOT NULL DEFAULT 0,
+  -- Set on instances started by a call_workflow step, which they report back to when they finish
+  parent_instance_id UUID,
+  parent_step VARCHAR(100),
+  -- Holds one of its version's running slots (max_concurrent_instances)
+  admitted BOOLEAN NOT NULL DEFAULT FALSE,
 
-  FOREIGN KEY (workflow_version_id) REFERENCES workflow_versions(id)
+  FOREIGN KEY (workflow_version_id) REFERENCES workflow_versions(id),
+  FOREIGN KEY (parent_instance_id) REFERENCES workflow_instances(id)
 );
 CREATE INDEX idx_instances_status ON workflow_instances (status);
+CREATE INDEX idx_instances_parent ON workflow_instances (parent_instance_id) WHERE parent_instance_id IS NOT NULL;
 
 
 CREATE TABLE workflow_step_executions (
@@ -55,15 +64,91 @@ CREATE INDEX idx_step_exec_instance ON workflow_step_executions (instance_id);
 CREATE INDEX idx_step_exec_status ON workflow_step_executions (status);
 
 
+-- Range-partitioned by publish_at into daily UTC partitions (outbox_pYYYYMMDD).
+-- The relay pre-creates upcoming partitions and retires old ones by dropping
+-- them whole; outbox_default catches rows outside the pre-created range.
 CREATE TABLE outbox (
-  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  id UUID NOT NULL DEFAULT gen_random_uuid(),
   destination VARCHAR(255) NOT NULL,
   payload JSONB NOT NULL,
   publish_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-  processed_at TIMESTAMP WITH TIME ZONE NULL
+  processed_at TIMESTAMP WITH TIME ZONE NULL,
+  request_id VARCHAR(36),
+  lease_owner VARCHAR(128),
+  lease_expires_at TIMESTAMP WITH TIME ZONE,
+  -- One of 64 logical shards; all rows of an instance share one (sharded relays)
+  shard_key SMALLINT
+    GENERATED ALWAYS AS ((hashtext(COALESCE(payload->>'instance_id', id::text)) & 63)::smallint) STORED,
+
+  PRIMARY KEY (id, publish_at)
+) PARTITION BY RANGE (publish_at);
+
+CREATE TABLE outbox_default PARTITION OF outbox DEFAULT;
+
+CREATE INDEX idx_outbox_pending_publish_at ON outbox (publish_at) WHERE processed_at IS NULL;
+CREATE INDEX idx_outbox_pending_orchestration ON outbox (publish_at)
+  WHERE processed_at IS NULL AND destination = 'orchestration_queue';
+CREATE INDEX idx_outbox_pending_actions ON outbox (publish_at)
+  WHERE processed_at IS NULL AND destination = 'actions_queue';
+CREATE INDEX idx_outbox_request_id ON outbox (request_id);
+CREATE INDEX idx_outbox_pending_shard ON outbox (shard_key, publish_at) WHERE processed_at IS NULL;
+-- Delayed rows still awaiting the CDC relay's local scheduler (RELAY_MODE=cdc)
+CREATE INDEX idx_outbox_pending_delayed ON outbox (publish_at)
+  WHERE processed_at IS NULL AND publish_at - created_at > interval '1 second';
+
+-- Create the daily partition for p_day, moving any rows that already landed in
+-- outbox_default for that range (ATTACH refuses to run while they are there).
+CREATE OR REPLACE FUNCTION outbox_ensure_partition(p_day DATE)
+RETURNS TEXT AS $$
+DECLARE
+  part_name TEXT := format('outbox_p%s', to_char(p_day, 'YYYYMMDD'));
+  lower_bound TIMESTAMP WITH TIME ZONE := p_day::timestamp AT TIME ZONE 'UTC';
+  upper_bound TIMESTAMP WITH TIME ZONE := (p_day + 1)::timestamp AT TIME ZONE 'UTC';
+  stored_cols TEXT;
+BEGIN
+  IF to_regclass(part_name) IS NOT NULL THEN
+    RETURN part_name;
+  END IF;
+
+  PERFORM pg_advisory_xact_lock(hashtext('outbox_partitions'));
+  IF to_regclass(part_name) IS NOT NULL THEN
+    RETURN part_name;
+  END IF;
+
+  -- Generated columns (shard_key) are recomputed on insert, so they are left out of the copy
+  SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO stored_cols
+  FROM pg_attribute
+  WHERE attrelid = 'outbox'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+  EXECUTE format('CREATE TABLE %I (LIKE outbox INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)', part_name);
+  EXECUTE format(
+    'WITH moved AS (DELETE FROM outbox_default WHERE publish_at >= %L AND publish_at < %L RETURNING %s) '
+    'INSERT INTO %I (%s) SELECT * FROM moved',
+    lower_bound, upper_bound, stored_cols, part_name, stored_cols
+  );
+  EXECUTE format(
+    'ALTER TABLE outbox ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+    part_name, lower_bound, upper_bound
+  );
+  RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT outbox_ensure_partition(((NOW() AT TIME ZONE 'UTC')::date + d)::date)
+FROM generate_series(-1, 3) AS d;
+
+-- Sharded relay membership and shard ownership (src/relay/sharding.py)
+CREATE TABLE relay_members (
+  relay_id VARCHAR(128) PRIMARY KEY,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE relay_shard_leases (
+  shard SMALLINT PRIMARY KEY,
+  owner VARCHAR(128),
+  expires_at TIMESTAMP WITH TIME ZONE
 );
-CREATE INDEX idx_outbox_unprocessed ON outbox (processed_at) WHERE processed_at IS NULL;
 
 CREATE INDEX idx_versions_trigger ON workflow_versions (
   (definition->'trigger'->>'connector_id'),
@@ -104,6 +189,87 @@ CREATE TRIGGER trg_connections_updated_at
   FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
 
+-- Wake the relay (LISTEN outbox_ready) as soon as an outbox row is committed.
+-- Rows inserted already leased (direct publish) are skipped.
+CREATE OR REPLACE FUNCTION notify_outbox_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('outbox_ready', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_outbox_notify
+  AFTER INSERT ON outbox
+  FOR EACH ROW
+  WHEN (NEW.lease_owner IS NULL)
+  EXECUTE FUNCTION notify_outbox_insert();
+
+
+-- Delays, wait timeouts and retry backoffs (src/relay/timers.py). Ids are
+-- <instance>:<purpose>:<step>, so scheduling again reschedules and a timer can
+-- be cancelled by id; due timers are moved into the outbox.
+CREATE TABLE workflow_timers (
+  id VARCHAR(255) PRIMARY KEY,
+  instance_id UUID NOT NULL,
+  fire_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  destination VARCHAR(255) NOT NULL,
+  payload JSONB NOT NULL,
+  request_id VARCHAR(36),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_workflow_timers_fire_at ON workflow_timers (fire_at);
+CREATE INDEX idx_workflow_timers_instance ON workflow_timers (instance_id);
+
+-- Wake the timer service (LISTEN workflow_timers) when a timer is set or moved
+CREATE OR REPLACE FUNCTION notify_timer_change()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('workflow_timers', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_workflow_timers_notify
+  AFTER INSERT OR UPDATE ON workflow_timers
+  FOR EACH ROW EXECUTE FUNCTION notify_timer_change();
+
+-- Running and waiting instances per version with max_concurrent_instances
+CREATE TABLE workflow_admission (
+  version_id UUID PRIMARY KEY REFERENCES workflow_versions(id),
+  running INTEGER NOT NULL DEFAULT 0,
+  waiting INTEGER NOT NULL DEFAULT 0
+);
+
+-- Pending instances waiting for a slot, admitted in seq order
+CREATE TABLE workflow_admission_queue (
+  instance_id UUID PRIMARY KEY REFERENCES workflow_instances(id),
+  version_id UUID NOT NULL,
+  seq BIGSERIAL NOT NULL,
+  queued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX idx_admission_queue_version ON workflow_admission_queue (version_id, seq);
+
+-- Concurrency and rate limits per connection, connector or target host, enforced in Redis
+CREATE TABLE action_limits (
+  scope VARCHAR(20) NOT NULL CHECK (scope IN ('connection', 'connector', 'host')),
+  key VARCHAR(255) NOT NULL,
+  max_in_flight INTEGER CHECK (max_in_flight > 0),
+  rate_per_second NUMERIC CHECK (rate_per_second > 0),
+  -- Tokens the bucket holds when full; defaults to one second's worth of rate
+  burst INTEGER CHECK (burst > 0),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+  PRIMARY KEY (scope, key),
+  CHECK (max_in_flight IS NOT NULL OR rate_per_second IS NOT NULL)
+);
+
+-- Inserts streamed to the CDC relay through logical replication (needs wal_level = logical)
+CREATE PUBLICATION outbox_publication FOR TABLE outbox
+  WITH (publish = 'insert', publish_via_partition_root = true);
+
+
 -- SEED
 DO $$
 DECLARE
@@ -0,0 +1,21 @@
+-- Migration: Wake the relay via LISTEN/NOTIFY on outbox insert
+
+-- The payload is left empty on purpose: identical notifications raised inside
+-- one transaction are collapsed by PostgreSQL, so a transaction that writes
+-- several outbox rows wakes the relay once.
+CREATE OR REPLACE FUNCTION notify_outbox_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('outbox_ready', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_outbox_notify ON outbox;
+CREATE TRIGGER trg_outbox_notify
+  AFTER INSERT ON outbox
+  FOR EACH ROW EXECUTE FUNCTION notify_outbox_insert();
+
+-- Serves both the relay batch scan and the "earliest future publish_at" lookup
+CREATE INDEX IF NOT EXISTS idx_outbox_pending_publish_at
+  ON outbox (publish_at) WHERE processed_at IS NULL;
@@ -0,0 +1,8 @@
+-- Migration: Lease-based outbox claiming
+
+-- A relay claims rows by stamping itself as lease owner, commits, publishes
+-- outside any transaction, and only then marks the rows processed. Rows
+-- whose lease has expired can be reclaimed by any relay replica.
+ALTER TABLE outbox
+  ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(128),
+  ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,88 @@
+-- Migration: Range-partition the outbox by publish_at
+
+-- Daily partitions (outbox_pYYYYMMDD, UTC days) are created ahead of time by
+-- the relay's partition maintenance and dropped whole once every row in them
+-- is processed and older than the retention window. Partitioning on
+-- publish_at (not created_at) keeps long delays out of old partitions, so an
+-- expired partition never holds a row that is still waiting to be sent.
+-- outbox_default catches rows outside the pre-created range.
+
+BEGIN;
+
+ALTER TABLE outbox RENAME TO outbox_legacy;
+DROP TRIGGER IF EXISTS trg_outbox_notify ON outbox_legacy;
+DROP INDEX IF EXISTS idx_outbox_unprocessed;
+DROP INDEX IF EXISTS idx_outbox_pending_publish_at;
+DROP INDEX IF EXISTS idx_outbox_request_id;
+
+CREATE TABLE outbox (
+  id UUID NOT NULL DEFAULT gen_random_uuid(),
+  destination VARCHAR(255) NOT NULL,
+  payload JSONB NOT NULL,
+  publish_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  processed_at TIMESTAMP WITH TIME ZONE NULL,
+  request_id VARCHAR(36),
+  lease_owner VARCHAR(128),
+  lease_expires_at TIMESTAMP WITH TIME ZONE,
+
+  PRIMARY KEY (id, publish_at)
+) PARTITION BY RANGE (publish_at);
+
+CREATE TABLE outbox_default PARTITION OF outbox DEFAULT;
+
+CREATE INDEX idx_outbox_pending_publish_at ON outbox (publish_at) WHERE processed_at IS NULL;
+-- One small index per destination so each destination's scan stays independent
+CREATE INDEX idx_outbox_pending_orchestration ON outbox (publish_at)
+  WHERE processed_at IS NULL AND destination = 'orchestration_queue';
+CREATE INDEX idx_outbox_pending_actions ON outbox (publish_at)
+  WHERE processed_at IS NULL AND destination = 'actions_queue';
+CREATE INDEX idx_outbox_request_id ON outbox (request_id);
+
+CREATE TRIGGER trg_outbox_notify
+  AFTER INSERT ON outbox
+  FOR EACH ROW EXECUTE FUNCTION notify_outbox_insert();
+
+-- Create the daily partition for p_day, moving any rows that already landed in
+-- outbox_default for that range (ATTACH refuses to run while they are there).
+CREATE OR REPLACE FUNCTION outbox_ensure_partition(p_day DATE)
+RETURNS TEXT AS $$
+DECLARE
+  part_name TEXT := format('outbox_p%s', to_char(p_day, 'YYYYMMDD'));
+  lower_bound TIMESTAMP WITH TIME ZONE := p_day::timestamp AT TIME ZONE 'UTC';
+  upper_bound TIMESTAMP WITH TIME ZONE := (p_day + 1)::timestamp AT TIME ZONE 'UTC';
+BEGIN
+  IF to_regclass(part_name) IS NOT NULL THEN
+    RETURN part_name;
+  END IF;
+
+  PERFORM pg_advisory_xact_lock(hashtext('outbox_partitions'));
+  IF to_regclass(part_name) IS NOT NULL THEN
+    RETURN part_name;
+  END IF;
+
+  EXECUTE format('CREATE TABLE %I (LIKE outbox INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part_name);
+  EXECUTE format(
+    'WITH moved AS (DELETE FROM outbox_default WHERE publish_at >= %L AND publish_at < %L RETURNING *) '
+    'INSERT INTO %I SELECT * FROM moved',
+    lower_bound, upper_bound, part_name
+  );
+  EXECUTE format(
+    'ALTER TABLE outbox ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+    part_name, lower_bound, upper_bound
+  );
+  RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT outbox_ensure_partition(((NOW() AT TIME ZONE 'UTC')::date + d)::date)
+FROM generate_series(-1, 3) AS d;
+
+INSERT INTO outbox (id, destination, payload, publish_at, created_at, processed_at, request_id)
+SELECT id, destination, payload, publish_at, created_at, processed_at, request_id
+FROM outbox_legacy
+WHERE processed_at IS NULL;
+
+DROP TABLE outbox_legacy;
+
+COMMIT;
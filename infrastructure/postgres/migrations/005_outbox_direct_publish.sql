@@ -0,0 +1,11 @@
+-- Migration: Don't wake the relay for directly published outbox rows
+
+-- With OUTBOX_DIRECT_PUBLISH on, the writer inserts immediate rows already
+-- leased to itself and publishes them after commit. The relay only needs to
+-- hear about rows nobody has claimed; leased rows it reaches by lease expiry.
+DROP TRIGGER IF EXISTS trg_outbox_notify ON outbox;
+CREATE TRIGGER trg_outbox_notify
+  AFTER INSERT ON outbox
+  FOR EACH ROW
+  WHEN (NEW.lease_owner IS NULL)
+  EXECUTE FUNCTION notify_outbox_insert();
@@ -0,0 +1,19 @@
+-- Migration: Publication for the CDC relay (RELAY_MODE=cdc)
+
+-- Requires wal_level = logical. The relay creates its replication slot
+-- (pgoutput) on first start. Only inserts are published, and through the
+-- partition root so the relay sees one "outbox" relation however the table
+-- is partitioned.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'outbox_publication') THEN
+    CREATE PUBLICATION outbox_publication FOR TABLE outbox
+      WITH (publish = 'insert', publish_via_partition_root = true);
+  END IF;
+END;
+$$;
+
+-- In CDC mode only deliberately delayed rows keep processed_at bookkeeping;
+-- this serves the relay's startup reload and the partition retention check.
+CREATE INDEX IF NOT EXISTS idx_outbox_pending_delayed ON outbox (publish_at)
+  WHERE processed_at IS NULL AND publish_at - created_at > interval '1 second';
@@ -0,0 +1,61 @@
+-- Migration: Shard the outbox by instance for sharded relay replicas (RELAY_SHARDING=true)
+
+-- Every row for an instance lands in the same one of 64 logical shards, and
+-- each shard is leased to one relay at a time, so one replica publishes all
+-- of an instance's events in publish_at order.
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS shard_key SMALLINT
+  GENERATED ALWAYS AS ((hashtext(COALESCE(payload->>'instance_id', id::text)) & 63)::smallint) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_outbox_pending_shard ON outbox (shard_key, publish_at)
+  WHERE processed_at IS NULL;
+
+-- Live relay replicas; a member whose heartbeat lapses drops out of the shard assignment
+CREATE TABLE IF NOT EXISTS relay_members (
+  relay_id VARCHAR(128) PRIMARY KEY,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Current owner of each shard. A shard changes hands only once the old owner
+-- releases it or its lease expires.
+CREATE TABLE IF NOT EXISTS relay_shard_leases (
+  shard SMALLINT PRIMARY KEY,
+  owner VARCHAR(128),
+  expires_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Partitions created from here on must carry the generated column too
+CREATE OR REPLACE FUNCTION outbox_ensure_partition(p_day DATE)
+RETURNS TEXT AS $$
+DECLARE
+  part_name TEXT := format('outbox_p%s', to_char(p_day, 'YYYYMMDD'));
+  lower_bound TIMESTAMP WITH TIME ZONE := p_day::timestamp AT TIME ZONE 'UTC';
+  upper_bound TIMESTAMP WITH TIME ZONE := (p_day + 1)::timestamp AT TIME ZONE 'UTC';
+  stored_cols TEXT;
+BEGIN
+  IF to_regclass(part_name) IS NOT NULL THEN
+    RETURN part_name;
+  END IF;
+
+  PERFORM pg_advisory_xact_lock(hashtext('outbox_partitions'));
+  IF to_regclass(part_name) IS NOT NULL THEN
+    RETURN part_name;
+  END IF;
+
+  -- Generated columns (shard_key) are recomputed on insert, so they are left out of the copy
+  SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) INTO stored_cols
+  FROM pg_attribute
+  WHERE attrelid = 'outbox'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = '';
+
+  EXECUTE format('CREATE TABLE %I (LIKE outbox INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)', part_name);
+  EXECUTE format(
+    'WITH moved AS (DELETE FROM outbox_default WHERE publish_at >= %L AND publish_at < %L RETURNING %s) '
+    'INSERT INTO %I (%s) SELECT * FROM moved',
+    lower_bound, upper_bound, stored_cols, part_name, stored_cols
+  );
+  EXECUTE format(
+    'ALTER TABLE outbox ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+    part_name, lower_bound, upper_bound
+  );
+  RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
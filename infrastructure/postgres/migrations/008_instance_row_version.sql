@@ -0,0 +1,6 @@
+-- Migration: Optimistic concurrency for workflow_instances
+
+-- Bumped by every engine write; ORCHESTRATION_CONCURRENCY=optimistic saves with
+-- UPDATE ... WHERE row_version = <version read> instead of holding a Redis lock
+ALTER TABLE workflow_instances
+  ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,34 @@
+-- Migration: Timers for delays, wait timeouts and retry backoffs
+
+-- Future-dated engine messages wait here instead of in the outbox. The timer
+-- service (src/relay/timers.py) moves each one into the outbox when it is due,
+-- so the outbox only ever holds messages that can be published now. Ids are
+-- chosen by the engine (<instance>:<purpose>:<step>), which makes scheduling
+-- again a reschedule and lets a timer be cancelled without looking it up.
+CREATE TABLE IF NOT EXISTS workflow_timers (
+  id VARCHAR(255) PRIMARY KEY,
+  instance_id UUID NOT NULL,
+  fire_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  destination VARCHAR(255) NOT NULL,
+  payload JSONB NOT NULL,
+  request_id VARCHAR(36),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_workflow_timers_fire_at ON workflow_timers (fire_at);
+CREATE INDEX IF NOT EXISTS idx_workflow_timers_instance ON workflow_timers (instance_id);
+
+-- Wake the timer service (LISTEN workflow_timers) when a timer is set or moved,
+-- in case it is now the earliest one
+CREATE OR REPLACE FUNCTION notify_timer_change()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('workflow_timers', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_workflow_timers_notify ON workflow_timers;
+CREATE TRIGGER trg_workflow_timers_notify
+  AFTER INSERT OR UPDATE ON workflow_timers
+  FOR EACH ROW EXECUTE FUNCTION notify_timer_change();
@@ -0,0 +1,10 @@
+-- Migration: Child instances started by call_workflow steps
+
+-- A child reports its terminal status to parent_step of parent_instance_id
+-- through the outbox; the index serves cancellation cascading to children
+ALTER TABLE workflow_instances
+  ADD COLUMN IF NOT EXISTS parent_instance_id UUID REFERENCES workflow_instances(id),
+  ADD COLUMN IF NOT EXISTS parent_step VARCHAR(100);
+
+CREATE INDEX IF NOT EXISTS idx_instances_parent
+  ON workflow_instances (parent_instance_id) WHERE parent_instance_id IS NOT NULL;
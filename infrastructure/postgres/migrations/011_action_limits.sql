@@ -0,0 +1,18 @@
+-- Migration: Concurrency and rate limits for actions
+
+-- One row per limited connection (key = connections.id), connector
+-- (key = connector id, e.g. 'github') or target host (key = host name from the
+-- action's url or connection_string). Workers and engines read the whole table
+-- every ACTION_LIMITS_TTL_SECONDS and enforce it in Redis (src/shared/action_limits.py).
+CREATE TABLE IF NOT EXISTS action_limits (
+  scope VARCHAR(20) NOT NULL CHECK (scope IN ('connection', 'connector', 'host')),
+  key VARCHAR(255) NOT NULL,
+  max_in_flight INTEGER CHECK (max_in_flight > 0),
+  rate_per_second NUMERIC CHECK (rate_per_second > 0),
+  -- Tokens the bucket holds when full; defaults to one second's worth of rate
+  burst INTEGER CHECK (burst > 0),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+  PRIMARY KEY (scope, key),
+  CHECK (max_in_flight IS NOT NULL OR rate_per_second IS NOT NULL)
+);
@@ -0,0 +1,24 @@
+-- Migration: Admission control for max_concurrent_instances
+
+-- Whether an instance holds one of its version's running slots
+ALTER TABLE workflow_instances
+  ADD COLUMN IF NOT EXISTS admitted BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Running and waiting instances per limited version, kept as counters so
+-- admission never needs a COUNT(*) over workflow_instances
+CREATE TABLE IF NOT EXISTS workflow_admission (
+  version_id UUID PRIMARY KEY REFERENCES workflow_versions(id),
+  running INTEGER NOT NULL DEFAULT 0,
+  waiting INTEGER NOT NULL DEFAULT 0
+);
+
+-- Pending instances waiting for a slot, admitted in seq order
+CREATE TABLE IF NOT EXISTS workflow_admission_queue (
+  instance_id UUID PRIMARY KEY REFERENCES workflow_instances(id),
+  version_id UUID NOT NULL,
+  seq BIGSERIAL NOT NULL,
+  queued_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_admission_queue_version
+  ON workflow_admission_queue (version_id, seq);
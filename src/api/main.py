@@ -7,6 +7,7 @@ from uuid import uuid4
 
 from src.shared.logging_config import log
 from src.shared.metrics import http_requests_total, http_request_duration_seconds
+from src.shared.version_cache import version_cache
 
 from src.api.exception_handlers import register_exception_handlers
 from src.api.routers import health, connectors, connections, workflows, instances, triggers, admin
@@ -31,6 +32,11 @@ app.include_router(triggers.router)
 app.include_router(admin.router)
 
 
+@app.on_event("startup")
+def start_version_cache_listener():
+    version_cache.start_listener()
+
+
 @app.middleware("http")
 async def logging_and_metrics_middleware(request: Request, call_next):
     structlog.contextvars.clear_contextvars()
@@ -2,6 +2,8 @@ import json
 from typing import Optional
 
 from src.shared.base_repository import BaseRepository
+from src.shared import admission, outbox
+from src.shared.constants import ACTIONS_QUEUE
 
 
 class WorkflowRepository(BaseRepository):
@@ -79,15 +81,85 @@ class WorkflowRepository(BaseRepository):
 
     def update_instance_status(self, instance_id: str, status: str) -> None:
         self.execute(
-            "UPDATE workflow_instances SET status = %s WHERE id = %s;",
+            "UPDATE workflow_instances SET status = %s, row_version = row_version + 1 WHERE id = %s;",
             (status, instance_id)
         )
 
     def schedule_outbox_message(self, destination: str, payload: dict) -> None:
-        self.execute(
-            "INSERT INTO outbox (destination, payload) VALUES (%s, %s);",
-            (destination, json.dumps(payload))
+        outbox.insert_message(self.cursor, destination, payload)
+
+    def cancel_timer(self, timer_id: str) -> None:
+        self.execute("DELETE FROM workflow_timers WHERE id = %s", (timer_id,))
+
+    def cancel_instances(self, instance_ids: list) -> list:
+        """Cancel the listed instances and their child instances, skipping finished ones.
+
+        Returns each cancelled row's id, workflow_version_id, admitted,
+        parent_instance_id and parent_step.
+        """
+        return self._cancel_with_children(
+            "SELECT id FROM workflow_instances WHERE id = ANY(%s::uuid[])", (list(instance_ids),))
+
+    def cancel_workflow_instances(self, workflow_id: str) -> list:
+        """Cancel every unfinished instance of a workflow, across its versions, and their child instances."""
+        return self._cancel_with_children(
+            "SELECT i.id FROM workflow_instances i "
+            "JOIN workflow_versions v ON i.workflow_version_id = v.id "
+            "WHERE v.workflow_id = %s AND i.status IN ('pending', 'running')",
+            (workflow_id,)
+        )
+
+    def _cancel_with_children(self, roots_sql: str, params: tuple) -> list:
+        rows = self.fetch_all(
+            "WITH RECURSIVE targets AS ("
+            f"  {roots_sql} "
+            "  UNION "
+            "  SELECT c.id FROM workflow_instances c JOIN targets t ON c.parent_instance_id = t.id"
+            ") "
+            "UPDATE workflow_instances i SET status = 'cancelled', row_version = i.row_version + 1 "
+            "FROM targets t "
+            "WHERE i.id = t.id AND i.status IN ('pending', 'running') "
+            "RETURNING i.id, i.workflow_version_id, i.admitted, i.parent_instance_id, i.parent_step",
+            params
+        )
+        return [{"id": str(row["id"]),
+                 "workflow_version_id": str(row["workflow_version_id"]),
+                 "admitted": row["admitted"],
+                 "parent_instance_id": str(row["parent_instance_id"]) if row["parent_instance_id"] else None,
+                 "parent_step": row["parent_step"]} for row in rows]
+
+    def withdraw_admissions(self, instance_ids: list) -> None:
+        admission.withdraw(self.cursor, instance_ids)
+
+    def release_admission(self, version_id: str, slots: int) -> list:
+        """Free running slots of a version; returns the waiting instances that were admitted into them."""
+        return admission.release(self.cursor, version_id, slots)
+
+    def purge_scheduled_work(self, instance_ids: list) -> list:
+        """Delete the instances' timers and unpublished outbox rows.
+
+        Returns the ids of the deleted action rows that a relay, or a direct
+        publish, had leased. Those messages may reach the broker anyway, and
+        their ids are the Celery task ids to revoke. Actions that were
+        already delivered are left to the workers' cancelled-instance
+        check. Outbox rows are found through the shard index, since
+        shard_key is derived from the instance id.
+        """
+        if not instance_ids:
+            return []
+        instance_ids = list(instance_ids)
+        self.execute("DELETE FROM workflow_timers WHERE instance_id = ANY(%s::uuid[])", (instance_ids,))
+        revocable = self.fetch_all(
+            "DELETE FROM outbox o "
+            "USING unnest(%s::text[]) AS t(instance_id) "
+            "WHERE o.processed_at IS NULL "
+            "AND o.shard_key = (hashtext(t.instance_id) & 63)::smallint "
+            "AND o.payload->>'instance_id' = t.instance_id "
+            "RETURNING o.id, o.destination, o.lease_owner",
+            (instance_ids,)
         )
+        return [str(row["id"]) for row in revocable
+                if row["destination"] == ACTIONS_QUEUE and row["lease_owner"] is not None]
 
     def list_instances(self, status: str = None, workflow_id: str = None, limit: int = 50, offset: int = 0) -> list:
         query = (
@@ -129,13 +201,17 @@ class WorkflowRepository(BaseRepository):
             "JOIN workflows w ON v.workflow_id = w.id "
             "WHERE i.status IN ('pending', 'running') "
             "AND i.updated_at < NOW() - INTERVAL '%s seconds' "
+            # Delays, timeouts and retry backoffs are not stuck, just waiting for their timer
+            "AND NOT EXISTS (SELECT 1 FROM workflow_timers t WHERE t.instance_id = i.id) "
+            # Nor are instances waiting for a slot under max_concurrent_instances
+            "AND NOT EXISTS (SELECT 1 FROM workflow_admission_queue q WHERE q.instance_id = i.id) "
             "ORDER BY i.created_at ASC",
             (stale_seconds,)
         )
 
     def find_latest_step_execution(self, instance_id: str, step_name: str) -> Optional[dict]:
         return self.fetch_one(
-            "SELECT id, step_name, status, output_data "
+            "SELECT id, step_name, status, input_data, output_data "
             "FROM workflow_step_executions "
             "WHERE instance_id = %s AND step_name = %s "
             "ORDER BY started_at DESC LIMIT 1;",
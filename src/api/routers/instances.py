@@ -3,7 +3,9 @@ from fastapi import APIRouter, Depends
 
 from src.api.service import WorkflowManagementService
 from src.api.dependencies import get_service
-from src.api.schemas import EventPayload, InstanceCancelledOut, EventSentOut
+from src.api.schemas import (
+    EventPayload, InstanceCancelledOut, EventSentOut, CancelInstancesPayload, InstancesCancelledOut,
+)
 
 router = APIRouter()
 
@@ -24,6 +26,14 @@ def list_instances(
     )
 
 
+@router.post("/instances/cancel", response_model=InstancesCancelledOut)
+def cancel_instances(payload: CancelInstancesPayload, service: WorkflowManagementService = Depends(get_service)):
+    return service.cancel_instances(
+        instance_ids=[str(i) for i in payload.instance_ids] if payload.instance_ids else None,
+        workflow_id=str(payload.workflow_id) if payload.workflow_id else None,
+    )
+
+
 @router.get("/instances/{instance_id}")
 def get_instance_status(instance_id: UUID, service: WorkflowManagementService = Depends(get_service)):
     return service.get_instance(str(instance_id))
@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from uuid import UUID
@@ -22,6 +23,11 @@ class EventPayload(BaseModel):
     data: dict = {}
 
 
+class CancelInstancesPayload(BaseModel):
+    instance_ids: Optional[List[UUID]] = None
+    workflow_id: Optional[UUID] = None
+
+
 class CreateConnectionPayload(BaseModel):
     connector_id: str
     name: str
@@ -61,6 +67,11 @@ class InstanceCancelledOut(BaseModel):
     instance_id: str
 
 
+class InstancesCancelledOut(BaseModel):
+    message: str
+    cancelled: int
+
+
 class EventSentOut(BaseModel):
     message: str
     instance_id: str
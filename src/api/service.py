@@ -1,13 +1,20 @@
+from collections import Counter
 import structlog
 
 from src.shared.logging_config import log
 from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
-from src.shared.event_types import EventType
+from src.shared.event_types import EventType, child_result_payload
 from src.shared.connectors.registry import ConnectorRegistry
 from src.shared.db import db_cursor
+from src.shared.version_cache import version_cache
+from src.shared.timers import WAIT_TIMEOUT, timer_id
+from src.shared.cancellations import cancelled_instances
+from src.shared.celery_app import app as celery_app
 from src.shared.triggers.models import TriggerEvent
 from src.shared.triggers.ports import TriggerHandlerPort
 
+from src.orchestration.domain.plan import StepKind, compile_plan, check_plan
+
 from src.api.repository import WorkflowRepository
 from src.api.errors import (
     WorkflowNotFoundError, InstanceNotFoundError,
@@ -17,6 +24,7 @@ from src.api.errors import (
 from src.api.health import HealthChecker
 
 TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+REVOKE_CHUNK_SIZE = 1000
 
 
 class WorkflowManagementService:
@@ -27,6 +35,20 @@ class WorkflowManagementService:
         with db_cursor() as cur:
             return HealthChecker.comprehensive_check(cur)
 
+    def _validate_definition(self, definition: dict) -> None:
+        """Reject unknown actions and definitions the engine could not run to the end."""
+        errors = self.connector_registry.validate_definition(definition)
+        plan = compile_plan(definition)
+        errors += check_plan(plan)
+        called = {step.workflow for step in plan.steps.values() if step.kind == StepKind.CALL and step.workflow}
+        if called:
+            with db_cursor() as cur:
+                repo = WorkflowRepository(cur)
+                errors += [f"Called workflow '{name}' does not exist" for name in sorted(called)
+                           if not version_cache.active(("name", name), lambda: repo.find_active_version_by_name(name))]
+        if errors:
+            raise ValidationError(errors)
+
     def list_connectors(self) -> list:
         from dataclasses import asdict
         return [asdict(c) for c in self.connector_registry.list_connectors()]
@@ -34,9 +56,7 @@ class WorkflowManagementService:
     # --- Workflow CRUD ---
 
     def create_workflow(self, name: str, definition: dict) -> dict:
-        errors = self.connector_registry.validate_definition(definition)
-        if errors:
-            raise ValidationError(errors)
+        self._validate_definition(definition)
 
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
@@ -48,6 +68,7 @@ class WorkflowManagementService:
                     raise DuplicateWorkflowError(f"Workflow name '{name}' already exists")
                 raise
 
+        version_cache.invalidate_active()
         log.info("Workflow created", workflow_id=workflow_id)
         return {"workflow_id": workflow_id, "version_id": version_id, "version": 1}
 
@@ -68,9 +89,7 @@ class WorkflowManagementService:
         return result
 
     def create_version(self, workflow_id: str, definition: dict) -> dict:
-        errors = self.connector_registry.validate_definition(definition)
-        if errors:
-            raise ValidationError(errors)
+        self._validate_definition(definition)
 
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
@@ -82,6 +101,7 @@ class WorkflowManagementService:
             repo.deactivate_versions(workflow_id)
             version_id = repo.create_version(workflow_id, next_version, definition)
 
+        version_cache.invalidate_active()
         log.info("New version created", workflow_id=workflow_id, version=next_version)
         return {"version_id": version_id, "version": next_version}
 
@@ -93,7 +113,8 @@ class WorkflowManagementService:
 
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
-            row = repo.find_active_version_by_name(definition_name)
+            row = version_cache.active(
+                ("name", definition_name), lambda: repo.find_active_version_by_name(definition_name))
             if not row:
                 raise WorkflowNotFoundError("Workflow definition not found")
 
@@ -113,7 +134,8 @@ class WorkflowManagementService:
 
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
-            row = repo.find_active_version_by_name(workflow_name)
+            row = version_cache.active(
+                ("name", workflow_name), lambda: repo.find_active_version_by_name(workflow_name))
             if not row:
                 raise WorkflowNotFoundError("Workflow not found")
 
@@ -148,18 +170,82 @@ class WorkflowManagementService:
     def cancel_instance(self, instance_id: str) -> dict:
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
-            instance = repo.get_instance(instance_id)
-            if not instance:
-                raise InstanceNotFoundError("Instance not found")
-
-            if instance["status"] in TERMINAL_STATUSES:
+            # Only an unfinished instance changes status, so one the engine finishes meanwhile keeps its result
+            rows = repo.cancel_instances([instance_id])
+            if instance_id not in (row["id"] for row in rows):
+                instance = repo.get_instance(instance_id)
+                if not instance:
+                    raise InstanceNotFoundError("Instance not found")
                 raise InvalidStateError(f"Cannot cancel instance with status '{instance['status']}'")
 
-            repo.update_instance_status(instance_id, "cancelled")
+            cancelled, task_ids = self._settle_cancelled(repo, rows)
 
-        log.info("Workflow cancelled", instance_id=instance_id)
+        self._stop_cancelled(cancelled, task_ids)
+        log.info("Workflow cancelled", instance_id=instance_id, children=len(cancelled) - 1, revoked=len(task_ids))
         return {"message": "Workflow cancelled", "instance_id": instance_id}
 
+    def cancel_instances(self, instance_ids: list = None, workflow_id: str = None) -> dict:
+        """Cancel many instances at once: the listed ones, or every unfinished instance of a workflow.
+
+        Status changes and purges are set-based statements in one
+        transaction, so cancelling tens of thousands of instances costs a
+        handful of round trips. Instances that already finished are skipped;
+        child instances started by call_workflow steps are cancelled with
+        their parents.
+        """
+        if not instance_ids and not workflow_id:
+            raise ValidationError(["Give instance_ids or workflow_id"])
+
+        with db_cursor() as cur:
+            repo = WorkflowRepository(cur)
+            if workflow_id:
+                rows = repo.cancel_workflow_instances(workflow_id)
+            else:
+                rows = repo.cancel_instances(instance_ids)
+            cancelled, task_ids = self._settle_cancelled(repo, rows)
+
+        self._stop_cancelled(cancelled, task_ids)
+        log.info("Workflows cancelled", cancelled=len(cancelled), workflow_id=workflow_id, revoked=len(task_ids))
+        return {"message": "Workflows cancelled", "cancelled": len(cancelled)}
+
+    @staticmethod
+    def _settle_cancelled(repo: WorkflowRepository, rows: list) -> tuple:
+        """In the cancelling transaction: purge the instances' scheduled work and hand on what they held.
+
+        A cancelled child fails its parent's call_workflow step, unless the
+        parent is being cancelled too. Instances waiting for admission leave
+        the queue, and the running slots of admitted ones go to the next
+        waiting instances. Returns the cancelled ids and the task ids to
+        revoke.
+        """
+        cancelled = [str(row["id"]) for row in rows]
+        for row in rows:
+            parent_id = row.get("parent_instance_id")
+            if parent_id and str(parent_id) not in cancelled:
+                repo.schedule_outbox_message(
+                    ORCHESTRATION_QUEUE, child_result_payload(str(parent_id), row["parent_step"], str(row["id"]), "cancelled"))
+
+        repo.withdraw_admissions(cancelled)
+        slots = Counter(str(row["workflow_version_id"]) for row in rows if row.get("admitted"))
+        for version_id, count in slots.items():
+            for instance_id in repo.release_admission(version_id, count):
+                repo.schedule_outbox_message(
+                    ORCHESTRATION_QUEUE, {"type": EventType.START_WORKFLOW.value, "instance_id": instance_id})
+        return cancelled, repo.purge_scheduled_work(cancelled)
+
+    @staticmethod
+    def _stop_cancelled(instance_ids: list, task_ids: list) -> None:
+        """After commit: tell workers and engines the instances are cancelled and revoke their queued actions."""
+        if not instance_ids:
+            return
+        cancelled_instances.mark(instance_ids)
+        try:
+            for start in range(0, len(task_ids), REVOKE_CHUNK_SIZE):
+                celery_app.control.revoke(task_ids[start:start + REVOKE_CHUNK_SIZE])
+        except Exception:
+            # The workers' cancelled-instance check still skips these tasks
+            log.warning("Failed to revoke queued actions", count=len(task_ids), exc_info=True)
+
     def send_event(self, instance_id: str, data: dict) -> dict:
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
@@ -179,6 +265,8 @@ class WorkflowManagementService:
             if step_def.get("type") != "wait_for_event":
                 raise InvalidStateError(f"Current step '{current_step}' is not a wait_for_event step")
 
+            # Cancelled in the same transaction, so the timeout cannot fire once the event is accepted
+            repo.cancel_timer(timer_id(instance_id, WAIT_TIMEOUT, current_step))
             repo.schedule_outbox_message(
                 ORCHESTRATION_QUEUE,
                 {
@@ -199,7 +287,10 @@ class WorkflowManagementService:
         started = []
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
-            versions = repo.find_active_versions_by_trigger(event.connector_id, event.trigger_id)
+            versions = version_cache.active(
+                ("trigger", event.connector_id, event.trigger_id),
+                lambda: repo.find_active_versions_by_trigger(event.connector_id, event.trigger_id),
+            )
 
             if not versions:
                 log.info("No workflows matched trigger", connector_id=event.connector_id, trigger_id=event.trigger_id)
@@ -245,6 +336,7 @@ class WorkflowManagementService:
                     log.info("Recovery: re-queued START_WORKFLOW", instance_id=instance_id)
 
                 elif status == "running" and current_step:
+                    step_def = definition.get("steps", {}).get(current_step, {})
                     step_exec = repo.find_latest_step_execution(instance_id, current_step)
 
                     if step_exec and step_exec["status"] == "completed":
@@ -259,23 +351,56 @@ class WorkflowManagementService:
                         )
                         recovered.append({"instance_id": instance_id, "action": f"re-queued STEP_COMPLETE for {current_step}"})
                         log.info("Recovery: re-queued STEP_COMPLETE", instance_id=instance_id, step=current_step)
+                    elif step_def.get("type") == "parallel":
+                        # Workers skip branches that already completed, so re-dispatching every open one is safe
+                        for branch, branch_def in (step_def.get("branches") or {}).items():
+                            branch_step = f"{current_step}.{branch}"
+                            branch_exec = repo.find_latest_step_execution(instance_id, branch_step)
+                            if branch_exec and branch_exec["status"] in ("completed", "failed"):
+                                continue
+                            repo.schedule_outbox_message(ACTIONS_QUEUE, self._action_payload(instance_id, branch_step, branch_def))
+                            recovered.append({"instance_id": instance_id, "action": f"re-dispatched action for {branch_step}"})
+                            log.info("Recovery: re-dispatched branch action", instance_id=instance_id, step=branch_step)
+                    elif step_def.get("type") == "call_workflow":
+                        # A running child is recovered on its own; one that ended may have lost its callback
+                        child_id = ((step_exec or {}).get("output_data") or {}).get("child_instance_id")
+                        child = repo.get_instance(child_id) if child_id else None
+                        if child and child["status"] in TERMINAL_STATUSES:
+                            repo.schedule_outbox_message(ORCHESTRATION_QUEUE, child_result_payload(
+                                instance_id, current_step, child_id, child["status"], child.get("data")))
+                            recovered.append({"instance_id": instance_id, "action": f"re-sent child result for {current_step}"})
+                            log.info("Recovery: re-sent child result", instance_id=instance_id, step=current_step)
+                    elif step_def.get("type") == "map":
+                        progress = (step_exec or {}).get("output_data") or {}
+                        for index in range(progress.get("dispatched", 0)):
+                            item_step = f"{current_step}[{index}]"
+                            item_exec = repo.find_latest_step_execution(instance_id, item_step)
+                            if not item_exec or item_exec["status"] in ("completed", "failed"):
+                                continue
+                            payload = self._action_payload(instance_id, item_step, step_def.get("action") or {})
+                            payload.update(item_exec.get("input_data") or {})
+                            repo.schedule_outbox_message(ACTIONS_QUEUE, payload)
+                            recovered.append({"instance_id": instance_id, "action": f"re-dispatched action for {item_step}"})
+                            log.info("Recovery: re-dispatched map item action", instance_id=instance_id, step=item_step)
                     else:
-                        step_def = definition.get("steps", {}).get(current_step, {})
-                        action_id = step_def.get("action_id", current_step)
-                        payload = {
-                            "action": action_id,
-                            "step_name": current_step,
-                            "instance_id": instance_id,
-                            "config": step_def.get("config", {}),
-                        }
-                        if step_def.get("connection_id"):
-                            payload["connection_id"] = step_def["connection_id"]
-                        repo.schedule_outbox_message(ACTIONS_QUEUE, payload)
+                        repo.schedule_outbox_message(ACTIONS_QUEUE, self._action_payload(instance_id, current_step, step_def))
                         recovered.append({"instance_id": instance_id, "action": f"re-dispatched action for {current_step}"})
                         log.info("Recovery: re-dispatched action", instance_id=instance_id, step=current_step)
 
         return recovered
 
+    @staticmethod
+    def _action_payload(instance_id: str, step_name: str, step_def: dict) -> dict:
+        payload = {
+            "action": step_def.get("action_id", step_name),
+            "step_name": step_name,
+            "instance_id": instance_id,
+            "config": step_def.get("config", {}),
+        }
+        if step_def.get("connection_id"):
+            payload["connection_id"] = step_def["connection_id"]
+        return payload
+
     def get_instance_steps(self, instance_id: str) -> list:
         with db_cursor() as cur:
             repo = WorkflowRepository(cur)
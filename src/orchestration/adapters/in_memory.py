@@ -0,0 +1,259 @@
+import copy
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from src.orchestration.domain.exceptions import ConcurrentUpdateError
+from src.orchestration.domain.models import (
+  WorkflowVersion, WorkflowInstance, WorkflowStepExecution
+)
+
+
+@dataclass
+class OutboxMessage:
+  destination: str
+  payload: dict
+  publish_at: datetime
+  request_id: Optional[str] = None
+
+
+@dataclass
+class Timer:
+  id: str
+  instance_id: str
+  fire_at: datetime
+  destination: str
+  payload: dict
+  request_id: Optional[str] = None
+
+
+@dataclass
+class Admission:
+  running: int = 0
+  # Waiting instance ids, oldest first
+  queue: List[str] = field(default_factory=list)
+
+
+@dataclass
+class InMemoryStore:
+  """Process-local stand-in for the workflow tables, the outbox and the timers."""
+  versions: Dict[str, WorkflowVersion] = field(default_factory=dict)
+  instances: Dict[str, WorkflowInstance] = field(default_factory=dict)
+  step_executions: Dict[str, List[WorkflowStepExecution]] = field(default_factory=dict)
+  outbox: List[OutboxMessage] = field(default_factory=list)
+  timers: Dict[str, Timer] = field(default_factory=dict)
+  # workflow name -> id of its active version; the last version added is the active one
+  active_versions: Dict[str, str] = field(default_factory=dict)
+  # version id -> admission counters, for versions with max_concurrent_instances
+  admission: Dict[str, Admission] = field(default_factory=dict)
+
+  def add_version(self, version: WorkflowVersion) -> None:
+    self.versions[version.id] = version
+    self.active_versions[version.workflow_name] = version.id
+
+  def add_instance(self, instance: WorkflowInstance) -> None:
+    self.instances[instance.id] = instance
+    self.step_executions.setdefault(instance.id, [])
+
+
+class InMemoryWorkflowRepository:
+  """Same interface as PostgresWorkflowRepository, backed by an InMemoryStore.
+
+  Reads hand out copies and writes are staged until the unit of work
+  commits, so the service sees the same isolation it gets from Postgres:
+  in-place edits do nothing until saved, and a rollback drops them.
+  """
+
+  def __init__(self, store: InMemoryStore):
+    self.store = store
+    self._instances: Dict[str, WorkflowInstance] = {}
+    self._steps: Dict[str, WorkflowStepExecution] = {}
+    self._new_steps: List[WorkflowStepExecution] = []
+    self._new_instances: Dict[str, WorkflowInstance] = {}
+    self._admission: Dict[str, Admission] = {}
+    self._outbox: List[OutboxMessage] = []
+    # timer id -> Timer, or None to cancel
+    self._timers: Dict[str, Optional[Timer]] = {}
+
+  def find_instance(self, instance_id: str) -> Optional[Tuple[WorkflowInstance, WorkflowVersion]]:
+    instance = (self._instances.get(instance_id) or self._new_instances.get(instance_id)
+                or self.store.instances.get(instance_id))
+    if not instance:
+      return None
+    return copy.deepcopy(instance), self.store.versions[instance.workflow_version_id]
+
+  def find_active_version_id(self, workflow_name: str) -> Optional[str]:
+    return self.store.active_versions.get(workflow_name)
+
+  def find_current_step_execution(self, instance_id: str, step_name: str) -> Optional[WorkflowStepExecution]:
+    candidates = [s for s in self.store.step_executions.get(instance_id, []) if s.step_name == step_name]
+    candidates += [s for s in self._new_steps if s.instance_id == instance_id and s.step_name == step_name]
+    if not candidates:
+      return None
+    # Latest by start time; on a tie the later insert wins, like a fresh row would
+    latest = candidates[0]
+    for step in candidates[1:]:
+      if step.started_at >= latest.started_at:
+        latest = step
+    return copy.deepcopy(self._steps.get(latest.id, latest))
+
+  def find_step_executions(self, instance_id: str, step_names: List[str]) -> Dict[str, Optional[WorkflowStepExecution]]:
+    return {name: self.find_current_step_execution(instance_id, name) for name in step_names}
+
+  def save_instance(self, instance: WorkflowInstance) -> None:
+    current = (self._instances.get(instance.id) or self._new_instances.get(instance.id)
+               or self.store.instances[instance.id])
+    if current.row_version != instance.row_version:
+      raise ConcurrentUpdateError(instance.id, instance.row_version)
+    instance.row_version += 1
+    instance.updated_at = datetime.now(timezone.utc)
+    self._instances[instance.id] = copy.deepcopy(instance)
+
+  def add_instance(self, instance: WorkflowInstance, request_id: str = None) -> None:
+    self._new_instances[instance.id] = copy.deepcopy(instance)
+
+  def add_step_execution(self, step: WorkflowStepExecution) -> None:
+    self._new_steps.append(copy.deepcopy(step))
+
+  def save_step_execution(self, step: WorkflowStepExecution) -> None:
+    self._steps[step.id] = copy.deepcopy(step)
+
+  def schedule_message(self, destination: str, payload: dict, publish_at: Optional[datetime] = None, request_id: str = None) -> None:
+    if publish_at is None:
+      publish_at = datetime.now(timezone.utc)
+    self._outbox.append(OutboxMessage(destination, copy.deepcopy(payload), publish_at, request_id))
+
+  def schedule_timer(self, timer_id: str, instance_id: str, fire_at: datetime, destination: str,
+                     payload: dict, request_id: str = None) -> None:
+    self._timers[timer_id] = Timer(timer_id, instance_id, fire_at, destination, copy.deepcopy(payload), request_id)
+
+  def cancel_timer(self, timer_id: str) -> None:
+    self._timers[timer_id] = None
+
+  def admit(self, instance_id: str, version_id: str, limit: int) -> bool:
+    counter = self._counter(version_id)
+    if counter.running < limit and not counter.queue:
+      counter.running += 1
+      return True
+    if instance_id not in counter.queue:
+      counter.queue.append(instance_id)
+    return False
+
+  def release_admission(self, version_id: str) -> List[str]:
+    counter = self._counter(version_id)
+    if not counter.queue:
+      counter.running = max(counter.running - 1, 0)
+      return []
+    instance_id = counter.queue.pop(0)
+    instance = copy.deepcopy(self._instances.get(instance_id) or self.store.instances[instance_id])
+    instance.admitted = True
+    instance.row_version += 1
+    self._instances[instance_id] = instance
+    return [instance_id]
+
+  def _counter(self, version_id: str) -> Admission:
+    if version_id not in self._admission:
+      self._admission[version_id] = copy.deepcopy(self.store.admission.get(version_id) or Admission())
+    return self._admission[version_id]
+
+  def staged(self) -> tuple:
+    return (dict(self._instances), dict(self._new_instances), dict(self._steps), list(self._new_steps),
+            list(self._outbox), dict(self._timers), copy.deepcopy(self._admission))
+
+  def restore_staged(self, staged: tuple) -> None:
+    (self._instances, self._new_instances, self._steps, self._new_steps, self._outbox, self._timers,
+     self._admission) = staged
+
+  def commit(self) -> None:
+    for instance in self._new_instances.values():
+      self.store.add_instance(instance)
+    self.store.instances.update(self._instances)
+    for step in self._new_steps:
+      self.store.step_executions.setdefault(step.instance_id, []).append(step)
+    for saved in self._steps.values():
+      steps = self.store.step_executions.setdefault(saved.instance_id, [])
+      for i, step in enumerate(steps):
+        if step.id == saved.id:
+          steps[i] = saved
+          break
+    self.store.outbox.extend(self._outbox)
+    self.store.admission.update(self._admission)
+    for timer_id, timer in self._timers.items():
+      if timer is None:
+        self.store.timers.pop(timer_id, None)
+      else:
+        self.store.timers[timer_id] = timer
+
+
+class InMemoryUnitOfWork:
+  """Unit of work over an InMemoryStore; commits staged writes on a clean exit."""
+
+  def __init__(self, store: InMemoryStore):
+    self.store = store
+    self.workflow: Optional[InMemoryWorkflowRepository] = None
+
+  def __enter__(self):
+    self.workflow = InMemoryWorkflowRepository(self.store)
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    if not exc_type:
+      self.workflow.commit()
+    self.workflow = None
+
+  def commit(self):
+    self.workflow.commit()
+    self.workflow = InMemoryWorkflowRepository(self.store)
+
+  def rollback(self):
+    self.workflow = InMemoryWorkflowRepository(self.store)
+
+  @contextmanager
+  def savepoint(self, name: str = "uow_savepoint"):
+    staged = self.workflow.staged()
+    try:
+      yield
+    except Exception:
+      self.workflow.restore_staged(staged)
+      raise
+
+
+class InMemoryLockService:
+  """Non-blocking lock with the RedisLockService interface; timeouts are not enforced."""
+
+  def __init__(self):
+    self.held = set()
+
+  def acquire_lock(self, key: str, timeout: int) -> bool:
+    if key in self.held:
+      return False
+    self.held.add(key)
+    return True
+
+  def release_lock(self, key: str) -> None:
+    self.held.discard(key)
+
+
+class InMemoryEventBuffer:
+  """Per-instance event FIFO with the RedisEventBuffer interface."""
+
+  def __init__(self):
+    self.queues: Dict[str, List] = {}
+
+  def park(self, event) -> None:
+    self.queues.setdefault(event.instance_id, []).append(event)
+
+  def take(self, instance_id: str, limit: int = 50) -> List:
+    queue = self.queues.get(instance_id, [])
+    taken, self.queues[instance_id] = queue[:limit], queue[limit:]
+    return taken
+
+  def restore(self, instance_id: str, events: List) -> None:
+    self.queues[instance_id] = list(events) + self.queues.get(instance_id, [])
+
+  def pending(self, instance_id: str) -> int:
+    return len(self.queues.get(instance_id, []))
+
+  def parked_instances(self):
+    return [instance_id for instance_id, queue in self.queues.items() if queue]
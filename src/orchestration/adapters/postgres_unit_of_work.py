@@ -1,127 +1,344 @@
+import copy
 import json
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timezone
 
 from src.shared.logging_config import log
 from src.shared.base_unit_of_work import BasePostgresUnitOfWork
 from src.shared.base_repository import BaseRepository
+from src.shared import admission, outbox, timers
+from src.shared.version_cache import VersionCache, version_cache
 
+from src.orchestration.domain.exceptions import ConcurrentUpdateError
 from src.orchestration.domain.models import (
-    WorkflowVersion, WorkflowInstance, WorkflowStatus, WorkflowStepExecution
+    WorkflowVersion, WorkflowInstance, WorkflowStatus, WorkflowStepExecution, StepExecutionStatus
 )
 
 
+STEP_COLUMNS = (
+    "id", "step_name", "status", "attempts", "started_at",
+    "completed_at", "input_data", "output_data", "error_details",
+)
+
+
+def step_from_row(instance_id: str, row: dict, prefix: str = "") -> WorkflowStepExecution:
+    values = {column: row[prefix + column] for column in STEP_COLUMNS}
+    values["id"] = str(values["id"])
+    values["status"] = StepExecutionStatus(values["status"])
+    return WorkflowStepExecution(instance_id=str(instance_id), **values)
+
+
 class PostgresWorkflowRepository(BaseRepository):
+    """Workflow state for one transaction.
+
+    `find_instance` loads the instance and the latest execution of its
+    current step in one query; the immutable version comes from the
+    process-wide version cache. Writes are buffered and `flush` sends
+    them as a single statement of data-modifying CTEs, which the unit of
+    work does just before it commits. Reads in the same transaction see the
+    buffered writes.
+    """
+
+    def __init__(self, cursor, versions: VersionCache = version_cache):
+        super().__init__(cursor)
+        self.versions = versions
+        # Last read or saved state, per instance and per (instance, step name)
+        self._instances: Dict[str, Tuple[WorkflowInstance, WorkflowVersion]] = {}
+        self._steps: Dict[Tuple[str, str], Optional[WorkflowStepExecution]] = {}
+        # Buffered writes; an instance keeps the row_version it was read at for the compare-and-swap
+        self._instance_writes: Dict[str, Tuple[WorkflowInstance, int]] = {}
+        self._instance_inserts: List[Tuple[WorkflowInstance, Optional[str]]] = []
+        self._step_inserts: Dict[str, WorkflowStepExecution] = {}
+        self._step_updates: Dict[str, WorkflowStepExecution] = {}
+        self._outbox: List[Tuple[str, tuple]] = []
+        # timer id -> (instance id, fire at, destination, payload, request id), or None to cancel; the last call wins
+        self._timers: Dict[str, Optional[tuple]] = {}
 
     def find_instance(self, instance_id: str) -> Optional[Tuple[WorkflowInstance, WorkflowVersion]]:
+        if instance_id not in self._instances:
+            row = self.fetch_one("""
+                SELECT
+                    i.id, i.workflow_version_id, i.status, i.current_step,
+                    i.current_step_attempts, i.data, i.created_at, i.updated_at,
+                    i.row_version, i.parent_instance_id, i.parent_step, i.admitted,
+                    s.id AS step_id, s.step_name AS step_step_name, s.status AS step_status,
+                    s.attempts AS step_attempts, s.started_at AS step_started_at,
+                    s.completed_at AS step_completed_at, s.input_data AS step_input_data,
+                    s.output_data AS step_output_data, s.error_details AS step_error_details
+                FROM workflow_instances i
+                LEFT JOIN LATERAL (
+                    SELECT id, step_name, status, attempts, started_at,
+                        completed_at, input_data, output_data, error_details
+                    FROM workflow_step_executions
+                    WHERE instance_id = i.id AND step_name = i.current_step
+                    ORDER BY started_at DESC
+                    LIMIT 1
+                ) s ON TRUE
+                WHERE i.id = %s
+            """, (instance_id,))
+
+            if not row:
+                return None
+
+            instance = WorkflowInstance(
+                id=str(row['id']),
+                workflow_version_id=str(row['workflow_version_id']),
+                status=WorkflowStatus(row['status']),
+                current_step=row['current_step'],
+                current_step_attempts=row['current_step_attempts'] or 0,
+                data=row['data'] or {},
+                created_at=row['created_at'],
+                updated_at=row['updated_at'],
+                row_version=row['row_version'],
+                parent_instance_id=str(row['parent_instance_id']) if row['parent_instance_id'] else None,
+                parent_step=row['parent_step'],
+                admitted=row['admitted'],
+            )
+
+            version = self.versions.get(instance.workflow_version_id,
+                                        lambda: self._load_version(instance.workflow_version_id))
+
+            self._instances[instance_id] = (instance, version)
+            if instance.current_step:
+                step = step_from_row(instance.id, row, prefix="step_") if row['step_id'] else None
+                self._steps.setdefault((instance_id, instance.current_step), step)
+
+        instance, version = self._instances[instance_id]
+        return copy.deepcopy(instance), version
+
+    def _load_version(self, version_id: str) -> WorkflowVersion:
         row = self.fetch_one("""
-            SELECT
-                i.id, i.workflow_version_id, i.status, i.current_step,
-                i.current_step_attempts, i.data, i.created_at, i.updated_at,
-                v.definition, w.name as workflow_name
-            FROM workflow_instances i
-            JOIN workflow_versions v ON i.workflow_version_id = v.id
+            SELECT v.id, v.definition, w.name AS workflow_name
+            FROM workflow_versions v
             JOIN workflows w ON v.workflow_id = w.id
-            WHERE i.id = %s
-        """, (instance_id,))
-
-        if not row:
-            return None
-
-        instance = WorkflowInstance(
-            id=str(row['id']),
-            workflow_version_id=str(row['workflow_version_id']),
-            status=WorkflowStatus(row['status']),
-            current_step=row['current_step'],
-            current_step_attempts=row['current_step_attempts'] or 0,
-            data=row['data'] or {},
-            created_at=row['created_at'],
-            updated_at=row['updated_at']
-        )
-
-        version = WorkflowVersion(
-            id=str(row['workflow_version_id']),
-            definition=row['definition'],
-            workflow_name=row['workflow_name']
-        )
-
-        return instance, version
+            WHERE v.id = %s
+        """, (version_id,))
+        return WorkflowVersion(id=str(row['id']), definition=row['definition'], workflow_name=row['workflow_name'])
+
+    def find_active_version_id(self, workflow_name: str) -> Optional[str]:
+        """The id of the active version of the workflow with this name, for call_workflow steps."""
+        def load():
+            row = self.fetch_one("""
+                SELECT v.id
+                FROM workflow_versions v
+                JOIN workflows w ON v.workflow_id = w.id
+                WHERE w.name = %s AND v.is_active = true
+            """, (workflow_name,))
+            return str(row['id']) if row else None
+        return self.versions.active(("call", workflow_name), load)
 
     def find_current_step_execution(self, instance_id: str, step_name: str) -> Optional[WorkflowStepExecution]:
-        row = self.fetch_one("""
-            SELECT
-                id, instance_id, step_name, status, attempts, started_at,
-                completed_at, input_data, output_data, error_details
-            FROM workflow_step_executions
-            WHERE instance_id = %s AND step_name = %s
-            ORDER BY started_at DESC
-            LIMIT 1
-        """, (instance_id, step_name))
-        return WorkflowStepExecution(**row) if row else None
+        key = (instance_id, step_name)
+        if key not in self._steps:
+            row = self.fetch_one(f"""
+                SELECT {", ".join(STEP_COLUMNS)}
+                FROM workflow_step_executions
+                WHERE instance_id = %s AND step_name = %s
+                ORDER BY started_at DESC
+                LIMIT 1
+            """, (instance_id, step_name))
+            self._steps[key] = step_from_row(instance_id, row) if row else None
+        step = self._steps[key]
+        return copy.deepcopy(step) if step else None
+
+    def find_step_executions(self, instance_id: str, step_names: List[str]) -> Dict[str, Optional[WorkflowStepExecution]]:
+        """The latest execution of each named step, loaded in one query."""
+        missing = [name for name in step_names if (instance_id, name) not in self._steps]
+        if missing:
+            rows = self.fetch_all(f"""
+                SELECT DISTINCT ON (step_name) {", ".join(STEP_COLUMNS)}
+                FROM workflow_step_executions
+                WHERE instance_id = %s AND step_name = ANY(%s)
+                ORDER BY step_name, started_at DESC
+            """, (instance_id, missing))
+            found = {row['step_name']: step_from_row(instance_id, row) for row in rows}
+            for name in missing:
+                self._steps[(instance_id, name)] = found.get(name)
+        return {name: copy.deepcopy(self._steps[(instance_id, name)]) for name in step_names}
 
     def save_instance(self, instance: WorkflowInstance) -> None:
-        self.execute("""
-            UPDATE workflow_instances SET
-                status = %s,
-                current_step = %s,
-                current_step_attempts = %s,
-                data = %s,
-                updated_at = NOW()
-            WHERE id = %s
-        """, (
-            instance.status.value,
-            instance.current_step,
-            instance.current_step_attempts,
-            json.dumps(instance.data),
-            instance.id,
-        ))
+        """Buffer the instance; `flush` saves it only if the row is still at the version it was read at."""
+        pending = self._instance_writes.get(instance.id)
+        if pending is None:
+            expected = instance.row_version
+            instance.row_version += 1
+        else:
+            expected = pending[1]
+            if instance.row_version != expected + 1:
+                raise ConcurrentUpdateError(instance.id, instance.row_version)
+
+        instance.updated_at = datetime.now(timezone.utc)
+        self._instance_writes[instance.id] = (copy.deepcopy(instance), expected)
+        if instance.id in self._instances:
+            self._instances[instance.id] = (copy.deepcopy(instance), self._instances[instance.id][1])
         log.info("Saved instance state", instance_id=instance.id, status=instance.status.value)
 
+    def add_instance(self, instance: WorkflowInstance, request_id: str = None) -> None:
+        """Buffer a new instance, e.g. a child started by a call_workflow step."""
+        self._instance_inserts.append((copy.deepcopy(instance), request_id))
+        log.info("Added new instance", instance_id=instance.id, parent_instance_id=instance.parent_instance_id)
+
     def add_step_execution(self, step: WorkflowStepExecution) -> None:
-        self.execute("""
-            INSERT INTO workflow_step_executions (id, instance_id, step_name, status,
-                attempts, started_at, input_data, request_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            step.id, step.instance_id, step.step_name, step.status.value,
-            step.attempts, step.started_at, json.dumps(step.input_data) if step.input_data else None,
-            step.request_id
-        ))
+        self._step_inserts[step.id] = copy.deepcopy(step)
+        self._steps[(step.instance_id, step.step_name)] = copy.deepcopy(step)
         log.info("Added new step execution", instance_id=step.instance_id, step=step.step_name, request_id=step.request_id)
 
     def save_step_execution(self, step: WorkflowStepExecution) -> None:
-        self.execute("""
-            UPDATE workflow_step_executions SET
-                status = %s,
-                completed_at = %s,
-                output_data = %s,
-                error_details = %s
-            WHERE id = %s
-        """, (
-            step.status.value,
-            step.completed_at,
-            json.dumps(step.output_data) if step.output_data else None,
-            step.error_details,
-            step.id
-        ))
+        if step.id in self._step_inserts:
+            # Not written yet: insert it in its final state
+            self._step_inserts[step.id] = copy.deepcopy(step)
+        else:
+            self._step_updates[step.id] = copy.deepcopy(step)
+        cached = self._steps.get((step.instance_id, step.step_name))
+        if cached is not None and cached.id == step.id:
+            self._steps[(step.instance_id, step.step_name)] = copy.deepcopy(step)
         log.info("Saved step execution state", step_execution_id=step.id, status=step.status.value)
 
     def schedule_message(self, destination: str, payload: dict, publish_at: Optional[datetime] = None, request_id: str = None) -> None:
         if publish_at is None:
             publish_at = datetime.now(timezone.utc)
 
-        self.execute("""
-            INSERT INTO outbox (destination, payload, publish_at, request_id, created_at)
-            VALUES (%s, %s, %s, %s, NOW())
-        """, (destination, json.dumps(payload), publish_at, request_id))
+        sql, params, _ = outbox.insert_statement(self.cursor, destination, payload, publish_at, request_id)
+        self._outbox.append((sql, params))
         log.info("Scheduled message for outbox", destination=destination, request_id=request_id)
 
+    def schedule_timer(self, timer_id: str, instance_id: str, fire_at: datetime, destination: str,
+                       payload: dict, request_id: str = None) -> None:
+        """Have the timer service send `payload` to `destination` at `fire_at`, replacing any timer with this id."""
+        self._timers[timer_id] = (instance_id, fire_at, destination, payload, request_id)
+        log.info("Scheduled timer", timer_id=timer_id, fire_at=fire_at.isoformat())
+
+    def cancel_timer(self, timer_id: str) -> None:
+        """Drop the timer with this id if it has not fired yet."""
+        self._timers[timer_id] = None
+        log.info("Cancelled timer", timer_id=timer_id)
+
+    def admit(self, instance_id: str, version_id: str, limit: int) -> bool:
+        """Take a running slot for the instance or queue it; runs now, not at flush, since the answer is needed."""
+        return admission.admit(self.cursor, instance_id, version_id, limit)
+
+    def release_admission(self, version_id: str) -> List[str]:
+        """Free a running slot; returns the waiting instance it went to, if any, already marked admitted."""
+        return admission.release(self.cursor, version_id)
+
+    def flush(self) -> None:
+        """Send every buffered write in one round trip.
+
+        Raises ConcurrentUpdateError if any saved instance was changed by
+        someone else since it was read; the caller rolls the transaction back.
+        """
+        checked = []
+        statements = []
+        for instance, expected in self._instance_writes.values():
+            checked.append(len(statements))
+            statements.append(("""
+                UPDATE workflow_instances SET
+                    status = %s,
+                    current_step = %s,
+                    current_step_attempts = %s,
+                    data = %s,
+                    admitted = %s,
+                    updated_at = NOW(),
+                    row_version = row_version + 1
+                WHERE id = %s AND row_version = %s
+                RETURNING id
+            """, (
+                instance.status.value,
+                instance.current_step,
+                instance.current_step_attempts,
+                json.dumps(instance.data),
+                instance.admitted,
+                instance.id,
+                expected,
+            )))
+        for instance, request_id in self._instance_inserts:
+            statements.append(("""
+                INSERT INTO workflow_instances (id, workflow_version_id, status, data, request_id,
+                    parent_instance_id, parent_step)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (
+                instance.id, instance.workflow_version_id, instance.status.value, json.dumps(instance.data),
+                request_id, instance.parent_instance_id, instance.parent_step,
+            )))
+        for step in self._step_inserts.values():
+            statements.append(("""
+                INSERT INTO workflow_step_executions (id, instance_id, step_name, status, attempts,
+                    started_at, completed_at, input_data, output_data, error_details, request_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                step.id, step.instance_id, step.step_name, step.status.value, step.attempts,
+                step.started_at, step.completed_at,
+                json.dumps(step.input_data) if step.input_data else None,
+                json.dumps(step.output_data) if step.output_data else None,
+                step.error_details, step.request_id,
+            )))
+        for step in self._step_updates.values():
+            statements.append(("""
+                UPDATE workflow_step_executions SET
+                    status = %s,
+                    completed_at = %s,
+                    output_data = %s,
+                    error_details = %s
+                WHERE id = %s
+            """, (
+                step.status.value,
+                step.completed_at,
+                json.dumps(step.output_data) if step.output_data else None,
+                step.error_details,
+                step.id,
+            )))
+        statements.extend(self._outbox)
+        for timer_id, timer in self._timers.items():
+            if timer is None:
+                statements.append(("DELETE FROM workflow_timers WHERE id = %s", (timer_id,)))
+                continue
+            instance_id, fire_at, destination, payload, request_id = timer
+            statements.append((timers.UPSERT_SQL, (timer_id, instance_id, fire_at, destination, json.dumps(payload), request_id)))
+
+        writes = list(self._instance_writes.values())
+        self._instance_writes.clear()
+        self._instance_inserts.clear()
+        self._step_inserts.clear()
+        self._step_updates.clear()
+        self._outbox.clear()
+        self._timers.clear()
+        if not statements:
+            return
+
+        ctes = ", ".join(f"w{n} AS ({sql})" for n, (sql, _) in enumerate(statements))
+        saved = " UNION ALL ".join(f"SELECT id FROM w{n}" for n in checked) or "SELECT NULL::uuid AS id WHERE FALSE"
+        params = tuple(p for _, statement_params in statements for p in statement_params)
+        self.cursor.execute(f"WITH {ctes} {saved}", params)
+
+        saved_ids = {str(row["id"]) for row in self.cursor.fetchall()}
+        for instance, expected in writes:
+            if instance.id not in saved_ids:
+                raise ConcurrentUpdateError(instance.id, expected)
+        log.info("Flushed workflow writes", statements=len(statements))
+
+    def discard(self) -> None:
+        """Forget buffered writes and everything read, e.g. after rolling back to a savepoint."""
+        self._instances.clear()
+        self._steps.clear()
+        self._instance_writes.clear()
+        self._instance_inserts.clear()
+        self._step_inserts.clear()
+        self._step_updates.clear()
+        self._outbox.clear()
+        self._timers.clear()
+
 
 class PostgresUnitOfWork(BasePostgresUnitOfWork):
 
     def _create_repositories(self, cursor):
         self._local.workflow = PostgresWorkflowRepository(cursor)
 
+    def _flush(self):
+        self._local.workflow.flush()
+
+    def _discard(self):
+        self._local.workflow.discard()
+
     @property
     def workflow(self):
         return self._local.workflow
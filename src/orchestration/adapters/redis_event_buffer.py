@@ -0,0 +1,66 @@
+import json
+from typing import Iterator, List
+
+from src.shared.logging_config import log
+from src.orchestration.domain.events import WorkflowEvent
+from src.orchestration.domain.models import EventType
+
+
+KEY_PREFIX = "events:instance:"
+
+
+def encode_event(event: WorkflowEvent) -> str:
+  return json.dumps({
+    "instance_id": event.instance_id,
+    "type": event.event_type.value,
+    "step_name": event.step_name,
+    "data": event.data,
+  }, default=str)
+
+
+def decode_event(raw) -> WorkflowEvent:
+  message = json.loads(raw)
+  return WorkflowEvent(
+    instance_id=message["instance_id"],
+    event_type=EventType(message["type"]),
+    step_name=message.get("step_name"),
+    data=message.get("data"),
+  )
+
+
+class RedisEventBuffer:
+  """Per-instance FIFO of events that arrived while another engine worker held the instance lock.
+
+  The lock holder drains the list before releasing the lock, so a burst for
+  one instance is handled in one lock acquisition instead of bouncing
+  through Celery retries. The key expires if nothing ever drains it.
+  """
+
+  def __init__(self, redis_client, ttl_seconds: int = 86400):
+    self.redis = redis_client
+    self.ttl_seconds = ttl_seconds
+
+  def park(self, event: WorkflowEvent) -> None:
+    key = KEY_PREFIX + event.instance_id
+    pipe = self.redis.pipeline()
+    pipe.rpush(key, encode_event(event))
+    pipe.expire(key, self.ttl_seconds)
+    pipe.execute()
+    log.info("Parked event for lock holder", event_type=event.event_type.value, step=event.step_name)
+
+  def take(self, instance_id: str, limit: int = 50) -> List[WorkflowEvent]:
+    raw = self.redis.lpop(KEY_PREFIX + instance_id, limit)
+    return [decode_event(r) for r in raw or []]
+
+  def restore(self, instance_id: str, events: List[WorkflowEvent]) -> None:
+    """Put taken events back at the head, in their original order."""
+    if events:
+      self.redis.lpush(KEY_PREFIX + instance_id, *[encode_event(e) for e in reversed(events)])
+
+  def pending(self, instance_id: str) -> int:
+    return self.redis.llen(KEY_PREFIX + instance_id)
+
+  def parked_instances(self) -> Iterator[str]:
+    for key in self.redis.scan_iter(match=KEY_PREFIX + "*", count=500):
+      key = key.decode() if isinstance(key, bytes) else key
+      yield key[len(KEY_PREFIX):]
@@ -1,5 +1,11 @@
+import os
+
 from src.shared.logging_config import log
 
+# "lock" serializes an instance's events with a Redis lock; "optimistic" relies on row_version alone
+ORCHESTRATION_CONCURRENCY = os.getenv("ORCHESTRATION_CONCURRENCY", "lock").lower()
+CONCURRENCY_MODES = ("lock", "optimistic")
+
 
 class RedisLockService:
   def __init__(self, redis_client):
@@ -32,3 +38,24 @@ class RedisLockService:
         log.warning("No lock to release", lock_key=key)
     except Exception:
       log.warning("Lock release failed", lock_key=key, exc_info=True)
+
+
+class NoopLockService:
+  """Lock service for deployments where something else keeps an instance's events apart.
+
+  Either the consumer owns the instance's queue partition, or saves are
+  compare-and-swap on row_version and a conflicting event is re-applied.
+  """
+
+  def acquire_lock(self, key: str, timeout: int) -> bool:
+    return True
+
+  def release_lock(self, key: str) -> None:
+    pass
+
+
+def make_lock_service(redis_client, mode: str = ORCHESTRATION_CONCURRENCY):
+  """The lock service for the ORCHESTRATION_CONCURRENCY mode; an unknown mode is refused at startup."""
+  if mode not in CONCURRENCY_MODES:
+    raise ValueError(f"ORCHESTRATION_CONCURRENCY must be one of {', '.join(CONCURRENCY_MODES)}, not '{mode}'")
+  return NoopLockService() if mode == "optimistic" else RedisLockService(redis_client)
@@ -0,0 +1,67 @@
+import time
+from typing import List, Optional, Set
+
+from src.shared.logging_config import log
+from src.shared.partitioning import assign_shards
+
+
+MEMBERS_KEY = "engine:partition_members"
+
+
+class RedisPartitionCoordinator:
+  """Spreads the orchestration queue partitions over the live engine consumers.
+
+  Members heartbeat into a sorted set scored by lease expiry and each one
+  takes its rendezvous-hash share of the partitions. Ownership here only
+  balances the load: `x-single-active-consumer` on every partition queue is
+  what stops a second consumer from receiving while the previous owner is
+  still attached, so members that briefly disagree cost balance, not safety.
+  """
+
+  def __init__(self, redis_client, member_id: str, partitions: int,
+               lease_seconds: int = 15, heartbeat_seconds: float = 5):
+    self.redis = redis_client
+    self.member_id = member_id
+    self.partitions = partitions
+    self.lease_seconds = lease_seconds
+    self.heartbeat_seconds = heartbeat_seconds
+    self.owned: Set[int] = set()
+    self._last_run = None
+
+  def run_if_due(self) -> Optional[Set[int]]:
+    """The partitions this member should consume, or None if it is not time to look again."""
+    now = time.monotonic()
+    if self._last_run is not None and now - self._last_run < self.heartbeat_seconds:
+      return None
+    self._last_run = now
+    try:
+      members = self.heartbeat()
+    except Exception:
+      # Keep consuming what we have; the broker still keeps each partition to one consumer
+      log.error("Partition heartbeat failed; keeping current partitions.", exc_info=True)
+      return None
+
+    owned = assign_shards(members, self.partitions).get(self.member_id, set())
+    if owned != self.owned:
+      log.info("Engine partition ownership changed", member_id=self.member_id,
+               owned=len(owned), members=len(members))
+    self.owned = owned
+    return owned
+
+  def heartbeat(self) -> List[str]:
+    """Renew this member's lease and return the live members."""
+    now = time.time()
+    pipe = self.redis.pipeline()
+    pipe.zadd(MEMBERS_KEY, {self.member_id: now + self.lease_seconds})
+    pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now)
+    pipe.zrange(MEMBERS_KEY, 0, -1)
+    members = pipe.execute()[-1]
+    return sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+  def leave(self) -> None:
+    try:
+      self.redis.zrem(MEMBERS_KEY, self.member_id)
+    except Exception:
+      log.warning("Failed to leave engine partition membership", exc_info=True)
+    self.owned = set()
+
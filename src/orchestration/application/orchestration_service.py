@@ -1,10 +1,16 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import List, Optional
+import copy
+import json
 import uuid
 import structlog
 
 from src.shared.logging_config import log
 from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
+from src.shared.timers import DELAY, RETRY, WAIT_TIMEOUT, timer_id
+from src.shared.cancellations import CancelledInstances
+from src.shared.event_types import child_result_payload
+from src.shared.action_limits import ActionLimiter
 from src.shared.metrics import (
     workflow_started_total,
     workflow_completed_total,
@@ -12,65 +18,242 @@ from src.shared.metrics import (
     step_execution_total,
     step_retry_total,
     step_duration_seconds,
-    workflow_errors_total
+    workflow_errors_total,
+    actions_deferred_total,
+    workflow_admission_queued_total
 )
 
-from src.orchestration.domain.models import EventType, RetryPolicy, WorkflowVersion, WorkflowStatus, WorkflowInstance, WorkflowStepExecution, StepExecutionStatus
+from src.orchestration.domain.models import EventType, WorkflowVersion, WorkflowStatus, WorkflowInstance, WorkflowStepExecution, StepExecutionStatus
 from src.orchestration.domain.events import WorkflowEvent
+from src.orchestration.domain.exceptions import ConcurrentUpdateError
+from src.orchestration.domain.plan import PlanStep, StepKind, item_step_name
 from src.orchestration.adapters.postgres_unit_of_work import PostgresUnitOfWork
 from src.orchestration.adapters.redis_lock import RedisLockService
+from src.orchestration.adapters.redis_event_buffer import RedisEventBuffer
+from src.worker.models import ActionResult, ActionStatus
 
 
 class OrchestrationService:
   LOCK_TIMEOUT = 30
+  # Inline actions run per event before the next one is handed to a worker, so a loop of them still ends
+  MAX_INLINE_STEPS = 50
+  # Re-reads after a row_version conflict before giving up with a RetryableError
+  MAX_CONFLICT_RETRIES = 5
 
-  def __init__(self, uow: PostgresUnitOfWork, lock_service: RedisLockService):
+  def __init__(self, uow: PostgresUnitOfWork, lock_service: RedisLockService, event_buffer: RedisEventBuffer = None,
+               inline_handlers: dict = None, cancellations: CancelledInstances = None, limiter: ActionLimiter = None):
     self.uow = uow
     self.lock_service = lock_service
+    self.event_buffer = event_buffer
+    self.inline_handlers = inline_handlers or {}
+    self.cancellations = cancellations
+    self.limiter = limiter
+    self._inline_steps = 0
 
   def process_event(self, event: WorkflowEvent) -> None:
+    if event.instance_id in self._cancelled([event.instance_id]):
+      log.info("Dropping event for cancelled instance", instance_id=event.instance_id, event_type=event.event_type.value)
+      return
+
     lock_key = f"lock:instance:{event.instance_id}"
-    
-    if not self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+
+    if self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+      self._drain_under_lock(event.instance_id, lock_key, [event])
+      return
+
+    if self.event_buffer is None:
       raise RetryableError("Could not acquire lock")
 
+    # Hand the event to the lock holder instead of retrying the task later
+    self.event_buffer.park(event)
+    # The holder may have released between our attempt and the park; whoever gets the lock drains
+    if self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+      self._drain_under_lock(event.instance_id, lock_key, [])
+
+  def drain_parked(self, instance_id: str) -> None:
+    """Process events left parked for an instance whose lock holder went away before draining them."""
+    lock_key = f"lock:instance:{instance_id}"
+    if self.event_buffer is not None and self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+      self._drain_under_lock(instance_id, lock_key, [])
+
+  def process_batch(self, events: List[WorkflowEvent]) -> List[Optional[Exception]]:
+    """Apply events for many instances in one transaction and return each event's error, or None.
+
+    Every instance runs inside its own savepoint, so a failing instance is
+    rolled back alone and the rest still commit together. If the
+    transaction itself fails, every event of a locked instance reports that
+    error.
+    """
+    results: List[Optional[Exception]] = [None] * len(events)
+    by_instance = {}
+    for index, event in enumerate(events):
+      by_instance.setdefault(event.instance_id, []).append(index)
+
+    # Dropped without a lock or a transaction; they report success like any event for a terminal instance
+    cancelled = self._cancelled(by_instance)
+    if cancelled:
+      log.info("Dropping events for cancelled instances", instances=len(cancelled))
+
+    locked = {}
+    for instance_id, indices in by_instance.items():
+      if instance_id in cancelled:
+        continue
+      lock_key = f"lock:instance:{instance_id}"
+      if self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+        locked[instance_id] = (lock_key, indices)
+      elif self.event_buffer is None:
+        for i in indices:
+          results[i] = RetryableError("Could not acquire lock")
+      else:
+        # Parked events are the lock holder's now; they report success here like in process_event
+        for i in indices:
+          self.event_buffer.park(events[i])
+        if self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+          locked[instance_id] = (lock_key, [])
+
+    if not locked:
+      return results
+
+    applied = {}
     try:
-      self._handle_event(event)
+      with self.uow:
+        for instance_id, (_, indices) in locked.items():
+          parked = self.event_buffer.take(instance_id) if self.event_buffer else []
+          batch = [events[i] for i in indices] + parked
+          try:
+            self._retry_on_conflict(lambda: self._apply_in_savepoint(batch))
+          except Exception as e:
+            log.warning("Instance failed within batch; rolled back alone", instance_id=instance_id, exc_info=True)
+            if parked and not isinstance(e, NonRetryableError):
+              self.event_buffer.restore(instance_id, parked)
+            for i in indices:
+              results[i] = e
+          else:
+            applied[instance_id] = parked
+    except Exception as e:
+      log.error("Batch commit failed", instances=len(locked), exc_info=True)
+      for instance_id, parked in applied.items():
+        if parked:
+          self.event_buffer.restore(instance_id, parked)
+      for _, indices in locked.values():
+        for i in indices:
+          results[i] = results[i] or e
+      applied = {}
     finally:
-      self.lock_service.release_lock(lock_key)
+      for lock_key, _ in locked.values():
+        self.lock_service.release_lock(lock_key)
+
+    # Events parked while we held the locks; failed instances are left to their retries and the sweeper
+    for instance_id in applied if self.event_buffer is not None else []:
+      if self.event_buffer.pending(instance_id):
+        try:
+          self.drain_parked(instance_id)
+        except Exception:
+          log.warning("Draining parked events after batch failed", instance_id=instance_id, exc_info=True)
+    return results
+
+  def _cancelled(self, instance_ids) -> set:
+    return self.cancellations.cancelled(instance_ids) if self.cancellations is not None else set()
+
+  def _drain_under_lock(self, instance_id: str, lock_key: str, events: List[WorkflowEvent]) -> None:
+    while True:
+      try:
+        while True:
+          parked = self.event_buffer.take(instance_id) if self.event_buffer else []
+          if not events and not parked:
+            break
+          try:
+            self._handle_events(events + parked)
+          except NonRetryableError:
+            if parked:
+              log.error("Dropping parked events for unprocessable instance", instance_id=instance_id, count=len(parked))
+            raise
+          except Exception:
+            # Taken events are no longer in the broker; put them back for the next holder
+            if parked:
+              self.event_buffer.restore(instance_id, parked)
+            raise
+          events = []
+      finally:
+        self.lock_service.release_lock(lock_key)
+
+      # An event parked after our last take but before the release would otherwise wait for the next one
+      if self.event_buffer is None or not self.event_buffer.pending(instance_id):
+        return
+      if not self.lock_service.acquire_lock(lock_key, self.LOCK_TIMEOUT):
+        return
 
+  def _handle_events(self, events: List[WorkflowEvent]) -> None:
+    """Apply all of an instance's pending events in one transaction."""
+    self._retry_on_conflict(lambda: self._apply_in_transaction(events))
 
-  def _handle_event(self, event: WorkflowEvent) -> None:
+  def _apply_in_transaction(self, events: List[WorkflowEvent]) -> None:
     with self.uow:
-      result = self.uow.workflow.find_instance(event.instance_id)
-      if not result:
-        raise NonRetryableError("Instance not found")
-      
-      instance, version = result
-
-      # Guard: ignore events for terminal instances
-      if instance.status in (WorkflowStatus.COMPLETED, WorkflowStatus.FAILED, WorkflowStatus.CANCELLED):
-        log.warning("Ignoring event for terminal instance", instance_id=instance.id, status=instance.status.value)
+      self._apply_events(events)
+
+  def _apply_in_savepoint(self, events: List[WorkflowEvent]) -> None:
+    with self.uow.savepoint():
+      self._apply_events(events)
+
+  def _retry_on_conflict(self, apply) -> None:
+    """Run `apply` again from a fresh read whenever another writer saved the instance first."""
+    for attempt in range(1, self.MAX_CONFLICT_RETRIES + 1):
+      try:
+        apply()
         return
+      except ConcurrentUpdateError as e:
+        if attempt == self.MAX_CONFLICT_RETRIES:
+          raise RetryableError(str(e)) from e
+        log.info("Instance changed concurrently; re-reading", instance_id=e.instance_id, attempt=attempt)
+
+  def _apply_events(self, events: List[WorkflowEvent]) -> None:
+    """Apply events in order, dropping exact duplicates."""
+    seen = set()
+    for event in events:
+      key = (event.event_type, event.step_name, json.dumps(event.data, sort_keys=True, default=str))
+      if key in seen:
+        log.info("Coalesced duplicate event", event_type=event.event_type.value, step=event.step_name)
+        continue
+      seen.add(key)
+      self._apply_event(event)
+
+  def _apply_event(self, event: WorkflowEvent) -> None:
+    self._inline_steps = 0
+    result = self.uow.workflow.find_instance(event.instance_id)
+    if not result:
+      raise NonRetryableError("Instance not found")
+
+    instance, version = result
+
+    # Guard: ignore events for terminal instances
+    if instance.status in (WorkflowStatus.COMPLETED, WorkflowStatus.FAILED, WorkflowStatus.CANCELLED):
+      log.warning("Ignoring event for terminal instance", instance_id=instance.id, status=instance.status.value)
+      return
 
-      if event.event_type == EventType.STEP_FAILED:
-        self._handle_step_failure(instance, version, event)
-      
-      elif event.event_type == EventType.START_WORKFLOW:
-        self._handle_workflow_start(instance, version)
-      
-      elif event.event_type == EventType.STEP_COMPLETE:
-        self._handle_step_completion(instance, version, event)
+    if event.event_type == EventType.STEP_FAILED:
+      self._handle_step_failure(instance, version, event)
+
+    elif event.event_type == EventType.START_WORKFLOW:
+      self._handle_workflow_start(instance, version)
+
+    elif event.event_type == EventType.STEP_COMPLETE:
+      self._handle_step_completion(instance, version, event)
 
 
   def _handle_step_failure(self, instance: WorkflowInstance, version: WorkflowVersion, event: WorkflowEvent) -> None:
+    if self._route_to_fan_out(instance, version, event):
+      return
+
     if instance.current_step != event.step_name:
       log.warning("Ignoring stale step failure event",
         expected_step=instance.current_step, received_step=event.step_name)
       return
 
-    step_def = version.get_step_definition(event.step_name)
-    retry_policy = RetryPolicy.from_dict(step_def.get("retry", {}))
+    step = self._plan_step(version, event.step_name)
+    if step.kind == StepKind.CALL:
+      self._handle_child_result(instance, version, step, event)
+      return
+    retry_policy = step.retry
 
     step_execution = self.uow.workflow.find_current_step_execution(instance.id, event.step_name)
     if not step_execution:
@@ -85,35 +268,14 @@ class OrchestrationService:
       # Record retry metric
       step_retry_total.labels(workflow_name=version.workflow_name, step_name=event.step_name).inc()
 
-      publish_time = datetime.now(timezone.utc) + timedelta(seconds=retry_policy.delay_seconds)
-      action_id = step_def.get('action_id', event.step_name)
-      config = step_def.get('config', {})
-      request_id = structlog.contextvars.get_contextvars().get("request_id")
-      payload = {
-        "action": action_id,
-        "step_name": event.step_name,
-        "instance_id": instance.id,
-        "config": config,
-      }
-      connection_id = step_def.get('connection_id')
-      if connection_id:
-        payload["connection_id"] = connection_id
-      self.uow.workflow.schedule_message(ACTIONS_QUEUE, payload, publish_time, request_id)
+      self._dispatch_action(instance.id, step, retry_policy.delay_seconds)
     else:
       log.error("Step failed permanently", step=event.step_name)
-      instance.status = WorkflowStatus.FAILED
-      self.uow.workflow.save_instance(instance)
-
-      # Record workflow failure metrics
-      duration = (datetime.now(timezone.utc) - instance.created_at).total_seconds()
-      workflow_completed_total.labels(workflow_name=version.workflow_name, status="failed").inc()
-      workflow_duration_seconds.labels(workflow_name=version.workflow_name, status="failed").observe(duration)
-      workflow_errors_total.labels(workflow_name=version.workflow_name, error_type="step_failure").inc()
-
       step_execution.status = StepExecutionStatus.FAILED
       step_execution.completed_at = datetime.now(timezone.utc)
       step_execution.error_details = str(event.data.get("error", "Unknown error"))
       self.uow.workflow.save_step_execution(step_execution)
+      self._fail_workflow(instance, version)
 
 
   def _handle_workflow_start(self, instance: WorkflowInstance, version: WorkflowVersion) -> None:
@@ -121,22 +283,41 @@ class OrchestrationService:
       log.warning("Workflow already started", instance_id=instance.id, status=instance.status.value)
       return
     
-    start_step_name = version.get_start_step()
-    self._transition_to_step(instance, version, start_step_name)
+    plan = version.plan(self.inline_handlers)
+    if plan.max_concurrent_instances and not instance.admitted:
+      if not self.uow.workflow.admit(instance.id, version.id, plan.max_concurrent_instances):
+        # Stays pending; a finishing instance hands it its slot and a new START_WORKFLOW
+        log.info("Instance queued for admission", instance_id=instance.id,
+                 max_concurrent_instances=plan.max_concurrent_instances)
+        workflow_admission_queued_total.labels(workflow_name=version.workflow_name).inc()
+        return
+      instance.admitted = True
+    self._transition_to_step(instance, version, plan.start_at)
 
 
   def _handle_step_completion(self, instance: WorkflowInstance, version: WorkflowVersion, event: WorkflowEvent) -> None:
+    if self._route_to_fan_out(instance, version, event):
+      return
+
     if instance.current_step != event.step_name:
       log.warning("Ignoring stale step completion event",
         expected_step=instance.current_step, received_step=event.step_name)
       return
 
-    self._complete_current_step(instance, event.step_name, event.data)
+    step = self._plan_step(version, event.step_name)
+    if step.kind == StepKind.CALL:
+      self._handle_child_result(instance, version, step, event)
+      return
+    if step.kind == StepKind.WAIT and step.timeout_seconds:
+      # The event made it in time
+      self.uow.workflow.cancel_timer(timer_id(instance.id, WAIT_TIMEOUT, step.name))
+
+    self._complete_current_step(instance, version, event.step_name, event.data)
     
-    next_step_name = version.get_next_step(instance.current_step)
+    next_step_name = self._plan_step(version, instance.current_step).next
     self._transition_to_step(instance, version, next_step_name)
 
-  def _complete_current_step(self, instance: WorkflowInstance, step_name: str, result_data: Optional[dict]):
+  def _complete_current_step(self, instance: WorkflowInstance, version: WorkflowVersion, step_name: str, result_data: Optional[dict]):
     step_execution = self.uow.workflow.find_current_step_execution(instance.id, step_name)
     if step_execution:
       step_execution.status = StepExecutionStatus.COMPLETED
@@ -145,45 +326,52 @@ class OrchestrationService:
       self.uow.workflow.save_step_execution(step_execution)
 
       # Record step execution metrics
-      version_result = self.uow.workflow.find_instance(instance.id)
-      if version_result:
-        _, version = version_result
-        duration = (step_execution.completed_at - step_execution.started_at).total_seconds()
-        step_execution_total.labels(
-          workflow_name=version.workflow_name,
-          step_name=step_name,
-          status="completed"
-        ).inc()
-        step_duration_seconds.labels(
-          workflow_name=version.workflow_name,
-          step_name=step_name,
-          action_type="unknown"  # Could be extracted from step definition
-        ).observe(duration)
+      duration = (step_execution.completed_at - step_execution.started_at).total_seconds()
+      step_execution_total.labels(
+        workflow_name=version.workflow_name,
+        step_name=step_name,
+        status="completed"
+      ).inc()
+      step_duration_seconds.labels(
+        workflow_name=version.workflow_name,
+        step_name=step_name,
+        action_type="unknown"  # Could be extracted from step definition
+      ).observe(duration)
 
     # Merge data into the main instance
     if result_data:
       instance.data.update(result_data)
 
+  def _plan_step(self, version: WorkflowVersion, step_name: str) -> PlanStep:
+    step = version.plan(self.inline_handlers).step(step_name)
+    if step is None:
+      # Definitions saved before the static checks existed can still point nowhere
+      raise NonRetryableError(f"Step '{step_name}' is not defined in workflow '{version.workflow_name}'")
+    return step
+
   def _transition_to_step(self, instance: WorkflowInstance, version: WorkflowVersion, step_name: Optional[str]) -> None:
     if not step_name or step_name == "end":
       log.info("Workflow completed successfully", instance_id=instance.id)
       instance.status = WorkflowStatus.COMPLETED
       instance.current_step = None
+      self._release_slot(instance, version)
       self.uow.workflow.save_instance(instance)
 
       # Record workflow completion metrics
       duration = (datetime.now(timezone.utc) - instance.created_at).total_seconds()
       workflow_completed_total.labels(workflow_name=version.workflow_name, status="completed").inc()
       workflow_duration_seconds.labels(workflow_name=version.workflow_name, status="completed").observe(duration)
+      self._notify_parent(instance)
       return
     
+    step = self._plan_step(version, step_name)
     instance.status = WorkflowStatus.RUNNING
     instance.current_step = step_name
     instance.current_step_attempts = 1
     self.uow.workflow.save_instance(instance)
 
     # Record workflow started metric (only on first step)
-    if instance.current_step == version.definition.get("start_at"):
+    if instance.current_step == version.plan(self.inline_handlers).start_at:
       workflow_started_total.labels(workflow_name=version.workflow_name).inc()
 
     # Create new step execution
@@ -200,39 +388,407 @@ class OrchestrationService:
     )
     self.uow.workflow.add_step_execution(new_step_execution)
 
-    step_def = version.get_step_definition(step_name)
+    if step.kind == StepKind.DELAY:
+      self._handle_delay_step(instance.id, step)
+      return
+
+    if step.kind == StepKind.BRANCH:
+      self._handle_branch_step(instance, version, step)
+      return
 
-    # Handle system steps
-    if step_def.get('type') == 'delay' or 'duration_seconds' in step_def:
-      self._handle_delay_step(instance.id, step_name, step_def)
+    if step.kind == StepKind.WAIT:
+      self._handle_wait_step(instance, step)
       return
 
-    if step_def.get('type') == 'branch':
-      self._handle_branch_step(instance, version, step_name, step_def)
+    if step.kind == StepKind.PARALLEL:
+      self._start_parallel(instance, step)
       return
 
-    if step_def.get('type') == 'wait_for_event':
-      self._handle_wait_step(instance, step_name, step_def)
+    if step.kind == StepKind.MAP:
+      self._start_map(instance, version, step)
       return
 
-    # Dispatch action to worker
+    if step.kind == StepKind.CALL:
+      self._start_child(instance, version, step)
+      return
+
+    if step.kind == StepKind.INLINE and self._inline_steps < self.MAX_INLINE_STEPS:
+      self._inline_steps += 1
+      self._run_inline_action(instance, version, step)
+      return
+
+    self._dispatch_action(instance.id, step)
+
+  def _dispatch_action(self, instance_id: str, step: PlanStep, delay_seconds: float = 0,
+                       step_name: str = None, extra: dict = None) -> None:
     request_id = structlog.contextvars.get_contextvars().get("request_id")
-    action_id = step_def.get('action_id', step_name)
-    config = step_def.get('config', {})
     payload = {
-      "action": action_id,
-      "step_name": step_name,
-      "instance_id": instance.id,
-      "config": config,
+      "action": step.action_id or step.name,
+      "step_name": step_name or step.name,
+      "instance_id": instance_id,
+      "config": step.config,
     }
-    connection_id = step_def.get('connection_id')
-    if connection_id:
-      payload["connection_id"] = connection_id
-    publish_time = datetime.now(timezone.utc)
-    self.uow.workflow.schedule_message(ACTIONS_QUEUE, payload, publish_time, request_id)
-
-  def _handle_delay_step(self, instance_id: str, step_name: str, step_def: dict) -> None:
-    duration = int(step_def.get("duration_seconds", 60))
+    if step.connection_id:
+      payload["connection_id"] = step.connection_id
+    if extra:
+      payload.update(extra)
+    if delay_seconds <= 0 and self.limiter is not None:
+      # Already over its limits: wait on a timer instead of taking a worker slot to find out
+      delay_seconds = self.limiter.delay(self.limiter.limits_for(payload["action"], step.connection_id, step.config))
+      if delay_seconds > 0:
+        actions_deferred_total.labels(action=payload["action"], deferred_by="engine").inc()
+    if delay_seconds > 0:
+      # Backoffs wait in the timer table; the outbox only gets messages that are due
+      fire_at = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+      self.uow.workflow.schedule_timer(timer_id(instance_id, RETRY, payload["step_name"]), instance_id, fire_at,
+                                       ACTIONS_QUEUE, payload, request_id)
+    else:
+      self.uow.workflow.schedule_message(ACTIONS_QUEUE, payload, None, request_id)
+
+  def _run_inline_action(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep) -> None:
+    """Run an inline-safe action in this transaction and move on, as if the worker had reported back."""
+    step_name = step.name
+    log.info("Running action inline", action=step.action_id, step=step_name, instance_id=instance.id)
+    try:
+      handler = self.inline_handlers[step.action_id]
+      result = handler.execute(instance.id, copy.deepcopy(instance.data), config=copy.deepcopy(step.config))
+    except Exception as e:
+      log.error("Inline action raised exception", action=step.action_id, error=str(e), exc_info=True)
+      result = ActionResult(status=ActionStatus.FAILURE, error_message=str(e))
+
+    if result.status != ActionStatus.SUCCESS:
+      # Retries go through the worker like any other action
+      failure = WorkflowEvent(instance.id, EventType.STEP_FAILED, step_name, {"error": result.error_message})
+      self._handle_step_failure(instance, version, failure)
+      return
+
+    self._complete_current_step(instance, version, step_name, result.updated_data)
+    self._transition_to_step(instance, version, step.next)
+
+  def _start_parallel(self, instance: WorkflowInstance, step: PlanStep) -> None:
+    """Dispatch every branch at once; each gets its own step execution, named "<step>.<branch>"."""
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
+    if step_execution:
+      step_execution.status = StepExecutionStatus.RUNNING
+      self.uow.workflow.save_step_execution(step_execution)
+
+    request_id = structlog.contextvars.get_contextvars().get("request_id")
+    now = datetime.now(timezone.utc)
+    for branch in step.branches.values():
+      self.uow.workflow.add_step_execution(WorkflowStepExecution(
+        id=str(uuid.uuid4()),
+        instance_id=instance.id,
+        step_name=branch.name,
+        status=StepExecutionStatus.PENDING,
+        attempts=1,
+        started_at=now,
+        input_data=instance.data,
+        request_id=request_id,
+      ))
+      self._dispatch_action(instance.id, branch)
+    log.info("Started parallel branches", step=step.name, branches=len(step.branches), join=step.join)
+
+  def _route_to_fan_out(self, instance: WorkflowInstance, version: WorkflowVersion, event: WorkflowEvent) -> bool:
+    """Hand a result for a parallel branch or map item of the current step to its handler."""
+    if not instance.current_step or not event.step_name or event.step_name == instance.current_step:
+      return False
+    plan = version.plan(self.inline_handlers)
+    branch = plan.branch(instance.current_step, event.step_name)
+    if branch is not None:
+      self._handle_branch_result(instance, version, branch, event)
+      return True
+    index = plan.map_item(instance.current_step, event.step_name)
+    if index is not None:
+      self._handle_item_result(instance, version, plan.step(instance.current_step), index, event)
+      return True
+    return False
+
+  def _handle_branch_result(self, instance: WorkflowInstance, version: WorkflowVersion, branch: PlanStep,
+                            event: WorkflowEvent) -> None:
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, branch.name)
+    if not step_execution or step_execution.status in (StepExecutionStatus.COMPLETED, StepExecutionStatus.FAILED):
+      log.warning("Ignoring result for settled branch", step=branch.name, event_type=event.event_type.value)
+      return
+
+    if event.event_type == EventType.STEP_COMPLETE:
+      step_execution.status = StepExecutionStatus.COMPLETED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.output_data = event.data
+      self.uow.workflow.save_step_execution(step_execution)
+      step_execution_total.labels(workflow_name=version.workflow_name, step_name=branch.name, status="completed").inc()
+
+      # Workers report the whole data dict; keep only what this branch changed so branches don't undo each other
+      started_with = step_execution.input_data or {}
+      for key, value in (event.data or {}).items():
+        if key not in started_with or started_with[key] != value:
+          instance.data[key] = value
+
+    elif step_execution.attempts < branch.retry.max_attempts:
+      log.info("Scheduling branch retry", step=branch.name, attempts=step_execution.attempts + 1)
+      step_execution.attempts += 1
+      self.uow.workflow.save_step_execution(step_execution)
+      # Saved even though nothing changed, so concurrent results for this instance still conflict
+      self.uow.workflow.save_instance(instance)
+      step_retry_total.labels(workflow_name=version.workflow_name, step_name=branch.name).inc()
+      self._dispatch_action(instance.id, branch, branch.retry.delay_seconds)
+      return
+
+    else:
+      log.error("Branch failed permanently", step=branch.name)
+      step_execution.status = StepExecutionStatus.FAILED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.error_details = str((event.data or {}).get("error", "Unknown error"))
+      self.uow.workflow.save_step_execution(step_execution)
+
+    self._join_parallel(instance, version, self._plan_step(version, instance.current_step))
+
+  def _join_parallel(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep) -> None:
+    names = [branch.name for branch in step.branches.values()]
+    executions = self.uow.workflow.find_step_executions(instance.id, names)
+    statuses = {name: (e.status.value if e else None) for name, e in executions.items()}
+    completed = sum(1 for status in statuses.values() if status == StepExecutionStatus.COMPLETED.value)
+    failed = sum(1 for status in statuses.values() if status == StepExecutionStatus.FAILED.value)
+
+    if completed < step.join and failed <= len(names) - step.join:
+      # Still waiting; the save orders this result against the other branches'
+      self.uow.workflow.save_instance(instance)
+      return
+
+    joined = completed >= step.join
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
+    if step_execution:
+      step_execution.status = StepExecutionStatus.COMPLETED if joined else StepExecutionStatus.FAILED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.output_data = {"branches": statuses}
+      if not joined:
+        step_execution.error_details = f"{failed} of {len(names)} branches failed; {step.join} needed to complete"
+      self.uow.workflow.save_step_execution(step_execution)
+    log.info("Parallel step joined" if joined else "Parallel step failed", step=step.name,
+             completed=completed, failed=failed, required=step.join)
+
+    if joined:
+      # Branches still running under "any" or N-of-M finish on their own; their results are ignored as stale
+      self._transition_to_step(instance, version, step.next)
+      return
+
+    self._fail_workflow(instance, version)
+
+  def _start_map(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep) -> None:
+    """Dispatch the first `max_concurrency` items; each settled item lets the next one go."""
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
+    items = step.items(instance.data)
+    if not isinstance(items, list):
+      log.error("Map items are not a list", step=step.name, items=step.items_path)
+      step_execution.status = StepExecutionStatus.FAILED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.error_details = f"'{step.items_path}' is not a list"
+      self.uow.workflow.save_step_execution(step_execution)
+      self._fail_workflow(instance, version)
+      return
+
+    # Progress lives on the map step's own execution, so a result costs the same however long the list is
+    progress = {"total": len(items), "dispatched": 0, "completed": 0, "failed": 0}
+    step_execution.status = StepExecutionStatus.RUNNING
+    log.info("Started map step", step=step.name, items=len(items), max_concurrency=step.max_concurrency)
+    self._advance_map(instance, version, step, step_execution, progress, items)
+
+  def _handle_item_result(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep, index: int,
+                          event: WorkflowEvent) -> None:
+    item_name = item_step_name(step.name, index)
+    item_execution = self.uow.workflow.find_current_step_execution(instance.id, item_name)
+    if not item_execution or item_execution.status in (StepExecutionStatus.COMPLETED, StepExecutionStatus.FAILED):
+      log.warning("Ignoring result for settled map item", step=item_name, event_type=event.event_type.value)
+      return
+
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
+    progress = dict(step_execution.output_data or {})
+    items = step.items(instance.data)
+
+    if event.event_type == EventType.STEP_COMPLETE:
+      item_execution.status = StepExecutionStatus.COMPLETED
+      # Workers report the whole data dict; the item's result is what its action changed
+      item_execution.output_data = {
+        key: value for key, value in (event.data or {}).items()
+        if key not in ("item", "item_index") and (key not in instance.data or instance.data[key] != value)
+      }
+      progress["completed"] += 1
+    elif item_execution.attempts < step.item_action.retry.max_attempts:
+      log.info("Scheduling map item retry", step=item_name, attempts=item_execution.attempts + 1)
+      item_execution.attempts += 1
+      self.uow.workflow.save_step_execution(item_execution)
+      self.uow.workflow.save_instance(instance)
+      step_retry_total.labels(workflow_name=version.workflow_name, step_name=step.name).inc()
+      self._dispatch_item(instance.id, step, index, items, step.item_action.retry.delay_seconds)
+      return
+    else:
+      log.error("Map item failed permanently", step=item_name)
+      item_execution.status = StepExecutionStatus.FAILED
+      item_execution.error_details = str((event.data or {}).get("error", "Unknown error"))
+      progress["failed"] += 1
+    item_execution.completed_at = datetime.now(timezone.utc)
+    self.uow.workflow.save_step_execution(item_execution)
+
+    if progress["failed"] > step.max_failures:
+      step_execution.status = StepExecutionStatus.FAILED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.output_data = progress
+      step_execution.error_details = f"{progress['failed']} items failed; at most {step.max_failures} allowed"
+      self.uow.workflow.save_step_execution(step_execution)
+      log.info("Map step failed", step=step.name, **progress)
+      self._fail_workflow(instance, version)
+      return
+
+    self._advance_map(instance, version, step, step_execution, progress, items)
+
+  def _advance_map(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep,
+                   step_execution: WorkflowStepExecution, progress: dict, items) -> None:
+    settled = progress["completed"] + progress["failed"]
+    if settled == progress["total"]:
+      names = [item_step_name(step.name, i) for i in range(progress["total"])]
+      executions = self.uow.workflow.find_step_executions(instance.id, names)
+      instance.data[step.result_key] = [
+        e.output_data if e and e.status == StepExecutionStatus.COMPLETED else None
+        for e in (executions[name] for name in names)
+      ]
+      step_execution.status = StepExecutionStatus.COMPLETED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.output_data = progress
+      self.uow.workflow.save_step_execution(step_execution)
+      log.info("Map step completed", step=step.name, **progress)
+      self._transition_to_step(instance, version, step.next)
+      return
+
+    request_id = structlog.contextvars.get_contextvars().get("request_id")
+    now = datetime.now(timezone.utc)
+    while progress["dispatched"] < progress["total"] and progress["dispatched"] - settled < step.max_concurrency:
+      index = progress["dispatched"]
+      self.uow.workflow.add_step_execution(WorkflowStepExecution(
+        id=str(uuid.uuid4()),
+        instance_id=instance.id,
+        step_name=item_step_name(step.name, index),
+        status=StepExecutionStatus.PENDING,
+        attempts=1,
+        started_at=now,
+        input_data={"item": items[index] if index < len(items) else None, "item_index": index},
+        request_id=request_id,
+      ))
+      self._dispatch_item(instance.id, step, index, items)
+      progress["dispatched"] += 1
+
+    step_execution.output_data = progress
+    self.uow.workflow.save_step_execution(step_execution)
+    # Saved even when only progress moved, so results for this instance are applied one at a time
+    self.uow.workflow.save_instance(instance)
+
+  def _dispatch_item(self, instance_id: str, step: PlanStep, index: int, items, delay_seconds: float = 0) -> None:
+    item = items[index] if isinstance(items, list) and index < len(items) else None
+    self._dispatch_action(instance_id, step.item_action, delay_seconds,
+                          step_name=item_step_name(step.name, index), extra={"item": item, "item_index": index})
+
+  def _fail_workflow(self, instance: WorkflowInstance, version: WorkflowVersion) -> None:
+    instance.status = WorkflowStatus.FAILED
+    self._release_slot(instance, version)
+    self.uow.workflow.save_instance(instance)
+    duration = (datetime.now(timezone.utc) - instance.created_at).total_seconds()
+    workflow_completed_total.labels(workflow_name=version.workflow_name, status="failed").inc()
+    workflow_duration_seconds.labels(workflow_name=version.workflow_name, status="failed").observe(duration)
+    workflow_errors_total.labels(workflow_name=version.workflow_name, error_type="step_failure").inc()
+    self._notify_parent(instance)
+
+  def _release_slot(self, instance: WorkflowInstance, version: WorkflowVersion) -> None:
+    """Give a finishing instance's running slot to the oldest waiting instance of its version, if any."""
+    if not instance.admitted:
+      return
+    instance.admitted = False
+    request_id = structlog.contextvars.get_contextvars().get("request_id")
+    for admitted_id in self.uow.workflow.release_admission(version.id):
+      self.uow.workflow.schedule_message(
+        ORCHESTRATION_QUEUE, {"type": EventType.START_WORKFLOW.value, "instance_id": admitted_id}, None, request_id)
+      log.info("Admitted waiting instance", instance_id=admitted_id, released_by=instance.id)
+
+  def _start_child(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep,
+                   delay_seconds: float = 0) -> None:
+    """Start the called workflow as a child instance; it reports back to this step when it ends."""
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
+    version_id = self.uow.workflow.find_active_version_id(step.workflow)
+    if version_id is None:
+      log.error("Called workflow has no active version", step=step.name, workflow=step.workflow)
+      step_execution.status = StepExecutionStatus.FAILED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.error_details = f"Workflow '{step.workflow}' has no active version"
+      self.uow.workflow.save_step_execution(step_execution)
+      self._fail_workflow(instance, version)
+      return
+
+    request_id = structlog.contextvars.get_contextvars().get("request_id")
+    child = WorkflowInstance(
+      id=str(uuid.uuid4()),
+      workflow_version_id=version_id,
+      status=WorkflowStatus.PENDING,
+      data=step.child_data(instance.data),
+      created_at=datetime.now(timezone.utc),
+      parent_instance_id=instance.id,
+      parent_step=step.name,
+    )
+    self.uow.workflow.add_instance(child, request_id)
+
+    # Results from any earlier child of this step are told apart by this id and ignored
+    step_execution.status = StepExecutionStatus.RUNNING
+    step_execution.output_data = {"child_instance_id": child.id}
+    self.uow.workflow.save_step_execution(step_execution)
+    self.uow.workflow.save_instance(instance)
+
+    payload = {"type": EventType.START_WORKFLOW.value, "instance_id": child.id, "request_id": request_id}
+    if delay_seconds > 0:
+      # Filed under the child, so the sweeper leaves the pending child alone until the timer fires
+      fire_at = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+      self.uow.workflow.schedule_timer(timer_id(instance.id, RETRY, step.name), child.id, fire_at,
+                                       ORCHESTRATION_QUEUE, payload, request_id)
+    else:
+      self.uow.workflow.schedule_message(ORCHESTRATION_QUEUE, payload, None, request_id)
+    log.info("Started child workflow", step=step.name, workflow=step.workflow, child_instance_id=child.id)
+
+  def _handle_child_result(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep,
+                           event: WorkflowEvent) -> None:
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
+    child_id = (event.data or {}).get("child_instance_id")
+    if (not step_execution or step_execution.status != StepExecutionStatus.RUNNING
+        or (step_execution.output_data or {}).get("child_instance_id") != child_id):
+      log.warning("Ignoring result from a stale child instance", step=step.name, child_instance_id=child_id)
+      return
+
+    if event.event_type == EventType.STEP_COMPLETE:
+      self._complete_current_step(instance, version, step.name, {step.result_key: event.data.get("data") or {}})
+      self._transition_to_step(instance, version, step.next)
+
+    elif instance.current_step_attempts < step.retry.max_attempts:
+      log.info("Scheduling child workflow retry", step=step.name, attempts=instance.current_step_attempts + 1)
+      instance.current_step_attempts += 1
+      step_retry_total.labels(workflow_name=version.workflow_name, step_name=step.name).inc()
+      self._start_child(instance, version, step, step.retry.delay_seconds)
+
+    else:
+      log.error("Child workflow failed permanently", step=step.name, child_instance_id=child_id)
+      step_execution.status = StepExecutionStatus.FAILED
+      step_execution.completed_at = datetime.now(timezone.utc)
+      step_execution.error_details = str(event.data.get("error", "Unknown error"))
+      self.uow.workflow.save_step_execution(step_execution)
+      self._fail_workflow(instance, version)
+
+  def _notify_parent(self, instance: WorkflowInstance) -> None:
+    """Report a child's end to the call_workflow step that started it, as a step result event."""
+    if not instance.parent_instance_id:
+      return
+    request_id = structlog.contextvars.get_contextvars().get("request_id")
+    self.uow.workflow.schedule_message(
+      ORCHESTRATION_QUEUE, child_result_payload(instance.parent_instance_id, instance.parent_step, instance.id,
+                                                instance.status.value, instance.data),
+      None, request_id)
+
+
+  def _handle_delay_step(self, instance_id: str, step: PlanStep) -> None:
+    step_name = step.name
+    duration = step.duration_seconds if step.duration_seconds is not None else 60
     resume_at = datetime.now(timezone.utc) + timedelta(seconds=duration)
     log.info("Pausing for delay", step=step_name, resume_at=resume_at.isoformat())
 
@@ -244,40 +800,43 @@ class OrchestrationService:
       self.uow.workflow.save_step_execution(step_execution)
 
     payload = {"type": EventType.STEP_COMPLETE.value, "instance_id": instance_id, "step_name": step_name}
-    self.uow.workflow.schedule_message(ORCHESTRATION_QUEUE, payload, resume_at, request_id)
+    self.uow.workflow.schedule_timer(timer_id(instance_id, DELAY, step_name), instance_id, resume_at,
+                                     ORCHESTRATION_QUEUE, payload, request_id)
 
 
-  def _handle_wait_step(self, instance: WorkflowInstance, step_name: str, step_def: dict) -> None:
+  def _handle_wait_step(self, instance: WorkflowInstance, step: PlanStep) -> None:
     """Pause the workflow until an external event arrives via the API."""
+    step_name = step.name
     step_execution = self.uow.workflow.find_current_step_execution(instance.id, step_name)
     if step_execution:
       step_execution.status = StepExecutionStatus.RUNNING
       self.uow.workflow.save_step_execution(step_execution)
 
     # If a timeout is configured, schedule a STEP_FAILED as a safety net
-    timeout_seconds = step_def.get('timeout_seconds')
+    timeout_seconds = step.timeout_seconds
     if timeout_seconds:
       request_id = structlog.contextvars.get_contextvars().get("request_id")
-      timeout_at = datetime.now(timezone.utc) + timedelta(seconds=int(timeout_seconds))
+      timeout_at = datetime.now(timezone.utc) + timedelta(seconds=timeout_seconds)
       payload = {
         "type": EventType.STEP_FAILED.value,
         "instance_id": instance.id,
         "step_name": step_name,
         "data": {"error": f"Wait step '{step_name}' timed out after {timeout_seconds}s"},
       }
-      self.uow.workflow.schedule_message(ORCHESTRATION_QUEUE, payload, timeout_at, request_id)
+      # Cancelled when the event arrives, so a late timeout cannot fail the step after it has moved on
+      self.uow.workflow.schedule_timer(timer_id(instance.id, WAIT_TIMEOUT, step_name), instance.id, timeout_at,
+                                       ORCHESTRATION_QUEUE, payload, request_id)
       log.info("Waiting for external event (with timeout)", step=step_name, timeout_seconds=timeout_seconds)
     else:
       log.info("Waiting for external event (no timeout)", step=step_name)
 
-  def _handle_branch_step(self, instance: WorkflowInstance, version: WorkflowVersion, step_name: str, step_def: dict) -> None:
-    condition = step_def.get('condition', {})
-    result = self._evaluate_condition(instance.data, condition)
+  def _handle_branch_step(self, instance: WorkflowInstance, version: WorkflowVersion, step: PlanStep) -> None:
+    result = step.condition.evaluate(instance.data)
 
-    next_step = step_def.get('on_true') if result else step_def.get('on_false')
-    log.info("Branch evaluated", step=step_name, result=result, next_step=next_step)
+    next_step = step.on_true if result else step.on_false
+    log.info("Branch evaluated", step=step.name, result=result, next_step=next_step)
 
-    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step_name)
+    step_execution = self.uow.workflow.find_current_step_execution(instance.id, step.name)
     if step_execution:
       step_execution.status = StepExecutionStatus.COMPLETED
       step_execution.completed_at = datetime.now(timezone.utc)
@@ -286,34 +845,6 @@ class OrchestrationService:
 
     self._transition_to_step(instance, version, next_step)
 
-  def _evaluate_condition(self, data: dict, condition: dict) -> bool:
-    field_path = condition.get('field', '')
-    operator = condition.get('operator', 'eq')
-    expected = condition.get('value')
-
-    actual = self._resolve_field(data, field_path)
-
-    if operator == 'eq': return actual == expected
-    if operator == 'neq': return actual != expected
-    if operator == 'gt': return actual is not None and actual > expected
-    if operator == 'gte': return actual is not None and actual >= expected
-    if operator == 'lt': return actual is not None and actual < expected
-    if operator == 'lte': return actual is not None and actual <= expected
-    if operator == 'contains': return actual is not None and expected in actual
-    if operator == 'exists': return actual is not None
-    return False
-
-  @staticmethod
-  def _resolve_field(data: dict, field_path: str):
-    """Resolve a dot-separated field path like 'order.quantity'."""
-    parts = field_path.split('.')
-    current = data
-    for part in parts:
-      if isinstance(current, dict):
-        current = current.get(part)
-      else:
-        return None
-    return current
 
 
 class RetryableError(Exception): pass
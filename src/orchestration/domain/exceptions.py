@@ -0,0 +1,7 @@
+class ConcurrentUpdateError(Exception):
+  """The instance changed since it was read; the caller should re-read and try again."""
+
+  def __init__(self, instance_id: str, expected_version: int):
+    super().__init__(f"Instance {instance_id} is no longer at version {expected_version}")
+    self.instance_id = instance_id
+    self.expected_version = expected_version
@@ -1,10 +1,13 @@
 from dataclasses import dataclass, field
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, Optional
 from datetime import datetime
 from enum import Enum
 
 from src.shared.event_types import EventType  # noqa: F401 — re-exported for backward compat
 
+if TYPE_CHECKING:
+  from src.orchestration.domain.plan import ExecutionPlan
+
 # --- Enums ---
 
 class WorkflowStatus(Enum):
@@ -28,6 +31,15 @@ class WorkflowVersion:
   id: str
   definition: Dict[str, Any]
   workflow_name: str = "unknown"
+  # Compiled plans by inline action set; versions are immutable, so each is compiled once per process
+  _plans: Dict[frozenset, Any] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+  def plan(self, inline_actions=()) -> "ExecutionPlan":
+    from src.orchestration.domain.plan import compile_plan
+    key = frozenset(inline_actions)
+    if key not in self._plans:
+      self._plans[key] = compile_plan(self.definition, key)
+    return self._plans[key]
 
   def get_start_step(self) -> str:
     return self.definition.get("start_at")
@@ -49,6 +61,12 @@ class WorkflowInstance:
   data: Dict[str, Any] = field(default_factory=dict)
   created_at: Optional[datetime] = None
   updated_at: Optional[datetime] = None
+  row_version: int = 0
+  # Set on instances started by a call_workflow step; the parent's step hears back when this one ends
+  parent_instance_id: Optional[str] = None
+  parent_step: Optional[str] = None
+  # Holds a running slot of a version with max_concurrent_instances
+  admitted: bool = False
 
 
 @dataclass
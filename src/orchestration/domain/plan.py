@@ -0,0 +1,338 @@
+"""
+Execution plans: workflow definitions compiled once per version.
+
+A definition is a JSON document built for editing. `compile_plan` turns it
+into the form the engine runs: every step gets its kind, its resolved
+successors and its settings read once, and branch conditions get a field
+accessor and an operator function instead of a dot path to split on every
+evaluation. `check_plan` runs the static checks the API applies before it
+saves a definition.
+"""
+import operator as op
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.orchestration.domain.models import RetryPolicy
+
+
+END = "end"
+
+
+class StepKind(Enum):
+  ACTION = "action"
+  # An action the engine runs itself, see worker.registry.action(inline=True)
+  INLINE = "inline"
+  DELAY = "delay"
+  BRANCH = "branch"
+  WAIT = "wait_for_event"
+  # Actions dispatched side by side, joined before `next`
+  PARALLEL = "parallel"
+  # One action per item of a list in the instance data
+  MAP = "map"
+  # Another workflow run as a child instance; the step ends when the child does
+  CALL = "call_workflow"
+
+
+STEP_TYPES = {"action", "delay", "branch", "wait_for_event", "parallel", "map", "call_workflow"}
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+def _present(compare: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+  return lambda actual, expected: actual is not None and compare(actual, expected)
+
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+  "eq": op.eq,
+  "neq": op.ne,
+  "gt": _present(op.gt),
+  "gte": _present(op.ge),
+  "lt": _present(op.lt),
+  "lte": _present(op.le),
+  "contains": _present(lambda actual, expected: expected in actual),
+  "exists": lambda actual, expected: actual is not None,
+}
+
+
+def field_accessor(path: str) -> Callable[[dict], Any]:
+  """A getter for a dot-separated path like 'order.quantity'; None if any parent is not a dict."""
+  parts = tuple(path.split("."))
+  if len(parts) == 1:
+    key = parts[0]
+    return lambda data: data.get(key) if isinstance(data, dict) else None
+
+  def get(data):
+    for part in parts:
+      if not isinstance(data, dict):
+        return None
+      data = data.get(part)
+    return data
+  return get
+
+
+@dataclass(frozen=True)
+class Condition:
+  path: str
+  operator: str
+  expected: Any
+  _get: Callable[[dict], Any] = field(repr=False, compare=False)
+  _compare: Callable[[Any, Any], bool] = field(repr=False, compare=False)
+
+  @classmethod
+  def compile(cls, condition: dict) -> "Condition":
+    path = condition.get("field", "")
+    operator = condition.get("operator", "eq")
+    return cls(path, operator, condition.get("value"), field_accessor(path),
+               OPERATORS.get(operator, lambda actual, expected: False))
+
+  def evaluate(self, data: dict) -> bool:
+    return self._compare(self._get(data), self.expected)
+
+
+@dataclass(frozen=True)
+class PlanStep:
+  name: str
+  kind: StepKind
+  # Successors; None means the workflow ends
+  next: Optional[str] = None
+  on_true: Optional[str] = None
+  on_false: Optional[str] = None
+  condition: Optional[Condition] = None
+  action_id: Optional[str] = None
+  config: Dict[str, Any] = field(default_factory=dict)
+  connection_id: Optional[str] = None
+  retry: RetryPolicy = field(default_factory=RetryPolicy)
+  duration_seconds: Optional[int] = None
+  timeout_seconds: Optional[int] = None
+  # Parallel steps: branch name -> action step named "<step>.<branch>", and how many must complete
+  branches: Dict[str, "PlanStep"] = field(default_factory=dict)
+  join: Optional[int] = None
+  # Map steps: the list to iterate, the action run per item as "<step>[<index>]", and where results go
+  items_path: Optional[str] = None
+  items: Optional[Callable[[dict], Any]] = field(default=None, repr=False, compare=False)
+  item_action: Optional["PlanStep"] = None
+  max_concurrency: Optional[int] = None
+  max_failures: int = 0
+  result_key: Optional[str] = None
+  # Call steps: the workflow to start by name, and the child's data as (key, accessor into the parent's data)
+  workflow: Optional[str] = None
+  inputs: Tuple[Tuple[str, Callable[[dict], Any]], ...] = field(default=(), repr=False, compare=False)
+
+  def child_data(self, data: dict) -> Dict[str, Any]:
+    return {key: get(data) for key, get in self.inputs}
+
+  def successors(self) -> Tuple[Optional[str], ...]:
+    if self.kind == StepKind.BRANCH:
+      return (self.on_true, self.on_false)
+    return (self.next,)
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+  start_at: Optional[str]
+  steps: Dict[str, PlanStep]
+  # Problems compile_plan noticed while reading the definition, reported by check_plan
+  problems: Tuple[str, ...] = ()
+  # Instances of the version allowed to run at once; later starts wait their turn
+  max_concurrent_instances: Optional[int] = None
+
+  def step(self, name: str) -> Optional[PlanStep]:
+    return self.steps.get(name)
+
+  def map_item(self, parent: str, step_name: str) -> Optional[int]:
+    """The item index of map step `parent` that runs as `step_name`, if there is one."""
+    step = self.steps.get(parent)
+    if step is None or step.kind != StepKind.MAP or not step_name.startswith(parent + "[") or not step_name.endswith("]"):
+      return None
+    index = step_name[len(parent) + 1:-1]
+    return int(index) if index.isdigit() else None
+
+  def branch(self, parent: str, step_name: str) -> Optional[PlanStep]:
+    """The branch of parallel step `parent` that runs as `step_name`, if there is one."""
+    step = self.steps.get(parent)
+    if step is None or step.kind != StepKind.PARALLEL or not step_name.startswith(parent + "."):
+      return None
+    return step.branches.get(step_name[len(parent) + 1:])
+
+
+def _target(value) -> Optional[str]:
+  return None if value in (None, "", END) else value
+
+
+def _seconds(step_name: str, key: str, value, problems: List[str]) -> Optional[int]:
+  if value is None:
+    return None
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    problems.append(f"Step '{step_name}': {key} must be an integer")
+    return None
+
+
+def _compile_step(name: str, step_def: dict, inline_actions, problems: List[str]) -> PlanStep:
+  step_type = step_def.get("type", "action")
+  if step_type not in STEP_TYPES:
+    problems.append(f"Step '{name}': unknown type '{step_type}'")
+  retry = RetryPolicy.from_dict(step_def.get("retry", {}))
+
+  if step_type == "delay" or "duration_seconds" in step_def:
+    return PlanStep(name, StepKind.DELAY, next=_target(step_def.get("next")), retry=retry,
+                    duration_seconds=_seconds(name, "duration_seconds", step_def.get("duration_seconds", 60), problems))
+
+  if step_type == "branch":
+    condition = step_def.get("condition") or {}
+    if not condition.get("field"):
+      problems.append(f"Step '{name}': branch condition has no field")
+    if condition.get("operator", "eq") not in OPERATORS:
+      problems.append(f"Step '{name}': unknown operator '{condition.get('operator')}'")
+    return PlanStep(name, StepKind.BRANCH, on_true=_target(step_def.get("on_true")),
+                    on_false=_target(step_def.get("on_false")), condition=Condition.compile(condition), retry=retry)
+
+  if step_type == "parallel":
+    return _compile_parallel(name, step_def, retry, problems)
+
+  if step_type == "map":
+    return _compile_map(name, step_def, retry, problems)
+
+  if step_type == "call_workflow":
+    return _compile_call(name, step_def, retry, problems)
+
+  if step_type == "wait_for_event":
+    return PlanStep(name, StepKind.WAIT, next=_target(step_def.get("next")), retry=retry,
+                    timeout_seconds=_seconds(name, "timeout_seconds", step_def.get("timeout_seconds") or None, problems))
+
+  action_id = step_def.get("action_id", name)
+  connection_id = step_def.get("connection_id")
+  kind = StepKind.INLINE if action_id in inline_actions and not connection_id else StepKind.ACTION
+  return PlanStep(name, kind, next=_target(step_def.get("next")), action_id=action_id,
+                  config=step_def.get("config", {}), connection_id=connection_id, retry=retry)
+
+
+def item_step_name(step_name: str, index: int) -> str:
+  return f"{step_name}[{index}]"
+
+
+def _count(step_name: str, key: str, value, minimum: int, problems: List[str]) -> Optional[int]:
+  if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+    problems.append(f"Step '{step_name}': {key} must be an integer of at least {minimum}")
+    return None
+  return value
+
+
+def _compile_map(name: str, step_def: dict, retry: RetryPolicy, problems: List[str]) -> PlanStep:
+  items_path = step_def.get("items")
+  if not items_path or not isinstance(items_path, str):
+    problems.append(f"Step '{name}': map step needs an 'items' path")
+    items_path = ""
+  action_def = step_def.get("action")
+  item_action = None
+  if not isinstance(action_def, dict) or action_def.get("type", "action") != "action":
+    problems.append(f"Step '{name}': map step needs an 'action' to run per item")
+  else:
+    item_action = _compile_step(f"{name}[]", action_def, frozenset(), problems)
+  max_concurrency = _count(name, "max_concurrency", step_def.get("max_concurrency", DEFAULT_MAX_CONCURRENCY), 1, problems)
+  max_failures = _count(name, "max_failures", step_def.get("max_failures", 0), 0, problems)
+  return PlanStep(name, StepKind.MAP, next=_target(step_def.get("next")), retry=retry,
+                  items_path=items_path, items=field_accessor(items_path), item_action=item_action,
+                  max_concurrency=max_concurrency or DEFAULT_MAX_CONCURRENCY, max_failures=max_failures or 0,
+                  result_key=step_def.get("result_key") or name)
+
+
+def _compile_call(name: str, step_def: dict, retry: RetryPolicy, problems: List[str]) -> PlanStep:
+  workflow = step_def.get("workflow")
+  if not workflow or not isinstance(workflow, str):
+    problems.append(f"Step '{name}': call_workflow step needs a 'workflow' name")
+    workflow = None
+  inputs = step_def.get("input") or {}
+  if not isinstance(inputs, dict) or not all(isinstance(path, str) and path for path in inputs.values()):
+    problems.append(f"Step '{name}': input must map child data keys to dot paths in the parent's data")
+    inputs = {}
+  return PlanStep(name, StepKind.CALL, next=_target(step_def.get("next")), retry=retry, workflow=workflow,
+                  inputs=tuple((key, field_accessor(path)) for key, path in inputs.items()),
+                  result_key=step_def.get("result_key") or name)
+
+
+def _compile_parallel(name: str, step_def: dict, retry: RetryPolicy, problems: List[str]) -> PlanStep:
+  branches = {}
+  for branch, branch_def in (step_def.get("branches") or {}).items():
+    if "." in branch:
+      problems.append(f"Step '{name}': branch name '{branch}' must not contain '.'")
+    if not isinstance(branch_def, dict) or branch_def.get("type", "action") != "action":
+      problems.append(f"Step '{name}': branch '{branch}' must be an action")
+      continue
+    # Branches always go to the workers; running them side by side is the point
+    branches[branch] = _compile_step(f"{name}.{branch}", branch_def, frozenset(), problems)
+  if not branches:
+    problems.append(f"Step '{name}': parallel step has no branches")
+
+  join = step_def.get("join", "all")
+  if join == "all":
+    required = len(branches)
+  elif join == "any":
+    required = 1
+  elif isinstance(join, int) and not isinstance(join, bool) and 1 <= join <= len(branches):
+    required = join
+  else:
+    problems.append(f"Step '{name}': join must be 'all', 'any' or a number from 1 to {len(branches)}")
+    required = len(branches)
+  return PlanStep(name, StepKind.PARALLEL, next=_target(step_def.get("next")), retry=retry,
+                  branches=branches, join=required)
+
+
+def compile_plan(definition: dict, inline_actions: Iterable[str] = ()) -> ExecutionPlan:
+  """Compile a definition. Never raises; what it cannot make sense of is left for check_plan."""
+  inline_actions = frozenset(inline_actions)
+  problems: List[str] = []
+  steps = {}
+  for name, step_def in (definition.get("steps") or {}).items():
+    if not isinstance(step_def, dict):
+      problems.append(f"Step '{name}': definition must be an object")
+      continue
+    steps[name] = _compile_step(name, step_def, inline_actions, problems)
+  max_instances = definition.get("max_concurrent_instances")
+  if max_instances is not None and (isinstance(max_instances, bool) or not isinstance(max_instances, int)
+                                    or max_instances < 1):
+    problems.append("max_concurrent_instances must be an integer of at least 1")
+    max_instances = None
+  return ExecutionPlan(_target(definition.get("start_at")), steps, tuple(problems), max_instances)
+
+
+def check_plan(plan: ExecutionPlan) -> List[str]:
+  """Static checks: a valid start, no dangling successors, no unreachable steps, and no cycle without a way out."""
+  errors = list(plan.problems)
+  if not plan.steps:
+    return errors + ["Definition has no steps"]
+  if plan.start_at is None:
+    return errors + ["Definition has no start_at"]
+  if plan.start_at not in plan.steps:
+    return errors + [f"start_at '{plan.start_at}' is not a step"]
+
+  for step in plan.steps.values():
+    for target in step.successors():
+      if target is not None and target not in plan.steps:
+        errors.append(f"Step '{step.name}': next step '{target}' does not exist")
+
+  reachable, stack = set(), [plan.start_at]
+  while stack:
+    name = stack.pop()
+    if name in reachable or name not in plan.steps:
+      continue
+    reachable.add(name)
+    stack.extend(t for t in plan.steps[name].successors() if t is not None)
+  for name in plan.steps:
+    if name not in reachable:
+      errors.append(f"Step '{name}' is unreachable from '{plan.start_at}'")
+
+  # Loops through a branch are fine as long as some path still leads to the end; dangling targets are reported above
+  finishing = {name for name, step in plan.steps.items()
+               if any(t is None or t not in plan.steps for t in step.successors())}
+  changed = True
+  while changed:
+    changed = False
+    for name, step in plan.steps.items():
+      if name not in finishing and any(t in finishing for t in step.successors()):
+        finishing.add(name)
+        changed = True
+  for name in sorted(reachable - finishing):
+    errors.append(f"Step '{name}' is in a cycle that never reaches the end")
+  return errors
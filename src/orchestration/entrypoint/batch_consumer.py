@@ -0,0 +1,329 @@
+"""
+Batch consumer for the orchestration queue.
+
+Replaces the `celery worker -Q orchestration_queue` engine process. It pulls
+up to ENGINE_BATCH_SIZE `engine.orchestrate` messages (waiting at most
+ENGINE_BATCH_WAIT_MS after the first one), applies them in one Postgres
+transaction with a savepoint per instance, and settles them after the
+commit. Failed instances are retried or dead-lettered one by one with the
+same limits and countdowns as the Celery task. Other tasks on the queue run
+inline.
+
+A retried event comes back on the queue this consumer drains, with the
+countdown as its `eta`. Like a Celery worker, the consumer holds such a
+message unacked until it is due, and raises its prefetch by the messages
+it holds so they do not starve the batch.
+
+With ORCHESTRATION_PARTITIONS set it also consumes its share of the
+partition queues, without the per-instance Redis lock, and forwards
+orchestration events that still arrive on the shared queue to their
+partition.
+
+  python -m src.orchestration.entrypoint.batch_consumer
+"""
+import heapq
+import itertools
+import os
+import socket
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from src.shared.logging_config import setup_logging, log
+from src.shared.celery_app import app as celery_app
+from src.shared.redis_client import redis_client
+from src.shared.cancellations import cancelled_instances
+from src.shared.action_limits import action_limiter
+from src.shared.version_cache import version_cache
+from src.shared.constants import ORCHESTRATION_QUEUE
+from src.shared.partitioning import ORCHESTRATION_PARTITIONS, partition_queue, route_queue
+
+from src.orchestration.domain.events import WorkflowEvent
+from src.orchestration.domain.models import EventType
+from src.orchestration.adapters.postgres_unit_of_work import PostgresUnitOfWork
+from src.orchestration.adapters.redis_lock import NoopLockService, make_lock_service
+from src.orchestration.adapters.redis_event_buffer import RedisEventBuffer
+from src.orchestration.adapters.redis_partitions import RedisPartitionCoordinator
+from src.orchestration.application.orchestration_service import (
+  OrchestrationService, RetryableError, NonRetryableError
+)
+from src.worker.registry import get_inline_registry
+
+ENGINE_BATCH_SIZE = int(os.getenv("ENGINE_BATCH_SIZE", "50"))
+ENGINE_BATCH_WAIT_SECONDS = int(os.getenv("ENGINE_BATCH_WAIT_MS", "20")) / 1000
+ERROR_BACKOFF_SECONDS = 5
+# How long a released partition's in-flight deliveries are collected before being requeued
+RELEASE_DRAIN_SECONDS = 0.5
+
+ORCHESTRATE_TASK = "engine.orchestrate"
+# (countdown, max retries), as in engine.orchestrate
+LOCK_RETRY = (5, 12)
+ERROR_RETRY = (10, 3)
+
+
+def seconds_until_eta(message) -> float:
+  """Seconds until a message's `eta` header is due; 0 if it has none or it has passed."""
+  eta = message.headers.get("eta")
+  if not eta:
+    return 0.0
+  try:
+    due = datetime.fromisoformat(eta)
+  except (TypeError, ValueError):
+    return 0.0
+  if due.tzinfo is None:
+    due = due.replace(tzinfo=timezone.utc)
+  return max((due - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def event_from_message(message: dict) -> WorkflowEvent:
+  return WorkflowEvent(
+    instance_id=message["instance_id"],
+    event_type=EventType(message["type"]),
+    step_name=message.get("step_name"),
+    data=message.get("data"),
+  )
+
+
+class BatchConsumer:
+  def __init__(self, celery_app, service_factory, batch_size: int = 50, wait_seconds: float = 0.02,
+               partitions: RedisPartitionCoordinator = None):
+    self.celery_app = celery_app
+    self.service_factory = service_factory
+    self.batch_size = batch_size
+    self.wait_seconds = wait_seconds
+    self.partitions = partitions
+    # (queue name, message) in delivery order
+    self.buffer = []
+    # (monotonic due time, arrival, queue name, message) for messages whose eta has not passed
+    self.delayed = []
+    self._arrivals = itertools.count()
+    self.consumers = {}
+
+  def run(self) -> None:
+    with self.celery_app.connection_for_read() as conn:
+      conn.ensure_connection(max_retries=3)
+      self._consume(conn, ORCHESTRATION_QUEUE)
+      for partition in sorted(self.partitions.owned if self.partitions is not None else []):
+        self._consume(conn, partition_queue(partition))
+      log.info("Batch consumer started", batch_size=self.batch_size, partitioned=self.partitions is not None)
+      try:
+        while True:
+          if self.partitions is not None:
+            self._rebalance(conn)
+          self._fill(conn)
+          self.flush()
+      finally:
+        self.consumers = {}
+
+  def _consume(self, conn, queue_name: str) -> None:
+    queue = next(q for q in self.celery_app.conf.task_queues if q.name == queue_name)
+    consumer = conn.Consumer(queues=[queue], on_message=partial(self._on_message, queue_name),
+                             accept=["json"], prefetch_count=self.batch_size)
+    consumer.consume()
+    self.consumers[queue_name] = consumer
+
+  def _on_message(self, queue_name: str, message) -> None:
+    wait = seconds_until_eta(message)
+    if wait <= 0:
+      self.buffer.append((queue_name, message))
+      return
+    heapq.heappush(self.delayed, (time.monotonic() + wait, next(self._arrivals), queue_name, message))
+    self._update_prefetch(queue_name)
+
+  def _release_due(self) -> None:
+    """Move held messages whose eta has passed into the buffer."""
+    now = time.monotonic()
+    released = set()
+    while self.delayed and self.delayed[0][0] <= now:
+      _, _, queue_name, message = heapq.heappop(self.delayed)
+      self.buffer.append((queue_name, message))
+      released.add(queue_name)
+    for queue_name in released:
+      self._update_prefetch(queue_name)
+
+  def _update_prefetch(self, queue_name: str) -> None:
+    """Let a queue deliver a full batch on top of the messages held for their eta."""
+    consumer = self.consumers.get(queue_name)
+    if consumer is None:
+      return
+    held = sum(1 for entry in self.delayed if entry[2] == queue_name)
+    consumer.qos(prefetch_count=self.batch_size + held)
+
+  def _rebalance(self, conn) -> None:
+    owned = self.partitions.run_if_due()
+    if owned is None:
+      return
+    wanted = {partition_queue(p) for p in owned}
+    current = set(self.consumers) - {ORCHESTRATION_QUEUE}
+    released = current - wanted
+
+    if released:
+      # Settle everything held before letting go, then hand back what was already on the wire
+      self.flush()
+      for name in released:
+        self.consumers.pop(name).cancel()
+      deadline = time.monotonic() + RELEASE_DRAIN_SECONDS
+      while time.monotonic() < deadline:
+        try:
+          conn.drain_events(timeout=deadline - time.monotonic())
+        except socket.timeout:
+          break
+      kept = []
+      for name, message in self.buffer:
+        if name in released:
+          message.reject(requeue=True)
+        else:
+          kept.append((name, message))
+      self.buffer = kept
+      held = []
+      for entry in self.delayed:
+        if entry[2] in released:
+          entry[3].reject(requeue=True)
+        else:
+          held.append(entry)
+      heapq.heapify(held)
+      self.delayed = held
+
+    for name in sorted(wanted - current):
+      self._consume(conn, name)
+
+  def _fill(self, conn) -> None:
+    """Block until there is at least one message, then collect more until the batch is full or the wait is up."""
+    deadline = None
+    while len(self.buffer) < self.batch_size:
+      self._release_due()
+      if self.buffer and deadline is None:
+        deadline = time.monotonic() + self.wait_seconds
+      timeout = 1.0 if deadline is None else deadline - time.monotonic()
+      if deadline is not None and timeout <= 0:
+        return
+      if self.delayed:
+        # Wake for the next held message even if nothing new arrives
+        timeout = max(min(timeout, self.delayed[0][0] - time.monotonic()), 0.001)
+      try:
+        conn.drain_events(timeout=timeout)
+      except socket.timeout:
+        if self.buffer or self.partitions is not None:
+          return
+        conn.heartbeat_check()
+
+  def flush(self) -> None:
+    batch, self.buffer = self.buffer, []
+    events, pending = [], []
+    for queue_name, message in batch:
+      task_name = message.headers.get("task")
+      try:
+        args, kwargs, _ = message.decode()
+        if task_name != ORCHESTRATE_TASK:
+          self._run_inline(task_name, args, kwargs, message)
+          continue
+        event = event_from_message(args[0])
+        if self.partitions is not None and queue_name == ORCHESTRATION_QUEUE:
+          self._forward(message, args)
+          continue
+        events.append(event)
+        pending.append((message, args))
+      except Exception:
+        log.error("Undecodable orchestration message; dead-lettering", task_name=task_name, exc_info=True)
+        message.reject(requeue=False)
+
+    if not events:
+      return
+
+    started = time.monotonic()
+    results = self.service_factory().process_batch(events)
+    for (message, args), error in zip(pending, results):
+      self._settle(message, args, error)
+
+    log.info("Processed orchestration batch", events=len(events),
+             failed=sum(1 for e in results if e is not None),
+             duration_ms=round((time.monotonic() - started) * 1000, 1))
+
+  def _forward(self, message, args) -> None:
+    """Move an event from the shared queue to its partition, whose owner handles it without a lock."""
+    self._republish(message, args, countdown=None, retries=message.headers.get("retries") or 0)
+
+  def _settle(self, message, args, error) -> None:
+    if error is None:
+      message.ack()
+      return
+
+    if isinstance(error, NonRetryableError):
+      log.error("Non-Retryable error occured", error=str(error))
+      message.reject(requeue=False)
+      return
+
+    countdown, max_retries = LOCK_RETRY if isinstance(error, RetryableError) else ERROR_RETRY
+    retries = message.headers.get("retries") or 0
+    if retries >= max_retries:
+      log.error("Orchestration event out of retries; dead-lettering", retries=retries, error=str(error))
+      message.reject(requeue=False)
+      return
+
+    self._republish(message, args, countdown=countdown, retries=retries + 1)
+
+  def _republish(self, message, args, countdown, retries: int) -> None:
+    request_id = message.headers.get("request_id")
+    try:
+      self.celery_app.send_task(
+        ORCHESTRATE_TASK, args=args, queue=route_queue(ORCHESTRATION_QUEUE, args[0]), countdown=countdown,
+        retries=retries, headers={"request_id": request_id} if request_id else {},
+      )
+    except Exception:
+      log.error("Could not republish orchestration event; requeueing", exc_info=True)
+      message.reject(requeue=True)
+      return
+    message.ack()
+
+  def _run_inline(self, task_name, args, kwargs, message) -> None:
+    task = self.celery_app.tasks.get(task_name)
+    if task is None:
+      log.error("Unknown task on orchestration queue; dead-lettering", task_name=task_name)
+      message.reject(requeue=False)
+      return
+    task.apply(args=args, kwargs=kwargs)
+    message.ack()
+
+
+def main():
+  setup_logging()
+  # Registers engine.recover_stuck and the other tasks that may share the queue
+  celery_app.loader.import_default_modules()
+  # call_workflow steps look up the active version of the called workflow through the cache
+  version_cache.start_listener()
+  lock_service = make_lock_service(redis_client)
+  event_buffer = RedisEventBuffer(redis_client)
+  inline_handlers = get_inline_registry()
+
+  partitions = None
+  if ORCHESTRATION_PARTITIONS > 0:
+    member_id = f"{socket.gethostname()}:{os.getpid()}"
+    partitions = RedisPartitionCoordinator(redis_client, member_id, ORCHESTRATION_PARTITIONS)
+    lock_service = NoopLockService()
+
+  consumer = BatchConsumer(
+    celery_app,
+    lambda: OrchestrationService(PostgresUnitOfWork(), lock_service, event_buffer, inline_handlers,
+                                 cancelled_instances, action_limiter),
+    batch_size=ENGINE_BATCH_SIZE,
+    wait_seconds=ENGINE_BATCH_WAIT_SECONDS,
+    partitions=partitions,
+  )
+
+  try:
+    while True:
+      try:
+        consumer.run()
+      except Exception:
+        log.error("Batch consumer error; reconnecting in 5 seconds.", exc_info=True)
+        # Unacked messages go back to the queue with the channel
+        consumer.buffer = []
+        consumer.delayed = []
+        time.sleep(ERROR_BACKOFF_SECONDS)
+  finally:
+    if partitions is not None:
+      partitions.leave()
+
+
+if __name__ == '__main__':
+  main()
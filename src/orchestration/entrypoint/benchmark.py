@@ -0,0 +1,282 @@
+"""
+In-process benchmark for OrchestrationService.
+
+Drives synthetic workflows through `process_event` on the in-memory adapters,
+with no Postgres, Redis or RabbitMQ. Inline-safe actions run in the engine as
+they do in production (unless --no-inline); other action dispatches are
+answered at once with a simulated STEP_COMPLETE, and timers fire at once,
+so the numbers are engine time only.
+
+  python -m src.orchestration.entrypoint.benchmark --workflow order_priority --instances 2000
+"""
+import argparse
+import gc
+import logging
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from src.shared.constants import ACTIONS_QUEUE
+from src.orchestration.domain.events import WorkflowEvent
+from src.orchestration.domain.models import EventType, WorkflowVersion, WorkflowInstance, WorkflowStatus
+from src.orchestration.adapters.in_memory import InMemoryStore, InMemoryUnitOfWork, InMemoryLockService, OutboxMessage
+from src.orchestration.application.orchestration_service import OrchestrationService
+from src.worker.registry import get_inline_registry
+
+
+# Mirrors the seeded order_priority_workflow in infrastructure/postgres/init.sql
+ORDER_PRIORITY_DEFINITION = {
+  "start_at": "compute_priority",
+  "steps": {
+    "compute_priority": {
+      "type": "action", "connector_id": "python", "action_id": "python_execute",
+      "config": {"code": "qty = data.get('order', {}).get('quantity', 0)\n"
+                         "data['priority'] = 'high' if qty >= 100 else 'normal'"},
+      "next": "check_priority",
+    },
+    "check_priority": {
+      "type": "branch",
+      "condition": {"field": "priority", "operator": "eq", "value": "high"},
+      "on_true": "set_expedited",
+      "on_false": "set_standard",
+    },
+    "set_expedited": {
+      "type": "action", "connector_id": "internal", "action_id": "transform_data",
+      "config": {"set": {"expedited": True, "shipping_days": 1}},
+      "next": "log_result",
+    },
+    "set_standard": {
+      "type": "action", "connector_id": "internal", "action_id": "transform_data",
+      "config": {"set": {"expedited": False, "shipping_days": 5}},
+      "next": "log_result",
+    },
+    "log_result": {
+      "type": "action", "connector_id": "internal", "action_id": "log",
+      "config": {"message": "Order processed: priority={{priority}}"},
+      "next": "end",
+    },
+  },
+}
+
+
+def branch_heavy_definition(depth: int = 10) -> dict:
+  """A chain of branches on nested fields ending in one action."""
+  steps = {}
+  for i in range(depth):
+    nxt = f"branch_{i + 1}" if i + 1 < depth else "finish"
+    steps[f"branch_{i}"] = {
+      "type": "branch",
+      "condition": {"field": f"order.scores.s{i}", "operator": "gte", "value": 50},
+      "on_true": nxt,
+      "on_false": nxt,
+    }
+  steps["finish"] = {"type": "action", "connector_id": "internal", "action_id": "log", "config": {}, "next": "end"}
+  return {"start_at": "branch_0", "steps": steps}
+
+
+def delay_heavy_definition(rounds: int = 5) -> dict:
+  """Alternating actions and delays."""
+  steps = {}
+  for i in range(rounds):
+    steps[f"work_{i}"] = {
+      "type": "action", "connector_id": "internal", "action_id": "transform_data",
+      "config": {"set": {f"round_{i}": True}}, "next": f"wait_{i}",
+    }
+    steps[f"wait_{i}"] = {
+      "type": "delay", "duration_seconds": 60,
+      "next": f"work_{i + 1}" if i + 1 < rounds else "end",
+    }
+  return {"start_at": "work_0", "steps": steps}
+
+
+def order_input(rng: random.Random) -> dict:
+  return {"order": {"quantity": rng.randint(1, 200), "scores": {f"s{i}": rng.randint(0, 100) for i in range(10)}}}
+
+
+def simulate_action(action: str, config: dict, data: dict) -> dict:
+  """What the worker would report back for the actions used above."""
+  if action == "python_execute":
+    qty = data.get("order", {}).get("quantity", 0)
+    return {"priority": "high" if qty >= 100 else "normal"}
+  if action == "transform_data":
+    return dict(config.get("set", {}))
+  return {}
+
+
+@dataclass
+class BenchmarkWorkflow:
+  definition: dict
+  make_input: Callable[[random.Random], dict] = order_input
+
+
+WORKFLOWS: Dict[str, BenchmarkWorkflow] = {
+  "order_priority": BenchmarkWorkflow(ORDER_PRIORITY_DEFINITION),
+  "branch_heavy": BenchmarkWorkflow(branch_heavy_definition()),
+  "delay_heavy": BenchmarkWorkflow(delay_heavy_definition()),
+}
+
+
+@dataclass
+class TransitionStats:
+  count: int = 0
+  seconds: float = 0.0
+
+
+@dataclass
+class BenchmarkReport:
+  workflow: str
+  instances: int
+  events: int = 0
+  completed: int = 0
+  dispatches: int = 0
+  cpu_seconds: float = 0.0
+  wall_seconds: float = 0.0
+  net_blocks: int = 0
+  alloc_peak_bytes: int = 0
+  transitions: Dict[str, TransitionStats] = field(default_factory=dict)
+
+  @property
+  def events_per_cpu_second(self) -> float:
+    return self.events / self.cpu_seconds if self.cpu_seconds else 0.0
+
+
+def transition_label(event: WorkflowEvent, store: InMemoryStore, definition: dict) -> str:
+  """`<event type> -> <kind of step the instance ended up on>`, e.g. `STEP_COMPLETE -> branch`."""
+  instance = store.instances[event.instance_id]
+  if instance.status != WorkflowStatus.RUNNING:
+    target = instance.status.value
+  else:
+    step_def = definition["steps"].get(instance.current_step, {})
+    target = step_def.get("type", "action")
+  return f"{event.event_type.value} -> {target}"
+
+
+def seed_store(workflow: BenchmarkWorkflow, instances: int, rng: random.Random) -> tuple[InMemoryStore, List[WorkflowEvent]]:
+  store = InMemoryStore()
+  version = WorkflowVersion(id=str(uuid.uuid4()), definition=workflow.definition, workflow_name="benchmark")
+  store.add_version(version)
+
+  events = []
+  now = datetime.now(timezone.utc)
+  for _ in range(instances):
+    instance = WorkflowInstance(
+      id=str(uuid.uuid4()),
+      workflow_version_id=version.id,
+      status=WorkflowStatus.PENDING,
+      data=workflow.make_input(rng),
+      created_at=now,
+    )
+    store.add_instance(instance)
+    events.append(WorkflowEvent(instance_id=instance.id, event_type=EventType.START_WORKFLOW))
+  return store, events
+
+
+def drain_outbox(store: InMemoryStore, queue: deque) -> int:
+  """Turn what the engine wrote to the outbox into the events that would come back; returns the message count."""
+  for timer in store.timers.values():
+    store.outbox.append(OutboxMessage(timer.destination, timer.payload, timer.fire_at, timer.request_id))
+  store.timers.clear()
+  count = len(store.outbox)
+  for message in store.outbox:
+    payload = message.payload
+    if message.destination == ACTIONS_QUEUE:
+      data = simulate_action(payload["action"], payload.get("config", {}), store.instances[payload["instance_id"]].data)
+      queue.append(WorkflowEvent(payload["instance_id"], EventType.STEP_COMPLETE, payload["step_name"], data))
+    else:
+      queue.append(WorkflowEvent(payload["instance_id"], EventType(payload["type"]), payload.get("step_name"), payload.get("data")))
+  store.outbox.clear()
+  return count
+
+
+def run_benchmark(workflow_name: str, instances: int, seed: int = 0, trace_alloc: bool = False,
+                  inline: bool = True) -> BenchmarkReport:
+  """Run every instance to completion, interleaving their events round-robin."""
+  workflow = WORKFLOWS[workflow_name]
+  store, initial = seed_store(workflow, instances, random.Random(seed))
+  inline_handlers = get_inline_registry() if inline else {}
+  service = OrchestrationService(InMemoryUnitOfWork(store), InMemoryLockService(), inline_handlers=inline_handlers)
+  report = BenchmarkReport(workflow=workflow_name, instances=instances)
+  queue = deque(initial)
+
+  if trace_alloc:
+    tracemalloc.start()
+  blocks_before = sys.getallocatedblocks()
+  wall_started = time.perf_counter()
+
+  while queue:
+    event = queue.popleft()
+    if trace_alloc:
+      tracemalloc.reset_peak()
+      traced_before = tracemalloc.get_traced_memory()[0]
+
+    cpu_started = time.process_time()
+    service.process_event(event)
+    elapsed = time.process_time() - cpu_started
+
+    if trace_alloc:
+      report.alloc_peak_bytes += tracemalloc.get_traced_memory()[1] - traced_before
+    report.events += 1
+    report.cpu_seconds += elapsed
+    stats = report.transitions.setdefault(transition_label(event, store, workflow.definition), TransitionStats())
+    stats.count += 1
+    stats.seconds += elapsed
+
+    report.dispatches += drain_outbox(store, queue)
+
+  report.wall_seconds = time.perf_counter() - wall_started
+  report.net_blocks = sys.getallocatedblocks() - blocks_before
+  if trace_alloc:
+    tracemalloc.stop()
+  report.completed = sum(1 for i in store.instances.values() if i.status == WorkflowStatus.COMPLETED)
+  return report
+
+
+def format_report(report: BenchmarkReport) -> str:
+  lines = [
+    f"workflow: {report.workflow}  instances: {report.instances}  completed: {report.completed}",
+    f"events: {report.events}  broker messages: {report.dispatches}  engine cpu: {report.cpu_seconds:.3f}s  wall: {report.wall_seconds:.3f}s",
+    f"events/sec per core: {report.events_per_cpu_second:,.0f}",
+    f"net allocated blocks per event: {report.net_blocks / max(report.events, 1):.1f}",
+  ]
+  if report.alloc_peak_bytes:
+    lines.append(f"peak transient KiB per event: {report.alloc_peak_bytes / max(report.events, 1) / 1024:.1f}")
+  lines.append("")
+  lines.append(f"{'transition':<40} {'count':>8} {'total ms':>10} {'us/event':>10}")
+  for label, stats in sorted(report.transitions.items(), key=lambda kv: -kv[1].seconds):
+    lines.append(f"{label:<40} {stats.count:>8} {stats.seconds * 1000:>10.1f} {stats.seconds / stats.count * 1e6:>10.1f}")
+  return "\n".join(lines)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--workflow", choices=sorted(WORKFLOWS), action="append",
+                      help="workflow to run (repeatable; default: all)")
+  parser.add_argument("--instances", type=int, default=1000)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--trace-alloc", action="store_true",
+                      help="also run a tracemalloc pass for per-event allocation (slower, not timed)")
+  parser.add_argument("--no-inline", action="store_true",
+                      help="send inline-safe actions to the (simulated) worker like any other action")
+  parser.add_argument("--log-level", default="WARNING",
+                      help="engine log level; INFO includes log formatting cost in the numbers")
+  args = parser.parse_args(argv)
+
+  logging.getLogger().setLevel(args.log_level)
+  for name in args.workflow or sorted(WORKFLOWS):
+    gc.collect()
+    report = run_benchmark(name, args.instances, seed=args.seed, inline=not args.no_inline)
+    if args.trace_alloc:
+      report.alloc_peak_bytes = run_benchmark(name, args.instances, seed=args.seed, trace_alloc=True,
+                                              inline=not args.no_inline).alloc_peak_bytes
+    print(format_report(report))
+    print()
+
+
+if __name__ == '__main__':
+  main()
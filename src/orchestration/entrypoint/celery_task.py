@@ -1,7 +1,11 @@
 from celery.exceptions import Reject
+from celery.signals import worker_init, worker_process_init
 
 from src.shared.celery_app import app
 from src.shared.redis_client import redis_client
+from src.shared.cancellations import cancelled_instances
+from src.shared.action_limits import action_limiter
+from src.shared.version_cache import version_cache
 from src.shared.logging_config import log
 from src.shared.constants import ORCHESTRATION_QUEUE
 
@@ -9,16 +13,27 @@ from src.orchestration.domain.events import WorkflowEvent
 from src.orchestration.domain.models import EventType
 
 from src.orchestration.adapters.postgres_unit_of_work import PostgresUnitOfWork
-from src.orchestration.adapters.redis_lock import RedisLockService
+from src.orchestration.adapters.redis_lock import make_lock_service
+from src.orchestration.adapters.redis_event_buffer import RedisEventBuffer
 from src.orchestration.application.orchestration_service import (
   OrchestrationService, RetryableError, NonRetryableError
 )
 
+from src.worker.registry import get_inline_registry
 from src.shared.connectors.registry import registry as connector_registry
 import src.shared.connectors.definitions  # noqa: F401
 from src.api.service import WorkflowManagementService
 
-lock_service = RedisLockService(redis_client)
+lock_service = make_lock_service(redis_client)
+event_buffer = RedisEventBuffer(redis_client)
+inline_handlers = get_inline_registry()
+
+
+@worker_init.connect
+@worker_process_init.connect
+def start_version_cache_listener(**kwargs):
+  # call_workflow steps look up the active version of the called workflow through the cache
+  version_cache.start_listener()
 
 
 @app.task(name="engine.orchestrate", queue=ORCHESTRATION_QUEUE, bind=True)
@@ -39,7 +54,7 @@ def orchestrate(self, message: dict):
     )
 
     uow = PostgresUnitOfWork()
-    service = OrchestrationService(uow, lock_service)
+    service = OrchestrationService(uow, lock_service, event_buffer, inline_handlers, cancelled_instances, action_limiter)
     service.process_event(event)
 
     log.info("Orchestration event processed successfully", event_type=event_type)
@@ -67,3 +82,10 @@ def recover_stuck_instances():
       log.info("Recovery sweeper completed", recovered_count=len(recovered), details=recovered)
   except Exception:
     log.error("Recovery sweeper failed", exc_info=True)
+
+  # Events parked for a lock holder that died before draining them
+  for instance_id in event_buffer.parked_instances():
+    try:
+      OrchestrationService(PostgresUnitOfWork(), lock_service, event_buffer, inline_handlers).drain_parked(instance_id)
+    except Exception:
+      log.error("Draining parked events failed", instance_id=instance_id, exc_info=True)
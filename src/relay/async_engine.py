@@ -0,0 +1,289 @@
+import asyncio
+import json
+import time
+import zlib
+
+import aio_pika
+import asyncpg
+from kombu.serialization import dumps
+
+from src.shared.logging_config import log
+from src.shared.partitioning import route_queue
+from src.relay.listener import OUTBOX_CHANNEL
+from src.shared.metrics import (
+    outbox_relay_lag_seconds,
+    outbox_relay_batch_size,
+    outbox_publish_duration_seconds,
+    outbox_relayed_total,
+    outbox_publish_failures_total,
+)
+from src.relay.service import TASK_ROUTING, DEFAULT_LEASE_SECONDS, BACKLOG_SQL, default_relay_id, record_backlog
+
+
+CLAIM_SQL = (
+    "UPDATE outbox o "
+    "SET lease_owner = $1, lease_expires_at = NOW() + make_interval(secs => $2) "
+    "FROM ("
+    "  SELECT id, publish_at FROM outbox "
+    "  WHERE processed_at IS NULL AND publish_at <= NOW() AND destination = $3 "
+    "    AND (lease_expires_at IS NULL OR lease_expires_at < NOW()) "
+    "  ORDER BY publish_at "
+    "  LIMIT $4 "
+    "  FOR UPDATE SKIP LOCKED"
+    ") claimable "
+    "WHERE o.id = claimable.id AND o.publish_at = claimable.publish_at "
+    "RETURNING o.id, o.payload, o.request_id, o.publish_at, "
+    "EXTRACT(EPOCH FROM (NOW() - o.publish_at))::float8 AS lag_seconds"
+)
+
+COMPLETE_SQL = (
+    "UPDATE outbox SET processed_at = NOW(), lease_owner = NULL, lease_expires_at = NULL "
+    "WHERE id = ANY($1::uuid[]) AND lease_owner = $2"
+)
+
+RELEASE_SQL = (
+    "UPDATE outbox SET lease_owner = NULL, lease_expires_at = NULL "
+    "WHERE id = ANY($1::uuid[]) AND lease_owner = $2"
+)
+
+NEXT_DUE_SQL = (
+    "SELECT EXTRACT(EPOCH FROM (MIN(GREATEST(publish_at, COALESCE(lease_expires_at, publish_at))) - NOW()))::float8 "
+    "AS wait_seconds "
+    "FROM outbox "
+    "WHERE processed_at IS NULL AND destination = $1 "
+    "AND (publish_at > NOW() OR lease_expires_at > NOW())"
+)
+
+
+# A row is only published in the first two thirds of its lease; the rest is left for the broker confirm
+PUBLISH_LEASE_FRACTION = 2 / 3
+
+
+class DestinationPipeline:
+    """Fetch → publish → ack stages for one destination queue, all running concurrently.
+
+    The fetch stage keeps the publish lanes topped up while earlier messages
+    are still waiting on broker confirms, and acks are flushed to the
+    database in batches. Each lane publishes one message at a time, and an
+    instance's rows always go to the same lane, so they are published in
+    order. The lanes are bounded, but a slow broker can still hold leased
+    rows back: a row whose lease is running out is released unpublished
+    instead, so it is never published after another relay may have claimed
+    it.
+    """
+
+    def __init__(self, relay: "AsyncRelay", destination: str, task_name: str):
+        self.relay = relay
+        self.destination = destination
+        self.task_name = task_name
+        self.wake = asyncio.Event()
+        lane_size = max(1, relay.batch_size * 2 // relay.publish_concurrency)
+        # (row, monotonic time its lease must be published by)
+        self.lanes: list[asyncio.Queue] = [asyncio.Queue(maxsize=lane_size) for _ in range(relay.publish_concurrency)]
+        self.ack_queue: asyncio.Queue = asyncio.Queue()
+        self.release_queue: asyncio.Queue = asyncio.Queue()
+        self.channel = None
+        self.exchange = None
+
+    async def start(self, amqp_connection) -> list[asyncio.Task]:
+        # A confirm-mode channel of its own, so other destinations' confirms never hold this one up
+        self.channel = await amqp_connection.channel(publisher_confirms=True)
+        self.exchange = self.channel.default_exchange
+        tasks = [
+            asyncio.create_task(self.fetch_loop(), name=f"fetch:{self.destination}"),
+            asyncio.create_task(
+                self.settle_loop(self.ack_queue, COMPLETE_SQL, "Relayed messages.", outbox_relayed_total),
+                name=f"ack:{self.destination}",
+            ),
+            asyncio.create_task(
+                self.settle_loop(self.release_queue, RELEASE_SQL, "Released unpublished messages."),
+                name=f"release:{self.destination}",
+            ),
+        ]
+        for i, lane in enumerate(self.lanes):
+            tasks.append(asyncio.create_task(self.publish_loop(lane), name=f"publish:{self.destination}:{i}"))
+        return tasks
+
+    async def fetch_loop(self) -> None:
+        relay = self.relay
+        while True:
+            try:
+                # Cleared before the claim so a notify that lands mid-claim still wakes us
+                self.wake.clear()
+                # Taken before the claim, so the local deadline is never later than the lease's expiry
+                publish_by = time.monotonic() + relay.lease_seconds * PUBLISH_LEASE_FRACTION
+                async with relay.pool.acquire() as conn:
+                    rows = await conn.fetch(CLAIM_SQL, relay.relay_id, relay.lease_seconds, self.destination, relay.batch_size)
+                if rows:
+                    outbox_relay_batch_size.labels(destination=self.destination).observe(len(rows))
+                    lag = outbox_relay_lag_seconds.labels(destination=self.destination)
+                    for row in rows:
+                        lag.observe(max(row["lag_seconds"], 0.0))
+                for row in sorted(rows, key=lambda r: r["publish_at"]):
+                    await self.lane_for(row).put((row, publish_by))
+                if len(rows) == relay.batch_size:
+                    continue
+
+                timeout = relay.safety_poll_seconds
+                async with relay.pool.acquire() as conn:
+                    next_due = await conn.fetchval(NEXT_DUE_SQL, self.destination)
+                if next_due is not None:
+                    timeout = min(timeout, max(next_due, 0.0))
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.error("Relay fetch failed; retrying in 5 seconds.", destination=self.destination, exc_info=True)
+                await asyncio.sleep(5)
+
+    def lane_for(self, row) -> asyncio.Queue:
+        instance_id = str(self.payload(row).get("instance_id") or row["id"])
+        return self.lanes[zlib.crc32(instance_id.encode()) % len(self.lanes)]
+
+    async def publish_loop(self, lane: asyncio.Queue) -> None:
+        while True:
+            row, publish_by = await lane.get()
+            msg_id = str(row["id"])
+            started = time.monotonic()
+            if started >= publish_by:
+                log.warning("Lease ran short before publishing; releasing.", msg_id=msg_id, destination=self.destination)
+                await self.release_queue.put(msg_id)
+                continue
+            try:
+                routing_key = route_queue(self.destination, self.payload(row))
+                await self.exchange.publish(self.build_message(row), routing_key=routing_key)
+                outbox_publish_duration_seconds.labels(destination=self.destination).observe(time.monotonic() - started)
+                await self.ack_queue.put(msg_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Failed to publish; will retry later.", msg_id=msg_id, destination=self.destination, error=str(e))
+                outbox_publish_failures_total.labels(destination=self.destination).inc()
+                await self.release_queue.put(msg_id)
+
+    async def settle_loop(self, queue: asyncio.Queue, sql: str, message: str, counter=None) -> None:
+        relay = self.relay
+        while True:
+            ids = [await queue.get()]
+            # Gather whatever else settles within the flush window into one UPDATE
+            deadline = time.monotonic() + relay.ack_flush_seconds
+            while len(ids) < relay.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    ids.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                async with relay.pool.acquire() as conn:
+                    await conn.execute(sql, ids, relay.relay_id)
+                log.info(message, destination=self.destination, count=len(ids))
+                if counter is not None:
+                    counter.labels(destination=self.destination).inc(len(ids))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Leases lapse on their own; the rows are picked up again after expiry
+                log.error("Failed to settle outbox rows.", destination=self.destination, count=len(ids), exc_info=True)
+
+    @staticmethod
+    def payload(row) -> dict:
+        payload = row["payload"]
+        return json.loads(payload) if isinstance(payload, str) else payload
+
+    def build_message(self, row) -> aio_pika.Message:
+        payload = self.payload(row)
+
+        task_message = self.relay.celery_app.amqp.as_task_v2(
+            str(row["id"]), self.task_name, args=[payload], kwargs={}, ignore_result=True,
+        )
+        headers = dict(task_message.headers)
+        if row["request_id"]:
+            headers["request_id"] = row["request_id"]
+        content_type, content_encoding, body = dumps(task_message.body, serializer="json")
+
+        return aio_pika.Message(
+            body=body.encode(content_encoding) if isinstance(body, str) else body,
+            headers=headers,
+            content_type=content_type,
+            content_encoding=content_encoding,
+            correlation_id=task_message.properties["correlation_id"],
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+
+
+class AsyncRelay:
+    """Asyncio outbox relay: one concurrent fetch/publish/ack pipeline per destination.
+
+    Destinations never share a pipeline, so a backlog of delayed action
+    messages cannot hold up orchestration events. Uses asyncpg for
+    PostgreSQL and aio-pika (with publisher confirms) for RabbitMQ.
+    """
+
+    def __init__(self, celery_app, dsn: str, amqp_url: str, batch_size: int = 100,
+                 publish_concurrency: int = 64, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                 safety_poll_seconds: float = 5.0, ack_flush_seconds: float = 0.01,
+                 backlog_interval_seconds: float = 15, relay_id: str = None, partitions=None):
+        self.celery_app = celery_app
+        self.dsn = dsn
+        self.amqp_url = amqp_url
+        self.batch_size = batch_size
+        self.publish_concurrency = publish_concurrency
+        self.lease_seconds = lease_seconds
+        self.safety_poll_seconds = safety_poll_seconds
+        self.ack_flush_seconds = ack_flush_seconds
+        self.backlog_interval_seconds = backlog_interval_seconds
+        self.relay_id = relay_id or default_relay_id()
+        self.partitions = partitions
+        self.pool = None
+        self.pipelines = [
+            DestinationPipeline(self, destination, task_name)
+            for destination, task_name in TASK_ROUTING.items()
+        ]
+
+    async def run(self) -> None:
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=2, max_size=2 + 3 * len(self.pipelines))
+        listen_conn = await asyncpg.connect(self.dsn)
+        amqp_connection = await aio_pika.connect_robust(self.amqp_url)
+
+        await listen_conn.add_listener(OUTBOX_CHANNEL, self._on_notify)
+        log.info("Async relay started", relay_id=self.relay_id, destinations=[p.destination for p in self.pipelines])
+
+        tasks = []
+        try:
+            for pipeline in self.pipelines:
+                tasks.extend(await pipeline.start(amqp_connection))
+            tasks.append(asyncio.create_task(self._backlog_loop(), name="backlog"))
+            if self.partitions is not None:
+                tasks.append(asyncio.create_task(self._maintenance_loop(), name="partitions"))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await listen_conn.close()
+            await amqp_connection.close()
+            await self.pool.close()
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        for pipeline in self.pipelines:
+            pipeline.wake.set()
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            await asyncio.to_thread(self.partitions.run_if_due)
+            await asyncio.sleep(60)
+
+    async def _backlog_loop(self) -> None:
+        while True:
+            try:
+                async with self.pool.acquire() as conn:
+                    record_backlog(await conn.fetch(BACKLOG_SQL))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.error("Failed to sample outbox backlog.", exc_info=True)
+            await asyncio.sleep(self.backlog_interval_seconds)
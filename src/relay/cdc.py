@@ -0,0 +1,289 @@
+import heapq
+import json
+import select
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+
+from src.shared.logging_config import log
+from src.shared.db import db_cursor, get_connection_string
+from src.shared.outbox import TASK_ROUTING
+from src.shared.publisher import ConfirmingPublisher, OutboundMessage
+from src.shared.metrics import (
+    outbox_relay_lag_seconds,
+    outbox_relayed_total,
+    outbox_publish_failures_total,
+    outbox_publish_duration_seconds,
+)
+from src.relay.pgoutput import PgOutputDecoder, Begin, Commit, Insert
+
+
+PUBLICATION = "outbox_publication"
+DEFAULT_SLOT = "outbox_relay"
+
+# A row written with a deliberate delay. Those are published from an
+# in-memory schedule long after the slot has moved past them, so they keep
+# per-row processed_at bookkeeping; everything else is tracked by LSN alone.
+DELAY_THRESHOLD = timedelta(seconds=1)
+DELAYED_PENDING_FILTER = "processed_at IS NULL AND publish_at - created_at > interval '1 second'"
+
+
+def parse_timestamp(value: str | None) -> datetime | None:
+    if value is None:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def is_delayed(publish_at: datetime, created_at: datetime | None) -> bool:
+    if created_at is None:
+        return publish_at > datetime.now(timezone.utc)
+    return publish_at - created_at > DELAY_THRESHOLD
+
+
+class DelayedScheduler:
+    """Min-heap of delayed outbox messages keyed by publish_at, deduplicated by id."""
+
+    def __init__(self):
+        self._heap = []
+        self._ids = set()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, publish_at: datetime, message: OutboundMessage) -> None:
+        if message.id in self._ids:
+            return
+        self._ids.add(message.id)
+        heapq.heappush(self._heap, (publish_at, message.id, message))
+
+    def pop_due(self, now: datetime, limit: int) -> list[OutboundMessage]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < limit:
+            _, msg_id, message = heapq.heappop(self._heap)
+            self._ids.discard(msg_id)
+            due.append(message)
+        return due
+
+    def seconds_until_next(self, now: datetime) -> float | None:
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - now).total_seconds(), 0.0)
+
+
+class CdcRelay:
+    """Relays outbox inserts read from a logical replication slot instead of polling the table.
+
+    Inserts arrive in commit order through the `pgoutput` plugin. Immediate
+    rows are published in batches and acknowledged by advancing the slot's
+    flush LSN once every row up to that commit is confirmed by the broker,
+    so the outbox sees no SELECT or UPDATE for them. Delayed rows go to a
+    local scheduler and are marked processed when sent; on startup the
+    scheduler is rebuilt from the unprocessed delayed rows in the table.
+    """
+
+    def __init__(self, celery_app, slot_name: str = DEFAULT_SLOT, batch_size: int = 100,
+                 publisher: ConfirmingPublisher = None, status_interval: float = 10.0,
+                 retry_seconds: float = 1.0):
+        self.celery_app = celery_app
+        self.slot_name = slot_name
+        self.batch_size = batch_size
+        self.publisher = publisher or ConfirmingPublisher(celery_app)
+        self.status_interval = status_interval
+        self.retry_seconds = retry_seconds
+        self.decoder = PgOutputDecoder()
+        self.scheduler = DelayedScheduler()
+        # (commit end LSN, unconfirmed immediate messages of that transaction), in commit order
+        self.pending: deque = deque()
+        self._txn_immediate = None
+        self._txn_delayed = None
+        self.conn = None
+        self.cursor = None
+
+    def connect(self) -> None:
+        self.conn = psycopg2.connect(
+            get_connection_string(),
+            connection_factory=psycopg2.extras.LogicalReplicationConnection,
+        )
+        self.cursor = self.conn.cursor()
+        try:
+            self.cursor.create_replication_slot(self.slot_name, output_plugin="pgoutput")
+            log.info("Created replication slot", slot=self.slot_name)
+        except psycopg2.errors.DuplicateObject:
+            pass
+        self.cursor.start_replication(
+            slot_name=self.slot_name,
+            decode=False,
+            options={"proto_version": "1", "publication_names": PUBLICATION},
+            status_interval=self.status_interval,
+        )
+        # The slot resumes at its last flushed commit; anything after it is replayed
+        self.decoder = PgOutputDecoder()
+        self.pending.clear()
+        self._txn_immediate = self._txn_delayed = None
+        log.info("Streaming outbox changes", slot=self.slot_name, publication=PUBLICATION)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+        self.cursor = None
+
+    def rehydrate(self) -> int:
+        """Load unprocessed delayed rows into the scheduler."""
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, destination, payload, request_id, publish_at FROM outbox "
+                f"WHERE {DELAYED_PENDING_FILTER}"
+            )
+            rows = cur.fetchall()
+        for row in rows:
+            message = self._to_message(str(row["id"]), row["destination"], row["payload"], row["request_id"])
+            if message:
+                self.scheduler.add(row["publish_at"], message)
+        log.info("Rehydrated delayed outbox messages", count=len(rows))
+        return len(rows)
+
+    def run_once(self, max_wait: float) -> None:
+        """Read what the stream has, publish due work, then wait for more for at most `max_wait`."""
+        if self.conn is None:
+            self.connect()
+            self.rehydrate()
+
+        drained = False
+        while self._pending_count() < self.batch_size:
+            msg = self.cursor.read_message()
+            if msg is None:
+                drained = True
+                break
+            self.handle(msg.payload)
+
+        self.flush_pending()
+        self.publish_due_delayed()
+
+        if self.pending:
+            # Some messages were not confirmed; retry soon rather than waiting for new input
+            time.sleep(self.retry_seconds)
+            return
+        if not drained:
+            return
+
+        if self._txn_immediate is None:
+            # Everything the server has sent is published; let it recycle WAL up to here
+            self.cursor.send_feedback(flush_lsn=self.cursor.wal_end)
+
+        timeout = max_wait
+        next_due = self.scheduler.seconds_until_next(datetime.now(timezone.utc))
+        if next_due is not None:
+            timeout = min(timeout, next_due)
+        select.select([self.cursor], [], [], timeout)
+
+    def handle(self, data: bytes) -> None:
+        message = self.decoder.decode(data)
+        if isinstance(message, Begin):
+            self._txn_immediate, self._txn_delayed = [], []
+        elif isinstance(message, Insert):
+            self._handle_insert(message)
+        elif isinstance(message, Commit):
+            self.pending.append((message.end_lsn, self._txn_immediate or []))
+            for publish_at, delayed in self._txn_delayed or []:
+                self.scheduler.add(publish_at, delayed)
+            self._txn_immediate = self._txn_delayed = None
+
+    def _handle_insert(self, insert: Insert) -> None:
+        if insert.relation.name != "outbox":
+            return
+        values = insert.values
+        message = self._to_message(values["id"], values["destination"], values["payload"], values["request_id"])
+        if message is None:
+            return
+
+        publish_at = parse_timestamp(values["publish_at"])
+        if is_delayed(publish_at, parse_timestamp(values.get("created_at"))):
+            self._txn_delayed.append((publish_at, message))
+            return
+
+        lag = (datetime.now(timezone.utc) - publish_at).total_seconds()
+        outbox_relay_lag_seconds.labels(destination=message.queue).observe(max(lag, 0.0))
+        self._txn_immediate.append(message)
+
+    def flush_pending(self) -> None:
+        """Publish buffered immediate messages and advance the slot past fully confirmed commits."""
+        messages = [m for _, batch in self.pending for m in batch]
+        confirmed = set(self._publish(messages)) if messages else set()
+
+        flushed_lsn = None
+        blocked = False
+        remaining = deque()
+        for lsn, batch in self.pending:
+            unconfirmed = [m for m in batch if m.id not in confirmed]
+            if unconfirmed:
+                blocked = True
+            if blocked:
+                remaining.append((lsn, unconfirmed))
+            else:
+                flushed_lsn = lsn
+        self.pending = remaining
+
+        if flushed_lsn is not None:
+            self.cursor.send_feedback(flush_lsn=flushed_lsn)
+
+    def publish_due_delayed(self) -> None:
+        due = self.scheduler.pop_due(datetime.now(timezone.utc), self.batch_size)
+        if not due:
+            return
+
+        confirmed = self._publish(due)
+        if confirmed:
+            with db_cursor() as cur:
+                cur.execute(
+                    "UPDATE outbox SET processed_at = NOW() WHERE id = ANY(%s::uuid[])",
+                    (confirmed,)
+                )
+
+        confirmed_set = set(confirmed)
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=self.retry_seconds)
+        for message in due:
+            if message.id not in confirmed_set:
+                self.scheduler.add(retry_at, message)
+
+    def _publish(self, messages: list[OutboundMessage]) -> list[str]:
+        started = time.monotonic()
+        confirmed = self.publisher.publish_batch(messages)
+        elapsed = time.monotonic() - started
+
+        confirmed_set = set(confirmed)
+        for destination in {m.queue for m in messages}:
+            outbox_publish_duration_seconds.labels(destination=destination).observe(elapsed)
+        for m in messages:
+            if m.id in confirmed_set:
+                outbox_relayed_total.labels(destination=m.queue).inc()
+            else:
+                outbox_publish_failures_total.labels(destination=m.queue).inc()
+        if confirmed:
+            log.info("Relayed messages.", count=len(confirmed))
+        return confirmed
+
+    def _to_message(self, msg_id: str, destination: str, payload, request_id: str | None) -> OutboundMessage | None:
+        task_name = TASK_ROUTING.get(destination)
+        if not task_name:
+            log.error("No task mapping for destination; skipping.", destination=destination, msg_id=msg_id)
+            return None
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        return OutboundMessage(
+            id=msg_id,
+            task_name=task_name,
+            queue=destination,
+            payload=payload,
+            headers={"request_id": request_id} if request_id else {},
+        )
+
+    def _pending_count(self) -> int:
+        return sum(len(batch) for _, batch in self.pending)
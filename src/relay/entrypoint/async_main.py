@@ -0,0 +1,51 @@
+import asyncio
+import os
+import structlog
+from prometheus_client import start_http_server
+
+from src.shared.logging_config import setup_logging
+from src.shared.celery_app import app as celery_app
+from src.shared.db import get_connection_string
+from src.relay.async_engine import AsyncRelay
+from src.relay.partitions import OutboxPartitionManager
+
+setup_logging()
+log = structlog.get_logger()
+
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+RELAY_BATCH_SIZE = int(os.getenv("RELAY_BATCH_SIZE", "100"))
+# Publishes awaiting a broker confirm at once, per destination
+RELAY_PUBLISH_CONCURRENCY = int(os.getenv("RELAY_PUBLISH_CONCURRENCY", "64"))
+RELAY_LEASE_SECONDS = int(os.getenv("RELAY_LEASE_SECONDS", "30"))
+SAFETY_POLL_SECONDS = int(os.getenv("RELAY_SAFETY_POLL_MS", "5000")) / 1000
+RELAY_METRICS_PORT = int(os.getenv("RELAY_METRICS_PORT", "9102"))
+RELAY_BACKLOG_INTERVAL_SECONDS = int(os.getenv("RELAY_BACKLOG_INTERVAL_SECONDS", "15"))
+
+OUTBOX_PARTITION_PREMAKE_DAYS = int(os.getenv("OUTBOX_PARTITION_PREMAKE_DAYS", "3"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "2"))
+
+
+def main():
+  partitions = OutboxPartitionManager(
+    premake_days=OUTBOX_PARTITION_PREMAKE_DAYS,
+    retention_days=OUTBOX_RETENTION_DAYS,
+  )
+  relay = AsyncRelay(
+    celery_app,
+    dsn=get_connection_string(),
+    amqp_url=RABBITMQ_URL,
+    batch_size=RELAY_BATCH_SIZE,
+    publish_concurrency=RELAY_PUBLISH_CONCURRENCY,
+    lease_seconds=RELAY_LEASE_SECONDS,
+    safety_poll_seconds=SAFETY_POLL_SECONDS,
+    backlog_interval_seconds=RELAY_BACKLOG_INTERVAL_SECONDS,
+    partitions=partitions,
+  )
+
+  start_http_server(RELAY_METRICS_PORT)
+  log.info("Async relay service starting", batch_size=RELAY_BATCH_SIZE, publish_concurrency=RELAY_PUBLISH_CONCURRENCY)
+  asyncio.run(relay.run())
+
+
+if __name__ == '__main__':
+  main()
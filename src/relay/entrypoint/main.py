@@ -1,29 +1,138 @@
+import os
 import time
 import structlog
+from prometheus_client import start_http_server
 
 from src.shared.logging_config import setup_logging
 from src.shared.celery_app import app as celery_app
-from src.relay.service import RelayService
+from src.relay.service import RelayService, default_relay_id
+from src.relay.listener import OutboxListener, wait_timeout
+from src.relay.partitions import OutboxPartitionManager
+from src.relay.cdc import CdcRelay, DEFAULT_SLOT, DELAYED_PENDING_FILTER
+from src.relay.sharding import ShardCoordinator
 
 setup_logging()
 log = structlog.get_logger()
 
-POLL_INTERVAL_SECONDS = 1.0
+# "poll" sleeps a fixed interval when idle; "notify" wakes on outbox inserts (LISTEN/NOTIFY);
+# "cdc" streams inserts from a logical replication slot
+RELAY_MODE = os.getenv("RELAY_MODE", "poll").lower()
+RELAY_BATCH_SIZE = int(os.getenv("RELAY_BATCH_SIZE", "100"))
+POLL_INTERVAL_SECONDS = int(os.getenv("RELAY_POLL_INTERVAL_MS", "1000")) / 1000
+# In notify mode, the slow poll that catches missed notifications
+SAFETY_POLL_SECONDS = int(os.getenv("RELAY_SAFETY_POLL_MS", "5000")) / 1000
+RELAY_LEASE_SECONDS = int(os.getenv("RELAY_LEASE_SECONDS", "30"))
+RELAY_CDC_SLOT = os.getenv("RELAY_CDC_SLOT", DEFAULT_SLOT)
+# Replicas split the outbox's 64 shards between them instead of racing on one range
+RELAY_SHARDING = os.getenv("RELAY_SHARDING", "false").lower() == "true"
+RELAY_SHARD_LEASE_SECONDS = int(os.getenv("RELAY_SHARD_LEASE_SECONDS", "15"))
+ERROR_BACKOFF_SECONDS = 5
+RELAY_METRICS_PORT = int(os.getenv("RELAY_METRICS_PORT", "9102"))
+RELAY_BACKLOG_INTERVAL_SECONDS = int(os.getenv("RELAY_BACKLOG_INTERVAL_SECONDS", "15"))
 
+OUTBOX_PARTITION_PREMAKE_DAYS = int(os.getenv("OUTBOX_PARTITION_PREMAKE_DAYS", "3"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "2"))
 
-def main():
-  service = RelayService(celery_app)
-
-  log.info("Relay service started")
 
+def run_polling(service: RelayService, partitions: OutboxPartitionManager):
   while True:
     try:
+      partitions.run_if_due()
+      service.sample_backlog_if_due()
+      if service.shards is not None:
+        service.shards.run_if_due()
       processed = service.relay_messages()
       if processed == 0:
         time.sleep(POLL_INTERVAL_SECONDS)
     except Exception:
       log.error("Relay error; retrying in 5 seconds.", exc_info=True)
-      time.sleep(5)
+      time.sleep(ERROR_BACKOFF_SECONDS)
+
+
+def run_notify(service: RelayService, partitions: OutboxPartitionManager):
+  listener = OutboxListener()
+
+  while True:
+    try:
+      partitions.run_if_due()
+      service.sample_backlog_if_due()
+      if service.shards is not None:
+        service.shards.run_if_due()
+
+      # Subscribe before the first scan so no insert can slip in between
+      if listener.conn is None:
+        listener.connect()
+
+      if service.relay_messages() > 0:
+        continue
+
+      listener.wait(wait_timeout(service.seconds_until_next_due(), SAFETY_POLL_SECONDS))
+    except Exception:
+      log.error("Relay error; retrying in 5 seconds.", exc_info=True)
+      listener.close()
+      time.sleep(ERROR_BACKOFF_SECONDS)
+
+
+def run_cdc(partitions: OutboxPartitionManager):
+  relay = CdcRelay(celery_app, slot_name=RELAY_CDC_SLOT, batch_size=RELAY_BATCH_SIZE)
+
+  while True:
+    try:
+      partitions.run_if_due()
+      relay.run_once(SAFETY_POLL_SECONDS)
+    except Exception:
+      log.error("Relay error; retrying in 5 seconds.", exc_info=True)
+      relay.close()
+      time.sleep(ERROR_BACKOFF_SECONDS)
+
+
+def main():
+  start_http_server(RELAY_METRICS_PORT)
+
+  if RELAY_MODE == "cdc":
+    # Immediate rows are never marked processed in this mode; only delayed ones hold a partition back
+    partitions = OutboxPartitionManager(
+      premake_days=OUTBOX_PARTITION_PREMAKE_DAYS,
+      retention_days=OUTBOX_RETENTION_DAYS,
+      pending_filter=DELAYED_PENDING_FILTER,
+    )
+    log.info("Relay service started", mode=RELAY_MODE, batch_size=RELAY_BATCH_SIZE, slot=RELAY_CDC_SLOT)
+    run_cdc(partitions)
+    return
+
+  relay_id = default_relay_id()
+  shards = None
+  if RELAY_SHARDING:
+    shards = ShardCoordinator(
+      relay_id,
+      lease_seconds=RELAY_SHARD_LEASE_SECONDS,
+      heartbeat_seconds=RELAY_SHARD_LEASE_SECONDS / 3,
+    )
+
+  service = RelayService(
+    celery_app,
+    batch_size=RELAY_BATCH_SIZE,
+    relay_id=relay_id,
+    lease_seconds=RELAY_LEASE_SECONDS,
+    backlog_interval_seconds=RELAY_BACKLOG_INTERVAL_SECONDS,
+    shards=shards,
+  )
+  partitions = OutboxPartitionManager(
+    premake_days=OUTBOX_PARTITION_PREMAKE_DAYS,
+    retention_days=OUTBOX_RETENTION_DAYS,
+  )
+
+  log.info("Relay service started", mode=RELAY_MODE, batch_size=RELAY_BATCH_SIZE,
+           relay_id=service.relay_id, sharded=RELAY_SHARDING)
+
+  try:
+    if RELAY_MODE == "notify":
+      run_notify(service, partitions)
+    else:
+      run_polling(service, partitions)
+  finally:
+    if shards is not None:
+      shards.leave()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,48 @@
+import os
+import time
+import structlog
+from prometheus_client import start_http_server
+
+from src.shared.logging_config import setup_logging
+from src.shared.timers import TIMERS_CHANNEL
+from src.relay.listener import OutboxListener, wait_timeout
+from src.relay.timers import TimerService
+
+setup_logging()
+log = structlog.get_logger()
+
+TIMER_BATCH_SIZE = int(os.getenv("TIMER_BATCH_SIZE", "500"))
+# Longest sleep while no timer is due, in case a notification was missed
+TIMER_SAFETY_POLL_SECONDS = int(os.getenv("TIMER_SAFETY_POLL_MS", "5000")) / 1000
+TIMER_METRICS_PORT = int(os.getenv("TIMER_METRICS_PORT", "9103"))
+ERROR_BACKOFF_SECONDS = 5
+
+
+def run(service: TimerService):
+  # Woken when a timer is set or moved, since it may now be the earliest
+  listener = OutboxListener(channel=TIMERS_CHANNEL)
+
+  while True:
+    try:
+      # Subscribe before the first scan so no new timer can slip in between
+      if listener.conn is None:
+        listener.connect()
+
+      if service.fire_due() >= service.batch_size:
+        continue
+
+      listener.wait(wait_timeout(service.seconds_until_next(), TIMER_SAFETY_POLL_SECONDS))
+    except Exception:
+      log.error("Timer service error; retrying in 5 seconds.", exc_info=True)
+      listener.close()
+      time.sleep(ERROR_BACKOFF_SECONDS)
+
+
+def main():
+  start_http_server(TIMER_METRICS_PORT)
+  log.info("Timer service started", batch_size=TIMER_BATCH_SIZE)
+  run(TimerService(batch_size=TIMER_BATCH_SIZE))
+
+
+if __name__ == '__main__':
+  main()
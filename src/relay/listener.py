@@ -0,0 +1,59 @@
+import select
+
+import psycopg2
+import psycopg2.extensions
+
+from src.shared.logging_config import log
+from src.shared.db import get_connection_string
+
+
+OUTBOX_CHANNEL = "outbox_ready"
+
+
+def wait_timeout(next_due: float | None, safety_seconds: float) -> float:
+    """How long to wait for a notification: until the next scheduled row is due, at most `safety_seconds`."""
+    return safety_seconds if next_due is None else min(safety_seconds, next_due)
+
+
+class OutboxListener:
+    """Holds a dedicated autocommit connection subscribed to outbox insert notifications.
+
+    The connection is kept out of the shared pool: a LISTEN is bound to the
+    session, and pooled connections are handed to other callers between uses.
+    """
+
+    def __init__(self, channel: str = OUTBOX_CHANNEL):
+        self.channel = channel
+        self.conn = None
+
+    def connect(self) -> None:
+        self.conn = psycopg2.connect(get_connection_string())
+        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel};")
+        log.info("Listening for outbox notifications", channel=self.channel)
+
+    def wait(self, timeout: float) -> bool:
+        """Block until a notification arrives or `timeout` seconds pass. Returns True if notified."""
+        if self.conn is None:
+            self.connect()
+
+        # Notifications may already have been read off the socket by an earlier poll()
+        self.conn.poll()
+        if not self.conn.notifies:
+            readable, _, _ = select.select([self.conn], [], [], max(timeout, 0))
+            if not readable:
+                return False
+            self.conn.poll()
+
+        notified = bool(self.conn.notifies)
+        self.conn.notifies.clear()
+        return notified
+
+    def close(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
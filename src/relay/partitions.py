@@ -0,0 +1,112 @@
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from src.shared.logging_config import log
+from src.shared.db import db_cursor
+
+
+PARTITION_NAME_PATTERN = re.compile(r"^outbox_p(\d{8})$")
+
+# Rows the relay still owes the broker. The CDC relay tracks progress by slot
+# LSN instead and passes its own filter (see src/relay/cdc.py).
+UNPROCESSED_FILTER = "processed_at IS NULL"
+
+
+def partition_day(name: str) -> date | None:
+    """Return the UTC day covered by a daily outbox partition name, or None for other tables."""
+    match = PARTITION_NAME_PATTERN.match(name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d").date()
+
+
+class OutboxPartitionManager:
+    """Keeps the outbox's daily partitions ahead of time and retires old ones whole.
+
+    Retiring a partition is a DETACH + DROP instead of a bulk DELETE, so
+    processed rows leave without dead tuples, vacuum work or index bloat on
+    the live partitions. A partition is only dropped once it is past the
+    retention window and holds no unprocessed row.
+    """
+
+    def __init__(self, premake_days: int = 3, retention_days: int = 2,
+                 interval_seconds: float = 3600, lock_timeout_ms: int = 2000,
+                 pending_filter: str = UNPROCESSED_FILTER):
+        self.premake_days = premake_days
+        self.retention_days = retention_days
+        self.interval_seconds = interval_seconds
+        self.lock_timeout_ms = lock_timeout_ms
+        self.pending_filter = pending_filter
+        self._last_run = None
+
+    def run_if_due(self) -> None:
+        now = time.monotonic()
+        if self._last_run is not None and now - self._last_run < self.interval_seconds:
+            return
+        self._last_run = now
+        try:
+            self.ensure_partitions()
+            self.drop_expired_partitions()
+            self.purge_default_partition()
+        except Exception:
+            log.error("Outbox partition maintenance failed; will retry next interval.", exc_info=True)
+
+    def ensure_partitions(self, today: date = None) -> list[str]:
+        today = today or datetime.now(timezone.utc).date()
+        created = []
+        for offset in range(self.premake_days + 1):
+            with db_cursor() as cur:
+                cur.execute(
+                    "SELECT outbox_ensure_partition(%s) AS name",
+                    (today + timedelta(days=offset),)
+                )
+                created.append(cur.fetchone()["name"])
+        return created
+
+    def expired_partitions(self, partitions: list[str], today: date = None) -> list[str]:
+        """Partitions whose whole day range ends before the retention cutoff."""
+        today = today or datetime.now(timezone.utc).date()
+        cutoff = today - timedelta(days=self.retention_days)
+        expired = []
+        for name in partitions:
+            day = partition_day(name)
+            if day is not None and day + timedelta(days=1) <= cutoff:
+                expired.append(name)
+        return sorted(expired)
+
+    def drop_expired_partitions(self, today: date = None) -> list[str]:
+        dropped = []
+        for name in self.expired_partitions(self.list_partitions(), today):
+            with db_cursor() as cur:
+                # Fail fast rather than queue an exclusive lock behind the relay's traffic
+                cur.execute("SET LOCAL lock_timeout = %s", (f"{self.lock_timeout_ms}ms",))
+                cur.execute(f'SELECT 1 FROM "{name}" WHERE {self.pending_filter} LIMIT 1')
+                if cur.fetchone():
+                    log.warning("Expired outbox partition still has unprocessed rows; keeping it.", partition=name)
+                    continue
+                cur.execute(f'ALTER TABLE outbox DETACH PARTITION "{name}"')
+                cur.execute(f'DROP TABLE "{name}"')
+            dropped.append(name)
+            log.info("Dropped expired outbox partition.", partition=name)
+        return dropped
+
+    def purge_default_partition(self) -> int:
+        """Delete processed rows from outbox_default, which is never dropped."""
+        with db_cursor() as cur:
+            cur.execute(
+                "DELETE FROM outbox_default "
+                f"WHERE ({self.pending_filter}) IS NOT TRUE "
+                "AND COALESCE(processed_at, publish_at) < NOW() - make_interval(days => %s)",
+                (self.retention_days,)
+            )
+            return cur.rowcount
+
+    def list_partitions(self) -> list[str]:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT c.relname AS name "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'outbox'::regclass"
+            )
+            return [row["name"] for row in cur.fetchall()]
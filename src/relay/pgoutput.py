@@ -0,0 +1,100 @@
+import struct
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class Relation:
+    id: int
+    namespace: str
+    name: str
+    columns: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Begin:
+    final_lsn: int
+    xid: int
+
+
+@dataclass
+class Commit:
+    commit_lsn: int
+    end_lsn: int
+
+
+@dataclass
+class Insert:
+    relation: Relation
+    values: Dict[str, Optional[str]]
+
+
+class PgOutputDecoder:
+    """Decodes the pgoutput logical replication protocol (version 1).
+
+    Only what the outbox relay needs is decoded: relations, inserts and
+    transaction boundaries. Other message types come back as None. Column
+    values are returned in PostgreSQL text format; callers convert them.
+    """
+
+    def __init__(self):
+        self.relations: Dict[int, Relation] = {}
+
+    def decode(self, data: bytes):
+        kind = data[:1]
+        if kind == b"B":
+            final_lsn, _commit_ts, xid = struct.unpack_from("!QqI", data, 1)
+            return Begin(final_lsn=final_lsn, xid=xid)
+        if kind == b"C":
+            _flags, commit_lsn, end_lsn, _commit_ts = struct.unpack_from("!bQQq", data, 1)
+            return Commit(commit_lsn=commit_lsn, end_lsn=end_lsn)
+        if kind == b"R":
+            relation = self._decode_relation(data)
+            self.relations[relation.id] = relation
+            return relation
+        if kind == b"I":
+            return self._decode_insert(data)
+        return None
+
+    def _decode_relation(self, data: bytes) -> Relation:
+        (relation_id,) = struct.unpack_from("!I", data, 1)
+        offset = 5
+        namespace, offset = _read_string(data, offset)
+        name, offset = _read_string(data, offset)
+        offset += 1  # replica identity setting
+        (ncols,) = struct.unpack_from("!h", data, offset)
+        offset += 2
+
+        columns = []
+        for _ in range(ncols):
+            offset += 1  # flags
+            column, offset = _read_string(data, offset)
+            offset += 8  # type oid, type modifier
+            columns.append(column)
+        return Relation(id=relation_id, namespace=namespace, name=name, columns=columns)
+
+    def _decode_insert(self, data: bytes) -> Insert:
+        (relation_id,) = struct.unpack_from("!I", data, 1)
+        relation = self.relations[relation_id]
+        # data[5] is the 'N' (new tuple) marker
+        (ncols,) = struct.unpack_from("!h", data, 6)
+        offset = 8
+
+        values = {}
+        for column in relation.columns[:ncols]:
+            kind = data[offset:offset + 1]
+            offset += 1
+            if kind == b"t":
+                (length,) = struct.unpack_from("!i", data, offset)
+                offset += 4
+                values[column] = data[offset:offset + length].decode("utf-8")
+                offset += length
+            else:
+                # 'n' null, 'u' unchanged TOAST (never sent for an insert)
+                values[column] = None
+        return Insert(relation=relation, values=values)
+
+
+def _read_string(data: bytes, offset: int) -> tuple[str, int]:
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode("utf-8"), end + 1
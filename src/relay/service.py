@@ -1,62 +1,253 @@
+import os
+import socket
+import time
+import uuid
+
 from src.shared.logging_config import log
-from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
 from src.shared.db import db_cursor
+from src.shared.publisher import ConfirmingPublisher, OutboundMessage
+from src.shared.outbox import TASK_ROUTING
+from src.relay.sharding import ShardCoordinator
+from src.shared.metrics import (
+    outbox_relay_lag_seconds,
+    outbox_relay_batch_size,
+    outbox_publish_duration_seconds,
+    outbox_relayed_total,
+    outbox_publish_failures_total,
+    outbox_backlog,
+)
+
+
+DEFAULT_LEASE_SECONDS = 30
+
+# Served by the partial index on unprocessed rows; processed history is never scanned
+BACKLOG_SQL = (
+    "SELECT destination, "
+    "COUNT(*) FILTER (WHERE publish_at <= NOW()) AS due, "
+    "COUNT(*) FILTER (WHERE publish_at > NOW()) AS scheduled "
+    "FROM outbox WHERE processed_at IS NULL "
+    "GROUP BY destination"
+)
+
+
+def default_relay_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
 
-TASK_ROUTING = {
-    ORCHESTRATION_QUEUE: "engine.orchestrate",
-    ACTIONS_QUEUE: "worker.execute_action",
-}
+def record_backlog(rows) -> None:
+    """Set the backlog gauge from BACKLOG_SQL rows; routed destinations missing from them read 0."""
+    counts = {destination: (0, 0) for destination in TASK_ROUTING}
+    for row in rows:
+        counts[row["destination"]] = (row["due"], row["scheduled"])
+    for destination, (due, scheduled) in counts.items():
+        outbox_backlog.labels(destination=destination, state="due").set(due)
+        outbox_backlog.labels(destination=destination, state="scheduled").set(scheduled)
 
 
 class RelayService:
-    def __init__(self, celery_app, batch_size=100):
+    """Moves due outbox rows to the broker using short claim/complete transactions.
+
+    A cycle claims a batch by stamping a lease on the rows and commits at once,
+    publishes with no transaction open, then marks the confirmed rows
+    processed. Rows stay claimable by any replica once their lease expires, so
+    a relay that dies mid-batch delays its rows by at most the lease length.
+    """
+
+    def __init__(self, celery_app, batch_size=100, publisher: ConfirmingPublisher = None,
+                 relay_id: str = None, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+                 backlog_interval_seconds: float = 15, shards: ShardCoordinator = None):
         self.celery_app = celery_app
         self.batch_size = batch_size
+        self.publisher = publisher or ConfirmingPublisher(celery_app)
+        self.relay_id = relay_id or default_relay_id()
+        self.lease_seconds = lease_seconds
+        self.backlog_interval_seconds = backlog_interval_seconds
+        self.shards = shards
+        self._last_backlog_sample = None
 
     def relay_messages(self) -> int:
+        messages = self.claim_batch()
+        if not messages:
+            return 0
+
+        batch_counts = {}
+        for msg in messages:
+            destination = msg["destination"]
+            batch_counts[destination] = batch_counts.get(destination, 0) + 1
+            if msg.get("lag_seconds") is not None:
+                outbox_relay_lag_seconds.labels(destination=destination).observe(max(float(msg["lag_seconds"]), 0.0))
+        for destination, count in batch_counts.items():
+            outbox_relay_batch_size.labels(destination=destination).observe(count)
+
+        outbound = []
+        for msg in messages:
+            task_name = TASK_ROUTING.get(msg["destination"])
+            if not task_name:
+                # Left leased rather than released so it does not crowd every batch
+                log.error("No task mapping for destination; skipping.", destination=msg["destination"], msg_id=str(msg["id"]))
+                continue
+
+            headers = {}
+            if msg.get("request_id"):
+                headers["request_id"] = msg["request_id"]
+
+            outbound.append(OutboundMessage(
+                id=str(msg["id"]),
+                task_name=task_name,
+                queue=msg["destination"],
+                payload=msg["payload"],
+                headers=headers,
+            ))
+
+        started = time.monotonic()
+        processed_ids = self.publisher.publish_batch(outbound)
+        # Confirms arrive for the batch as a whole, so every destination in it sees the same latency
+        elapsed = time.monotonic() - started
+        for destination in {m.queue for m in outbound}:
+            outbox_publish_duration_seconds.labels(destination=destination).observe(elapsed)
+
+        if processed_ids:
+            self.complete(processed_ids)
+            log.info("Relayed messages.", count=len(processed_ids))
+
+        confirmed = set(processed_ids)
+        unconfirmed = [m.id for m in outbound if m.id not in confirmed]
+        for m in outbound:
+            if m.id in confirmed:
+                outbox_relayed_total.labels(destination=m.queue).inc()
+            else:
+                outbox_publish_failures_total.labels(destination=m.queue).inc()
+        if unconfirmed:
+            self.release(unconfirmed)
+
+        return len(processed_ids)
+
+    def claim_batch(self) -> list[dict]:
+        """Lease up to `batch_size` due rows to this relay and commit immediately."""
+        if self.shards is not None:
+            return self.claim_sharded_batch()
+
         with db_cursor() as cur:
             cur.execute(
-                "SELECT id, destination, payload, request_id "
-                "FROM outbox "
-                "WHERE processed_at IS NULL AND publish_at <= NOW() "
-                "ORDER BY publish_at "
-                "LIMIT %s "
-                "FOR UPDATE SKIP LOCKED",
-                (self.batch_size,)
+                "UPDATE outbox o "
+                "SET lease_owner = %s, lease_expires_at = NOW() + make_interval(secs => %s) "
+                "FROM ("
+                "  SELECT id, publish_at FROM outbox "
+                "  WHERE processed_at IS NULL AND publish_at <= NOW() "
+                "    AND (lease_expires_at IS NULL OR lease_expires_at < NOW()) "
+                "  ORDER BY publish_at "
+                "  LIMIT %s "
+                "  FOR UPDATE SKIP LOCKED"
+                ") claimable "
+                "WHERE o.id = claimable.id AND o.publish_at = claimable.publish_at "
+                "RETURNING o.id, o.destination, o.payload, o.request_id, o.publish_at, "
+                "EXTRACT(EPOCH FROM (NOW() - o.publish_at))::float8 AS lag_seconds",
+                (self.relay_id, self.lease_seconds, self.batch_size)
+            )
+            messages = cur.fetchall()
+        return sorted(messages, key=lambda m: m["publish_at"])
+
+    def claim_sharded_batch(self) -> list[dict]:
+        """Claim due rows from the shards this replica owns, oldest first.
+
+        A shard that still has rows leased by another relay (its previous
+        owner) is skipped until those leases settle or expire; claiming past
+        them could publish an instance's later event before its earlier one.
+        A row leased by a direct publisher fences only its own instance,
+        since direct publishes are frequent and short: that instance's other
+        rows wait until the direct publish settles or its lease expires.
+        """
+        owned = self.shards.owned_shards()
+        if not owned:
+            return []
+
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT DISTINCT shard_key FROM outbox "
+                "WHERE processed_at IS NULL AND shard_key = ANY(%s::smallint[]) "
+                "AND lease_owner <> %s AND lease_owner NOT LIKE 'direct:%%' "
+                "AND lease_expires_at >= NOW()",
+                (owned, self.relay_id)
+            )
+            fenced = {row["shard_key"] for row in cur.fetchall()}
+            shards = [s for s in owned if s not in fenced]
+            if not shards:
+                return []
+
+            # No SKIP LOCKED: only the owner claims from a shard, and skipping a
+            # locked row would let a later row for the same instance go first
+            cur.execute(
+                "UPDATE outbox o "
+                "SET lease_owner = %s, lease_expires_at = NOW() + make_interval(secs => %s) "
+                "FROM ("
+                "  SELECT id, publish_at FROM outbox c "
+                "  WHERE processed_at IS NULL AND publish_at <= NOW() "
+                "    AND shard_key = ANY(%s::smallint[]) "
+                "    AND (lease_expires_at IS NULL OR lease_expires_at < NOW()) "
+                "    AND NOT EXISTS ("
+                "      SELECT 1 FROM outbox d "
+                "      WHERE d.processed_at IS NULL AND d.shard_key = c.shard_key "
+                "        AND d.lease_owner LIKE 'direct:%%' AND d.lease_expires_at >= NOW() "
+                "        AND d.payload->>'instance_id' = c.payload->>'instance_id'"
+                "    ) "
+                "  ORDER BY publish_at "
+                "  LIMIT %s "
+                "  FOR UPDATE OF c"
+                ") claimable "
+                "WHERE o.id = claimable.id AND o.publish_at = claimable.publish_at "
+                "RETURNING o.id, o.destination, o.payload, o.request_id, o.publish_at, "
+                "EXTRACT(EPOCH FROM (NOW() - o.publish_at))::float8 AS lag_seconds",
+                (self.relay_id, self.lease_seconds, shards, self.batch_size)
             )
             messages = cur.fetchall()
-            if not messages:
-                return 0
-
-            processed_ids = []
-            for msg in messages:
-                task_name = TASK_ROUTING.get(msg["destination"])
-                if not task_name:
-                    log.error("No task mapping for destination; skipping.", destination=msg["destination"], msg_id=str(msg["id"]))
-                    continue
-
-                try:
-                    headers = {}
-                    if msg.get("request_id"):
-                        headers["request_id"] = msg["request_id"]
-
-                    self.celery_app.send_task(
-                        name=task_name,
-                        args=[msg["payload"]],
-                        queue=msg["destination"],
-                        headers=headers
-                    )
-                    processed_ids.append(str(msg["id"]))
-                except Exception as e:
-                    log.error("Failed to send task; will retry later.", msg_id=str(msg["id"]), destination=msg["destination"], error=str(e))
-                    break
-
-            if processed_ids:
-                cur.execute(
-                    "UPDATE outbox SET processed_at = NOW() WHERE id = ANY(%s::uuid[])",
-                    (processed_ids,)
-                )
-                log.info("Relayed messages.", count=len(processed_ids))
-
-            return len(processed_ids)
+        return sorted(messages, key=lambda m: m["publish_at"])
+
+    def complete(self, ids: list[str]) -> None:
+        """Mark rows processed, provided this relay still holds their lease."""
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE outbox SET processed_at = NOW(), lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE id = ANY(%s::uuid[]) AND lease_owner = %s",
+                (ids, self.relay_id)
+            )
+
+    def release(self, ids: list[str]) -> None:
+        """Give up leases early so unconfirmed rows are retried on the next cycle."""
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE outbox SET lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE id = ANY(%s::uuid[]) AND lease_owner = %s",
+                (ids, self.relay_id)
+            )
+
+    def seconds_until_next_due(self) -> float | None:
+        """Seconds until the earliest future-dated unprocessed row is due, or None if there is none.
+
+        Computed on the database clock so the wakeup is not skewed by drift
+        between the relay host and PostgreSQL. Rows held under a lease count
+        as due when the lease expires.
+        """
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT EXTRACT(EPOCH FROM (MIN(GREATEST(publish_at, COALESCE(lease_expires_at, publish_at))) - NOW())) "
+                "AS wait_seconds "
+                "FROM outbox "
+                "WHERE processed_at IS NULL "
+                "AND (publish_at > NOW() OR lease_expires_at > NOW())"
+            )
+            row = cur.fetchone()
+        if not row or row["wait_seconds"] is None:
+            return None
+        return max(float(row["wait_seconds"]), 0.0)
+
+    def sample_backlog_if_due(self) -> None:
+        now = time.monotonic()
+        if self._last_backlog_sample is not None and now - self._last_backlog_sample < self.backlog_interval_seconds:
+            return
+        self._last_backlog_sample = now
+        try:
+            with db_cursor() as cur:
+                cur.execute(BACKLOG_SQL)
+                record_backlog(cur.fetchall())
+        except Exception:
+            log.error("Failed to sample outbox backlog.", exc_info=True)
@@ -0,0 +1,103 @@
+import time
+
+from src.shared.logging_config import log
+from src.shared.db import db_cursor
+from src.shared import partitioning
+
+
+# Fixed number of logical shards; must match the `& 63` in the outbox shard_key column
+SHARD_COUNT = 64
+
+
+def assign_shards(members: list[str], shard_count: int = SHARD_COUNT) -> dict[str, set[int]]:
+    return partitioning.assign_shards(members, shard_count)
+
+
+class ShardCoordinator:
+    """Lease-based shard ownership for sharded relay replicas.
+
+    Each replica heartbeats into `relay_members`, computes the shard
+    assignment from the live member list, then releases the shards it should
+    no longer hold and leases the ones it should. A shard only changes hands
+    once its previous owner releases it between cycles or its lease lapses,
+    so two replicas never publish the same shard at once.
+    """
+
+    def __init__(self, relay_id: str, shard_count: int = SHARD_COUNT,
+                 lease_seconds: int = 15, heartbeat_seconds: float = 5):
+        self.relay_id = relay_id
+        self.shard_count = shard_count
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.owned: set[int] = set()
+        self._last_run = None
+        self._valid_until = 0.0
+
+    def run_if_due(self) -> None:
+        now = time.monotonic()
+        if self._last_run is not None and now - self._last_run < self.heartbeat_seconds:
+            return
+        self._last_run = now
+        try:
+            members = self.heartbeat()
+            self.rebalance(members)
+            # Count from before the round trips; the database may have stamped the leases later
+            self._valid_until = now + self.lease_seconds
+        except Exception:
+            log.error("Shard heartbeat failed; will retry next interval.", exc_info=True)
+
+    def owned_shards(self) -> list[int]:
+        """Shards this replica may publish, or none once its leases may have lapsed."""
+        if time.monotonic() >= self._valid_until:
+            return []
+        return sorted(self.owned)
+
+    def heartbeat(self) -> list[str]:
+        """Renew this replica's membership and return the live members."""
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO relay_members (relay_id, expires_at) "
+                "VALUES (%s, NOW() + make_interval(secs => %s)) "
+                "ON CONFLICT (relay_id) DO UPDATE SET expires_at = EXCLUDED.expires_at",
+                (self.relay_id, self.lease_seconds)
+            )
+            cur.execute("DELETE FROM relay_members WHERE expires_at < NOW() - interval '1 minute'")
+            cur.execute("SELECT relay_id FROM relay_members WHERE expires_at > NOW() ORDER BY relay_id")
+            return [row["relay_id"] for row in cur.fetchall()]
+
+    def rebalance(self, members: list[str]) -> set[int]:
+        desired = assign_shards(members, self.shard_count).get(self.relay_id, set())
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE relay_shard_leases SET owner = NULL, expires_at = NULL "
+                "WHERE owner = %s AND NOT (shard = ANY(%s::smallint[]))",
+                (self.relay_id, sorted(desired))
+            )
+            cur.execute(
+                "INSERT INTO relay_shard_leases (shard, owner, expires_at) "
+                "SELECT s, %s, NOW() + make_interval(secs => %s) FROM unnest(%s::smallint[]) AS s "
+                "ON CONFLICT (shard) DO UPDATE SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at "
+                "WHERE relay_shard_leases.owner IS NULL "
+                "OR relay_shard_leases.owner = EXCLUDED.owner "
+                "OR relay_shard_leases.expires_at < NOW() "
+                "RETURNING shard",
+                (self.relay_id, self.lease_seconds, sorted(desired))
+            )
+            owned = {row["shard"] for row in cur.fetchall()}
+
+        if owned != self.owned:
+            log.info("Relay shard ownership changed", relay_id=self.relay_id,
+                     owned=len(owned), desired=len(desired), members=len(members))
+        self.owned = owned
+        return owned
+
+    def leave(self) -> None:
+        """Drop membership and hand every shard back, e.g. on shutdown."""
+        with db_cursor() as cur:
+            cur.execute("DELETE FROM relay_members WHERE relay_id = %s", (self.relay_id,))
+            cur.execute(
+                "UPDATE relay_shard_leases SET owner = NULL, expires_at = NULL WHERE owner = %s",
+                (self.relay_id,)
+            )
+        self.owned = set()
+        self._valid_until = 0.0
@@ -0,0 +1,67 @@
+"""
+Fires workflow timers by moving due rows of workflow_timers into the outbox.
+
+The engine writes delays, wait timeouts and retry backoffs to workflow_timers
+under ids it chooses (src/shared/timers.py), so until they fire they can be
+rescheduled with an upsert or cancelled with a delete. The fire_at index is
+the due-time queue: a cycle deletes the earliest due rows and inserts them
+into the outbox in the same statement, so each timer fires once even with
+several replicas running, and the outbox only ever holds messages that are
+due now.
+"""
+from typing import Optional
+
+from src.shared.logging_config import log
+from src.shared.db import db_cursor
+from src.shared.metrics import timers_fired_total, timer_fire_lag_seconds
+
+
+# clock_timestamp(), not NOW(): a long-lived transaction start must not hold timers back
+FIRE_SQL = (
+    "WITH due AS ("
+    "  DELETE FROM workflow_timers WHERE id IN ("
+    "    SELECT id FROM workflow_timers "
+    "    WHERE fire_at <= clock_timestamp() "
+    "    ORDER BY fire_at "
+    "    LIMIT %s "
+    "    FOR UPDATE SKIP LOCKED"
+    "  ) "
+    "  RETURNING destination, payload, request_id, fire_at"
+    "), sent AS ("
+    "  INSERT INTO outbox (destination, payload, request_id) "
+    "  SELECT destination, payload, request_id FROM due ORDER BY fire_at"
+    ") "
+    "SELECT destination, EXTRACT(EPOCH FROM (clock_timestamp() - fire_at))::float8 AS lag_seconds FROM due"
+)
+
+NEXT_DUE_SQL = (
+    "SELECT EXTRACT(EPOCH FROM (MIN(fire_at) - clock_timestamp()))::float8 AS wait_seconds "
+    "FROM workflow_timers"
+)
+
+
+class TimerService:
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+
+    def fire_due(self) -> int:
+        """Move up to `batch_size` due timers into the outbox and commit; returns how many fired."""
+        with db_cursor() as cur:
+            cur.execute(FIRE_SQL, (self.batch_size,))
+            fired = cur.fetchall()
+
+        for row in fired:
+            timers_fired_total.labels(destination=row["destination"]).inc()
+            timer_fire_lag_seconds.labels(destination=row["destination"]).observe(max(float(row["lag_seconds"]), 0.0))
+        if fired:
+            log.info("Fired timers.", count=len(fired))
+        return len(fired)
+
+    def seconds_until_next(self) -> Optional[float]:
+        """Seconds until the earliest timer is due, on the database clock, or None if there is none."""
+        with db_cursor() as cur:
+            cur.execute(NEXT_DUE_SQL)
+            row = cur.fetchone()
+        if not row or row["wait_seconds"] is None:
+            return None
+        return max(float(row["wait_seconds"]), 0.0)
@@ -0,0 +1,219 @@
+"""
+Distributed concurrency and rate limits for actions.
+
+Limits are rows of the action_limits table, each for one connection id,
+connector id or target host. A row can cap the actions in flight, set a
+token-bucket rate, or both. Before running an action a worker takes a
+lease on every limit that applies, and it releases the lease afterwards.
+An action over a limit is not run: it goes back on a timer for when the
+limit should have room again, so it does not hold a worker slot while it
+waits. The engine checks the same limits without taking anything before
+it dispatches an action, and sends an action it already knows is over a
+limit straight to a timer.
+
+Each check is one Lua script call, so it is atomic across all workers
+and engines. Leases expire after ACTION_LEASE_SECONDS, so a worker that
+dies mid-action does not keep its slot. Each process reads the table at
+most every ACTION_LIMITS_TTL_SECONDS. When no limit applies to an action,
+no Redis call is made. A Redis failure lets the action through.
+"""
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from src.shared.logging_config import log
+from src.shared.redis_client import redis_client
+from src.shared.connectors.registry import registry as connector_registry
+import src.shared.connectors.definitions  # noqa: F401 — registers connectors on import
+
+
+ACTION_LEASE_SECONDS = int(os.getenv("ACTION_LEASE_SECONDS", "300"))
+ACTION_LIMITS_TTL_SECONDS = float(os.getenv("ACTION_LIMITS_TTL_SECONDS", "30"))
+# How long an action waits when every in-flight slot is taken; a release does not wake waiting actions
+ACTION_IN_FLIGHT_RETRY_SECONDS = float(os.getenv("ACTION_IN_FLIGHT_RETRY_SECONDS", "2"))
+# Deferred actions wait up to this much longer, so they do not all come back at the same moment
+JITTER = 0.1
+KEY_PREFIX = "limit:"
+
+CONNECTION = "connection"
+CONNECTOR = "connector"
+HOST = "host"
+# Config keys whose value is a URL naming the system an action talks to
+HOST_CONFIG_KEYS = ("url", "connection_string", "base_url")
+
+
+# KEYS: per limit, its in-flight sorted set (lease -> expiry) and its token bucket hash
+# ARGV: lease id, or '' to only check; lease ms; in-flight retry ms; then per limit: max in flight, rate, burst
+# Returns 0 once every limit admitted the action, or the milliseconds to wait; nothing is taken unless all admit
+LIMIT_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local lease, lease_ms, busy_ms = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local wait = 0
+local levels = {}
+for i = 1, #KEYS / 2 do
+  local max, rate, burst = tonumber(ARGV[3 * i + 1]), tonumber(ARGV[3 * i + 2]), tonumber(ARGV[3 * i + 3])
+  if max > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2 * i - 1], '-inf', now)
+    if redis.call('ZCARD', KEYS[2 * i - 1]) >= max then
+      wait = math.max(wait, busy_ms)
+    end
+  end
+  if rate > 0 then
+    local state = redis.call('HMGET', KEYS[2 * i], 'tokens', 'at')
+    local level = tonumber(state[1]) or burst
+    local at = tonumber(state[2]) or now
+    level = math.min(burst, level + (now - at) * rate / 1000)
+    levels[i] = level
+    if level < 1 then
+      wait = math.max(wait, math.ceil((1 - level) * 1000 / rate))
+    end
+  end
+end
+if wait > 0 or lease == '' then
+  return wait
+end
+for i = 1, #KEYS / 2 do
+  local max, rate, burst = tonumber(ARGV[3 * i + 1]), tonumber(ARGV[3 * i + 2]), tonumber(ARGV[3 * i + 3])
+  if max > 0 then
+    redis.call('ZADD', KEYS[2 * i - 1], now + lease_ms, lease)
+    redis.call('PEXPIRE', KEYS[2 * i - 1], lease_ms)
+  end
+  if rate > 0 then
+    redis.call('HSET', KEYS[2 * i], 'tokens', levels[i] - 1, 'at', now)
+    redis.call('PEXPIRE', KEYS[2 * i], math.ceil(burst * 1000 / rate) + 1000)
+  end
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class ActionLimit:
+    scope: str
+    key: str
+    max_in_flight: Optional[int] = None
+    rate_per_second: Optional[float] = None
+    # Tokens the bucket holds when full; defaults to one second's worth
+    burst: Optional[int] = None
+
+    def redis_key(self, kind: str) -> str:
+        return f"{KEY_PREFIX}{self.scope}:{self.key}:{kind}"
+
+    def script_args(self) -> list:
+        rate = self.rate_per_second or 0
+        return [self.max_in_flight or 0, rate, self.burst or max(1, math.ceil(rate))]
+
+
+def target_host(config: dict) -> Optional[str]:
+    """The host an action's config points at, if a URL names it before any template is filled in."""
+    for key in HOST_CONFIG_KEYS:
+        value = (config or {}).get(key)
+        if not isinstance(value, str) or "://" not in value:
+            continue
+        try:
+            host = urlparse(value).hostname
+        except ValueError:
+            continue
+        if host and "{" not in host:
+            return host
+    return None
+
+
+def load_limits() -> List[ActionLimit]:
+    from src.shared.db import db_cursor
+    with db_cursor() as cur:
+        cur.execute("SELECT scope, key, max_in_flight, rate_per_second, burst FROM action_limits")
+        return [
+            ActionLimit(row["scope"], row["key"], row["max_in_flight"],
+                        float(row["rate_per_second"]) if row["rate_per_second"] is not None else None, row["burst"])
+            for row in cur.fetchall()
+        ]
+
+
+class ActionLimiter:
+    def __init__(self, redis_client=None, loader: Callable[[], List[ActionLimit]] = load_limits,
+                 ttl_seconds: float = ACTION_LIMITS_TTL_SECONDS, lease_seconds: int = ACTION_LEASE_SECONDS,
+                 in_flight_retry_seconds: float = ACTION_IN_FLIGHT_RETRY_SECONDS):
+        self.redis = redis_client
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.in_flight_retry_seconds = in_flight_retry_seconds
+        self._limits: Dict[Tuple[str, str], ActionLimit] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._script = None
+
+    def limits_for(self, action_id: str, connection_id: str = None, config: dict = None) -> List[ActionLimit]:
+        """The limits that apply to running `action_id` with this connection and config."""
+        limits = self._current()
+        if not limits:
+            return []
+        connector = connector_registry.get_connector_for_action(action_id)
+        candidates = ((CONNECTION, connection_id), (CONNECTOR, connector.id if connector else None),
+                      (HOST, target_host(config)))
+        return [limits[(scope, key)] for scope, key in candidates if key and (scope, key) in limits]
+
+    def acquire(self, limits: List[ActionLimit]) -> Tuple[Optional[str], float]:
+        """Take a lease on every limit, or on none: (lease, 0), or (None, seconds to wait before trying again)."""
+        if not limits:
+            return None, 0.0
+        lease = uuid.uuid4().hex
+        wait = self._run(limits, lease)
+        return (None, wait) if wait > 0 else (lease, 0.0)
+
+    def delay(self, limits: List[ActionLimit]) -> float:
+        """Seconds until `limits` could admit an action, without taking a token or a slot."""
+        return self._run(limits, "") if limits else 0.0
+
+    def release(self, limits: List[ActionLimit], lease: Optional[str]) -> None:
+        if lease is None or self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for limit in limits:
+                if limit.max_in_flight:
+                    pipe.zrem(limit.redis_key("in_flight"), lease)
+            pipe.execute()
+        except Exception:
+            # The lease expires on its own
+            log.warning("Failed to release action lease", exc_info=True)
+
+    def _run(self, limits: List[ActionLimit], lease: str) -> float:
+        if self.redis is None:
+            return 0.0
+        keys = []
+        args = [lease, self.lease_seconds * 1000, int(self.in_flight_retry_seconds * 1000)]
+        for limit in limits:
+            keys += [limit.redis_key("in_flight"), limit.redis_key("bucket")]
+            args += limit.script_args()
+        try:
+            if self._script is None:
+                self._script = self.redis.register_script(LIMIT_SCRIPT)
+            wait_ms = int(self._script(keys=keys, args=args))
+        except Exception:
+            log.warning("Action limiter unavailable; letting the action through", exc_info=True)
+            return 0.0
+        return wait_ms / 1000 * (1 + random.random() * JITTER) if wait_ms > 0 else 0.0
+
+    def _current(self) -> Dict[Tuple[str, str], ActionLimit]:
+        if time.monotonic() < self._expires_at:
+            return self._limits
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                try:
+                    self._limits = {(limit.scope, limit.key): limit for limit in self.loader()}
+                except Exception:
+                    log.warning("Failed to load action limits; keeping the previous ones", exc_info=True)
+                self._expires_at = time.monotonic() + self.ttl_seconds
+        return self._limits
+
+
+action_limiter = ActionLimiter(redis_client)
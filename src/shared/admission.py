@@ -0,0 +1,99 @@
+"""
+Admission of instances for workflow versions with max_concurrent_instances.
+
+Each limited version has a workflow_admission row counting the instances
+that hold a running slot and the instances waiting for one. Waiting
+instances stay `pending` in workflow_admission_queue, oldest first. When
+an admitted instance finishes, its slot passes straight to the oldest
+waiting instance, which is marked admitted and gets a START_WORKFLOW.
+If nobody is waiting, the running count drops instead.
+
+Every decision locks the version's counter row first. This serializes
+admissions and releases for that version, so nobody can queue behind a
+slot that is being freed at the same moment. Versions without a limit
+never touch these tables.
+"""
+from typing import Iterable, List
+
+
+def admit(cursor, instance_id: str, version_id: str, limit: int) -> bool:
+    """Give the instance a running slot, or queue it behind earlier waiters and return False.
+
+    Queueing is idempotent, so a redelivered START_WORKFLOW does not queue
+    the instance twice.
+    """
+    cursor.execute("""
+        INSERT INTO workflow_admission (version_id) VALUES (%s)
+        ON CONFLICT (version_id) DO UPDATE SET running = workflow_admission.running
+        RETURNING running, waiting
+    """, (version_id,))
+    counter = cursor.fetchone()
+    if counter["running"] < limit and counter["waiting"] == 0:
+        cursor.execute("UPDATE workflow_admission SET running = running + 1 WHERE version_id = %s", (version_id,))
+        return True
+
+    cursor.execute("""
+        WITH queued AS (
+            INSERT INTO workflow_admission_queue (instance_id, version_id) VALUES (%s, %s)
+            ON CONFLICT (instance_id) DO NOTHING
+            RETURNING 1
+        )
+        UPDATE workflow_admission SET waiting = waiting + (SELECT count(*) FROM queued)
+        WHERE version_id = %s
+    """, (instance_id, version_id, version_id))
+    return False
+
+
+def release(cursor, version_id: str, slots: int = 1) -> List[str]:
+    """Free `slots` running slots of a version; returns the waiting instances they were handed to, oldest first.
+
+    The returned instances are marked admitted here. The caller sends each
+    one a START_WORKFLOW in the same transaction.
+    """
+    cursor.execute("SELECT waiting FROM workflow_admission WHERE version_id = %s FOR UPDATE", (version_id,))
+    counter = cursor.fetchone()
+    if counter is None:
+        return []
+
+    admitted = []
+    if counter["waiting"] > 0:
+        cursor.execute("""
+            WITH next AS (
+                DELETE FROM workflow_admission_queue
+                WHERE instance_id IN (
+                    SELECT instance_id FROM workflow_admission_queue
+                    WHERE version_id = %s
+                    ORDER BY seq
+                    LIMIT %s
+                )
+                RETURNING instance_id
+            )
+            UPDATE workflow_instances i SET admitted = TRUE, row_version = i.row_version + 1
+            FROM next
+            WHERE i.id = next.instance_id
+            RETURNING i.id
+        """, (version_id, slots))
+        admitted = [str(row["id"]) for row in cursor.fetchall()]
+
+    cursor.execute("""
+        UPDATE workflow_admission SET
+            running = GREATEST(running - %s, 0),
+            waiting = GREATEST(waiting - %s, 0)
+        WHERE version_id = %s
+    """, (slots - len(admitted), len(admitted), version_id))
+    return admitted
+
+
+def withdraw(cursor, instance_ids: Iterable[str]) -> None:
+    """Take instances that will never start, e.g. cancelled ones, out of the queue."""
+    cursor.execute("""
+        WITH removed AS (
+            DELETE FROM workflow_admission_queue WHERE instance_id = ANY(%s::uuid[])
+            RETURNING version_id
+        ), counts AS (
+            SELECT version_id, count(*) AS n FROM removed GROUP BY version_id
+        )
+        UPDATE workflow_admission a SET waiting = GREATEST(a.waiting - counts.n, 0)
+        FROM counts
+        WHERE a.version_id = counts.version_id
+    """, (list(instance_ids),))
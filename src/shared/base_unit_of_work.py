@@ -1,7 +1,9 @@
 import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 from src.shared.db import get_connection, return_connection
+from src.shared.outbox import take_pending, publish_pending, pending_mark, discard_pending_after
 
 
 class BasePostgresUnitOfWork(ABC):
@@ -13,6 +15,12 @@ class BasePostgresUnitOfWork(ABC):
     """Subclasses create their specific repository instances here."""
     ...
 
+  def _flush(self):
+    """Send writes the repositories have buffered; called before every commit and savepoint release."""
+
+  def _discard(self):
+    """Drop what the repositories buffered or cached after a rollback."""
+
   def __enter__(self):
     conn = get_connection()
     cursor = conn.cursor()
@@ -24,20 +32,50 @@ class BasePostgresUnitOfWork(ABC):
   def __exit__(self, exc_type, exc_val, exc_tb):
     conn = self._local.conn
     cursor = self._local.cursor
+    committed = []
     try:
       if exc_type:
         conn.rollback()
+        take_pending(conn)
       else:
+        self._flush()
         conn.commit()
+        committed = take_pending(conn)
     except Exception:
       conn.rollback()
+      take_pending(conn)
       raise
     finally:
       cursor.close()
       return_connection(conn)
+    publish_pending(committed)
 
   def commit(self):
-    self._local.conn.commit()
+    conn = self._local.conn
+    self._flush()
+    conn.commit()
+    publish_pending(take_pending(conn))
 
   def rollback(self):
     self._local.conn.rollback()
+    take_pending(self._local.conn)
+    self._discard()
+
+  @contextmanager
+  def savepoint(self, name: str = "uow_savepoint"):
+    """Roll back only the work done inside the block if it raises; the transaction stays usable."""
+    conn = self._local.conn
+    cursor = self._local.cursor
+    # Buffered writes from before the savepoint must not be rolled back with it
+    self._flush()
+    mark = pending_mark(conn)
+    cursor.execute(f"SAVEPOINT {name}")
+    try:
+      yield
+      self._flush()
+    except Exception:
+      cursor.execute(f"ROLLBACK TO SAVEPOINT {name}")
+      discard_pending_after(conn, mark)
+      self._discard()
+      raise
+    cursor.execute(f"RELEASE SAVEPOINT {name}")
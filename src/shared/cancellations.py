@@ -0,0 +1,82 @@
+"""
+Which workflow instances have been cancelled, for checks on hot paths.
+
+The API marks instances here after the cancelling transaction commits, and
+workers and the engine check before doing anything for an instance, so a
+cancelled instance stops costing HTTP calls, locks and transactions at once.
+Cancellation is final, so a positive answer never goes stale: each process
+remembers the cancelled instances it has seen, and Redis holds one key per
+cancelled instance for CANCELLED_TTL_SECONDS. A Redis failure reads as "not
+cancelled"; the instance status in the database still stops the work, just
+later.
+"""
+import os
+from collections import OrderedDict
+from typing import Iterable, List, Set
+
+from src.shared.logging_config import log
+from src.shared.redis_client import redis_client
+
+
+CANCELLED_TTL_SECONDS = int(os.getenv("CANCELLED_TTL_SECONDS", "86400"))
+CANCELLED_LOCAL_SIZE = 100_000
+KEY_PREFIX = "cancelled:"
+# Keys per pipeline round trip when marking or checking many instances
+CHUNK_SIZE = 1000
+
+
+class CancelledInstances:
+    def __init__(self, redis_client=None, ttl_seconds: int = CANCELLED_TTL_SECONDS,
+                 local_size: int = CANCELLED_LOCAL_SIZE):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.local_size = local_size
+        self._local: OrderedDict = OrderedDict()
+
+    def mark(self, instance_ids: Iterable[str]) -> None:
+        """Record instances as cancelled, here and for every process that checks Redis."""
+        instance_ids = [str(i) for i in instance_ids]
+        self._remember(instance_ids)
+        if self.redis is None:
+            return
+        try:
+            for start in range(0, len(instance_ids), CHUNK_SIZE):
+                pipe = self.redis.pipeline(transaction=False)
+                for instance_id in instance_ids[start:start + CHUNK_SIZE]:
+                    pipe.set(KEY_PREFIX + instance_id, 1, ex=self.ttl_seconds)
+                pipe.execute()
+        except Exception:
+            log.warning("Failed to publish cancelled instances", count=len(instance_ids), exc_info=True)
+
+    def is_cancelled(self, instance_id: str) -> bool:
+        return bool(self.cancelled([instance_id]))
+
+    def cancelled(self, instance_ids: Iterable[str]) -> Set[str]:
+        """The subset of `instance_ids` known to be cancelled, in at most one Redis round trip per chunk."""
+        instance_ids = list(dict.fromkeys(str(i) for i in instance_ids))
+        found = {i for i in instance_ids if i in self._local}
+        unknown = [i for i in instance_ids if i not in found]
+        if not unknown or self.redis is None:
+            return found
+        try:
+            for start in range(0, len(unknown), CHUNK_SIZE):
+                chunk = unknown[start:start + CHUNK_SIZE]
+                pipe = self.redis.pipeline(transaction=False)
+                for instance_id in chunk:
+                    pipe.exists(KEY_PREFIX + instance_id)
+                hits = [i for i, exists in zip(chunk, pipe.execute()) if exists]
+                self._remember(hits)
+                found.update(hits)
+        except Exception:
+            log.warning("Cancelled-instance check failed; assuming not cancelled", exc_info=True)
+        return found
+
+    def _remember(self, instance_ids: List[str]) -> None:
+        for instance_id in instance_ids:
+            self._local[instance_id] = True
+            self._local.move_to_end(instance_id)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+
+cancelled_instances = CancelledInstances(redis_client)
@@ -3,6 +3,7 @@ from celery import Celery
 from kombu import Queue
 
 from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE, ORCHESTRATION_DLQ, ACTIONS_DLQ
+from src.shared.partitioning import ORCHESTRATION_PARTITIONS, partition_queue
 
 RABBITMQ_URL = os.getenv("RABBITMQ_URL")
 
@@ -37,6 +38,14 @@ app.conf.task_queues = (
           'x-dead-letter-exchange': '',
           'x-dead-letter-routing-key': ACTIONS_DLQ
         }),
+
+  # Orchestration partitions: one active consumer each, so an instance's events are never handled concurrently
+  *(Queue(partition_queue(p), routing_key=f'orchestration.p{p}', durable=True,
+          queue_arguments={
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': ORCHESTRATION_DLQ,
+            'x-single-active-consumer': True,
+          }) for p in range(ORCHESTRATION_PARTITIONS)),
 )
 
 app.conf.task_reject_on_worker_lost = True
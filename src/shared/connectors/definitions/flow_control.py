@@ -45,6 +45,49 @@ flow_control_connector = Connector(
                 },
             },
         ),
+        ActionDefinition(
+            id="parallel",
+            name="Parallel",
+            description="Runs several actions at the same time and continues once enough of them complete.",
+            config_schema={
+                "type": "object",
+                "properties": {
+                    "branches": {"type": "object", "title": "Branches", "description": "Branch name to action step (connector_id, action_id, config, retry)"},
+                    "join": {"title": "Join", "description": "'all', 'any', or the number of branches that must complete", "default": "all"},
+                },
+                "required": ["branches"],
+            },
+        ),
+        ActionDefinition(
+            id="map",
+            name="For Each",
+            description="Runs an action once per item of a list in the workflow data, a few at a time.",
+            config_schema={
+                "type": "object",
+                "properties": {
+                    "items": {"type": "string", "title": "Items Path", "description": "Dot-notation path to a list (e.g., 'push.commits')"},
+                    "action": {"type": "object", "title": "Action", "description": "Action step run per item; its config can use {{item}} and {{item_index}}"},
+                    "max_concurrency": {"type": "integer", "title": "Max Concurrency", "default": 10, "minimum": 1},
+                    "max_failures": {"type": "integer", "title": "Allowed Failures", "default": 0, "minimum": 0},
+                    "result_key": {"type": "string", "title": "Result Key", "description": "Where the per-item results are stored; defaults to the step name"},
+                },
+                "required": ["items", "action"],
+            },
+        ),
+        ActionDefinition(
+            id="call_workflow",
+            name="Call Workflow",
+            description="Starts another workflow's active version as a child instance and continues when it finishes.",
+            config_schema={
+                "type": "object",
+                "properties": {
+                    "workflow": {"type": "string", "title": "Workflow", "description": "Name of the workflow to start"},
+                    "input": {"type": "object", "title": "Input", "description": "Child data key to dot-notation path in this workflow's data"},
+                    "result_key": {"type": "string", "title": "Result Key", "description": "Where the child's final data is stored; defaults to the step name"},
+                },
+                "required": ["workflow"],
+            },
+        ),
     ],
 )
 
@@ -23,6 +23,12 @@ class ConnectorRegistry:
                     return action
         return None
 
+    def get_connector_for_action(self, action_id: str) -> Optional[Connector]:
+        for connector in self._connectors.values():
+            if any(action.id == action_id for action in connector.actions):
+                return connector
+        return None
+
     def validate_definition(self, definition: dict) -> list[str]:
         """Validate that all action_ids in a workflow definition exist. Returns list of errors."""
         errors = []
@@ -33,6 +39,16 @@ class ConnectorRegistry:
                 action_id = step_def.get("action_id")
                 if action_id and not self.get_action(action_id):
                     errors.append(f"Step '{step_name}': unknown action_id '{action_id}'")
+            elif step_type == "parallel":
+                for branch, branch_def in (step_def.get("branches") or {}).items():
+                    action_id = branch_def.get("action_id") if isinstance(branch_def, dict) else None
+                    if action_id and not self.get_action(action_id):
+                        errors.append(f"Step '{step_name}', branch '{branch}': unknown action_id '{action_id}'")
+            elif step_type == "map":
+                action_def = step_def.get("action")
+                action_id = action_def.get("action_id") if isinstance(action_def, dict) else None
+                if action_id and not self.get_action(action_id):
+                    errors.append(f"Step '{step_name}': unknown action_id '{action_id}'")
         return errors
 
 
@@ -3,6 +3,8 @@ import time
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 
+from src.shared.outbox import take_pending, publish_pending
+
 _pool = None
 
 def get_connection_string():
@@ -45,9 +47,12 @@ def db_cursor():
     try:
         yield cur
         conn.commit()
+        committed = take_pending(conn)
     except Exception:
         conn.rollback()
+        take_pending(conn)
         raise
     finally:
         cur.close()
         return_connection(conn)
+    publish_pending(committed)
@@ -1,7 +1,19 @@
 from enum import Enum
+from typing import Optional
 
 
 class EventType(Enum):
   START_WORKFLOW = "START_WORKFLOW"
   STEP_COMPLETE = "STEP_COMPLETE"
   STEP_FAILED = "STEP_FAILED"
+
+
+def child_result_payload(parent_instance_id: str, parent_step: str, child_instance_id: str, status: str,
+                         data: Optional[dict] = None) -> dict:
+  """The event that tells a call_workflow step how the child instance it started ended."""
+  if status == "completed":
+    return {"type": EventType.STEP_COMPLETE.value, "instance_id": parent_instance_id, "step_name": parent_step,
+            "data": {"child_instance_id": child_instance_id, "data": data or {}}}
+  return {"type": EventType.STEP_FAILED.value, "instance_id": parent_instance_id, "step_name": parent_step,
+          "data": {"child_instance_id": child_instance_id,
+                   "error": f"Called workflow instance {child_instance_id} ended {status}"}}
@@ -76,6 +76,71 @@ http_request_duration_seconds = Histogram(
     buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
 )
 
+# Outbox Relay Metrics
+outbox_relay_lag_seconds = Histogram(
+    'outbox_relay_lag_seconds',
+    'Time from publish_at to relay pickup',
+    ['destination'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+)
+
+outbox_relay_batch_size = Histogram(
+    'outbox_relay_batch_size',
+    'Rows claimed per relay batch',
+    ['destination'],
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000]
+)
+
+outbox_publish_duration_seconds = Histogram(
+    'outbox_publish_duration_seconds',
+    'Time from publishing to the broker confirm',
+    ['destination'],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10]
+)
+
+outbox_relayed_total = Counter(
+    'outbox_relayed_total',
+    'Outbox rows published and marked processed',
+    ['destination']
+)
+
+outbox_publish_failures_total = Counter(
+    'outbox_publish_failures_total',
+    'Outbox rows that failed to publish or were not confirmed',
+    ['destination']
+)
+
+outbox_backlog = Gauge(
+    'outbox_backlog',
+    'Unprocessed outbox rows',
+    ['destination', 'state']  # state: due, scheduled
+)
+
+timers_fired_total = Counter(
+    'timers_fired_total',
+    'Workflow timers moved into the outbox',
+    ['destination']
+)
+
+timer_fire_lag_seconds = Histogram(
+    'timer_fire_lag_seconds',
+    'Time from a timer being due to it reaching the outbox',
+    ['destination'],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10]
+)
+
+actions_deferred_total = Counter(
+    'actions_deferred_total',
+    'Actions put on a timer because a concurrency or rate limit was full',
+    ['action', 'deferred_by']  # deferred_by: engine, worker
+)
+
+workflow_admission_queued_total = Counter(
+    'workflow_admission_queued_total',
+    'Instance starts queued because their version was at max_concurrent_instances',
+    ['workflow_name']
+)
+
 # System Info
 app_info = Info('app', 'Application information')
 app_info.info({
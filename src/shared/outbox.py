@@ -0,0 +1,155 @@
+import json
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.shared.logging_config import log
+from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
+from src.shared.publisher import ConfirmingPublisher, OutboundMessage
+
+
+TASK_ROUTING = {
+    ORCHESTRATION_QUEUE: "engine.orchestrate",
+    ACTIONS_QUEUE: "worker.execute_action",
+}
+
+# Publish immediate messages straight to the broker after commit; the relay only sweeps what was not confirmed
+DIRECT_PUBLISH = os.getenv("OUTBOX_DIRECT_PUBLISH", "false").lower() == "true"
+# How long the relay leaves a directly published row alone before treating it as abandoned
+DIRECT_LEASE_SECONDS = int(os.getenv("OUTBOX_DIRECT_LEASE_SECONDS", "10"))
+
+_local = threading.local()
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def direct_lease_owner() -> str:
+    return f"direct:{socket.gethostname()}:{os.getpid()}"
+
+
+def insert_message(cursor, destination: str, payload: dict, publish_at: Optional[datetime] = None,
+                   request_id: str = None) -> str:
+    """Write an outbox row in the caller's transaction and return its id.
+
+    With direct publish on, a row that is due now is inserted already leased
+    to this process and queued against the cursor's connection; the commit
+    path hands it to `publish_pending` so the relay never has to poll for it.
+    """
+    sql, params, msg_id = insert_statement(cursor, destination, payload, publish_at, request_id)
+    cursor.execute(sql, params)
+    return msg_id
+
+
+def insert_statement(cursor, destination: str, payload: dict, publish_at: Optional[datetime] = None,
+                     request_id: str = None) -> tuple:
+    """`(sql, params, id)` for an outbox insert, for callers that send several writes in one statement.
+
+    Direct-publish bookkeeping happens here, so the statement must run in
+    `cursor`'s transaction before it commits.
+    """
+    msg_id = str(uuid.uuid4())
+    direct = (
+        DIRECT_PUBLISH
+        and destination in TASK_ROUTING
+        and (publish_at is None or publish_at <= datetime.now(timezone.utc))
+    )
+
+    if not direct:
+        return (
+            "INSERT INTO outbox (id, destination, payload, publish_at, request_id) "
+            "VALUES (%s, %s, %s, COALESCE(%s, NOW()), %s)",
+            (msg_id, destination, json.dumps(payload), publish_at, request_id),
+            msg_id,
+        )
+
+    headers = {"request_id": request_id} if request_id else {}
+    _pending_for(cursor.connection).append(OutboundMessage(
+        id=msg_id,
+        task_name=TASK_ROUTING[destination],
+        queue=destination,
+        payload=payload,
+        headers=headers,
+    ))
+    # clock_timestamp(), not NOW(): the lease must outlast the commit, not the transaction start
+    return (
+        "INSERT INTO outbox (id, destination, payload, publish_at, request_id, lease_owner, lease_expires_at) "
+        "VALUES (%s, %s, %s, COALESCE(%s, NOW()), %s, %s, clock_timestamp() + make_interval(secs => %s))",
+        (msg_id, destination, json.dumps(payload), publish_at, request_id,
+         direct_lease_owner(), DIRECT_LEASE_SECONDS),
+        msg_id,
+    )
+
+
+def _pending_for(conn) -> list:
+    if not hasattr(_local, "pending"):
+        _local.pending = {}
+    return _local.pending.setdefault(id(conn), [])
+
+
+def take_pending(conn) -> list:
+    """Remove and return the messages queued on `conn`'s current transaction."""
+    if not hasattr(_local, "pending"):
+        return []
+    return _local.pending.pop(id(conn), [])
+
+
+def pending_mark(conn) -> int:
+    """Number of messages queued on `conn` so far, for `discard_pending_after` on a savepoint rollback."""
+    return len(_pending_for(conn))
+
+
+def discard_pending_after(conn, mark: int) -> None:
+    """Drop messages queued after `mark`; their rows went with the rolled-back savepoint."""
+    del _pending_for(conn)[mark:]
+
+
+def publish_pending(messages: list) -> None:
+    """Publish committed messages and mark the confirmed ones processed.
+
+    Never raises: the rows are committed, so anything that fails here is
+    left to the relay, either at once (lease released) or after the lease
+    expires if even the release could not be written.
+    """
+    if not messages:
+        return
+
+    try:
+        with _publisher_lock:
+            confirmed = _get_publisher().publish_batch(messages)
+    except Exception as e:
+        log.error("Direct publish failed; leaving messages to the relay.", error=str(e), count=len(messages))
+        confirmed = []
+
+    confirmed_set = set(confirmed)
+    unconfirmed = [m.id for m in messages if m.id not in confirmed_set]
+    owner = direct_lease_owner()
+
+    # Imported here: the db module hands committed messages to this one
+    from src.shared.db import db_cursor
+    try:
+        with db_cursor() as cur:
+            if confirmed:
+                cur.execute(
+                    "UPDATE outbox SET processed_at = NOW(), lease_owner = NULL, lease_expires_at = NULL "
+                    "WHERE id = ANY(%s::uuid[]) AND lease_owner = %s",
+                    (confirmed, owner)
+                )
+            if unconfirmed:
+                cur.execute(
+                    "UPDATE outbox SET lease_owner = NULL, lease_expires_at = NULL "
+                    "WHERE id = ANY(%s::uuid[]) AND lease_owner = %s",
+                    (unconfirmed, owner)
+                )
+    except Exception:
+        log.error("Failed to settle directly published messages; the relay will sweep them.", exc_info=True)
+
+
+def _get_publisher() -> ConfirmingPublisher:
+    global _publisher
+    if _publisher is None:
+        from src.shared.celery_app import app as celery_app
+        _publisher = ConfirmingPublisher(celery_app)
+    return _publisher
@@ -0,0 +1,53 @@
+import hashlib
+import os
+
+from src.shared.constants import ORCHESTRATION_QUEUE
+
+
+# Number of orchestration queue partitions; 0 keeps the single shared queue and the per-instance Redis lock
+ORCHESTRATION_PARTITIONS = int(os.getenv("ORCHESTRATION_PARTITIONS", "0"))
+
+
+def shard_owner(shard: int, members: list[str]) -> str:
+    """Rendezvous hash: the member with the highest score for a shard owns it.
+
+    Adding or removing a member only moves the shards that member wins or
+    held, so a rebalance leaves every other shard where it was.
+    """
+    return max(members, key=lambda m: hashlib.md5(f"{m}:{shard}".encode()).digest())
+
+
+def assign_shards(members: list[str], shard_count: int) -> dict[str, set[int]]:
+    assignment = {member: set() for member in members}
+    if not members:
+        return assignment
+    for shard in range(shard_count):
+        assignment[shard_owner(shard, members)].add(shard)
+    return assignment
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach): growing to n+1 buckets moves only 1/(n+1) of the keys."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+def partition_for(instance_id: str, partitions: int) -> int:
+    key = int.from_bytes(hashlib.md5(instance_id.encode()).digest()[:8], "big")
+    return jump_hash(key, partitions)
+
+
+def partition_queue(partition: int) -> str:
+    return f"{ORCHESTRATION_QUEUE}.p{partition}"
+
+
+def route_queue(destination: str, payload: dict, partitions: int = None) -> str:
+    """The queue a message for `destination` is actually published to."""
+    partitions = ORCHESTRATION_PARTITIONS if partitions is None else partitions
+    if destination != ORCHESTRATION_QUEUE or partitions <= 0 or not payload.get("instance_id"):
+        return destination
+    return partition_queue(partition_for(str(payload["instance_id"]), partitions))
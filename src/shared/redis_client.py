@@ -2,4 +2,5 @@ import os
 import redis
 
 REDIS_URL = os.getenv("REDIS_URL")
-redis_client = redis.from_url(REDIS_URL)
\ No newline at end of file
+# None without REDIS_URL, e.g. for the in-memory benchmark; the shared caches then skip Redis
+redis_client = redis.from_url(REDIS_URL) if REDIS_URL else None
\ No newline at end of file
@@ -0,0 +1,32 @@
+import json
+from datetime import datetime
+
+TIMERS_CHANNEL = "workflow_timers"
+
+# What a timer is for; at most one timer per instance, purpose and step exists at a time
+DELAY = "delay"
+WAIT_TIMEOUT = "timeout"
+RETRY = "retry"
+# An action deferred by a worker because one of its limits was full
+THROTTLE = "throttle"
+
+UPSERT_SQL = """
+    INSERT INTO workflow_timers (id, instance_id, fire_at, destination, payload, request_id)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (id) DO UPDATE SET
+        fire_at = EXCLUDED.fire_at,
+        destination = EXCLUDED.destination,
+        payload = EXCLUDED.payload,
+        request_id = EXCLUDED.request_id
+"""
+
+
+def timer_id(instance_id: str, purpose: str, step_name: str) -> str:
+    """The id of an instance's timer for `purpose` on `step_name`; scheduling it again moves it."""
+    return f"{instance_id}:{purpose}:{step_name}"
+
+
+def schedule(cursor, timer_id: str, instance_id: str, fire_at: datetime, destination: str,
+             payload: dict, request_id: str = None) -> None:
+    """Set a timer in the cursor's transaction, replacing any timer with this id."""
+    cursor.execute(UPSERT_SQL, (timer_id, instance_id, fire_at, destination, json.dumps(payload), request_id))
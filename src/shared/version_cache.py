@@ -0,0 +1,120 @@
+"""
+Process-local cache of workflow versions.
+
+A version row never changes once written, so `get` caches versions by id
+and never invalidates them. Which version is *active* for a workflow name
+or a trigger does change, when `create_version` deactivates the previous
+one or a new workflow is created. Those lookups are dropped on every
+process when a writer publishes on INVALIDATION_CHANNEL, and they also
+expire after VERSION_CACHE_ACTIVE_TTL_SECONDS, because Redis pub/sub does
+not keep messages for a subscriber that is reconnecting.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from src.shared.logging_config import log
+from src.shared.redis_client import redis_client
+
+
+VERSION_CACHE_SIZE = int(os.getenv("VERSION_CACHE_SIZE", "1024"))
+VERSION_CACHE_ACTIVE_TTL_SECONDS = float(os.getenv("VERSION_CACHE_ACTIVE_TTL_SECONDS", "60"))
+INVALIDATION_CHANNEL = "workflow_versions:invalidate"
+LISTENER_RETRY_SECONDS = 5
+
+
+class VersionCache:
+    def __init__(self, max_size: int = VERSION_CACHE_SIZE,
+                 active_ttl_seconds: float = VERSION_CACHE_ACTIVE_TTL_SECONDS, redis_client=None):
+        self.max_size = max_size
+        self.active_ttl_seconds = active_ttl_seconds
+        self.redis = redis_client
+        self._versions: OrderedDict = OrderedDict()
+        # key -> (expires at, value)
+        self._active: OrderedDict = OrderedDict()
+        # Bumped on every invalidation so a lookup that raced one does not store what it read
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        # A forked child inherits _listener but not the thread, so it starts its own
+        self._listener_pid: Optional[int] = None
+
+    def get(self, version_id: str, loader: Callable[[], Any]) -> Any:
+        """The version with this id, from the cache or from `loader`. Missing versions are not cached."""
+        with self._lock:
+            if version_id in self._versions:
+                self._versions.move_to_end(version_id)
+                return self._versions[version_id]
+
+        value = loader()
+        if value is not None:
+            with self._lock:
+                self._store(self._versions, version_id, value)
+        return value
+
+    def active(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """An active-version lookup, e.g. ("name", workflow_name), cached until the next invalidation."""
+        with self._lock:
+            hit = self._active.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                self._active.move_to_end(key)
+                return hit[1]
+            generation = self._generation
+
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._store(self._active, key, (time.monotonic() + self.active_ttl_seconds, value))
+        return value
+
+    def invalidate_active(self, broadcast: bool = True) -> None:
+        """Forget active-version lookups here and, with `broadcast`, in every listening process.
+
+        Call it after the transaction that changed the active version has
+        committed, so no process can reload the old answer afterwards.
+        """
+        self._clear_active()
+        if broadcast and self.redis is not None:
+            try:
+                self.redis.publish(INVALIDATION_CHANNEL, "active")
+            except Exception:
+                log.warning("Failed to broadcast version cache invalidation", exc_info=True)
+
+    def start_listener(self) -> None:
+        """Subscribe to invalidations on a daemon thread. Safe to call more than once, and again after a fork."""
+        if self.redis is None or (self._listener is not None and self._listener_pid == os.getpid()):
+            return
+        self._listener_pid = os.getpid()
+        self._listener = threading.Thread(target=self._listen, name="version-cache-listener", daemon=True)
+        self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything published while we were not subscribed is lost
+                self._clear_active()
+                for _ in pubsub.listen():
+                    self._clear_active()
+            except Exception:
+                log.warning("Version cache listener disconnected; resubscribing.", exc_info=True)
+                time.sleep(LISTENER_RETRY_SECONDS)
+
+    def _clear_active(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._active.clear()
+
+    def _store(self, entries: OrderedDict, key, value) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+
+version_cache = VersionCache(redis_client=redis_client)
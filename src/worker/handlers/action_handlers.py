@@ -9,14 +9,14 @@ from src.worker.registry import action
 DEFAULT_TIMEOUT = 30
 
 
-@action("initial_step")
+@action("initial_step", inline=True)
 class InitialStepHandler:
   def execute(self, instance_id, data, **kwargs):
     log.info(f"Executing the initial step.", instance_id=instance_id)
     data['initial_step_done'] = True
     return ActionResult(ActionStatus.SUCCESS, data)
 
-@action("final_step")
+@action("final_step", inline=True)
 class FinalStepHandler:
   def execute(self, instance_id, data, **kwargs):
     log.info(f"Executing the final step after the delay.", instance_id=instance_id)
@@ -24,7 +24,7 @@ class FinalStepHandler:
     return ActionResult(ActionStatus.SUCCESS, data)
 
 
-@action("log")
+@action("log", inline=True)
 class LogHandler:
   def execute(self, instance_id, data, config=None, **kwargs):
     config = config or {}
@@ -33,7 +33,7 @@ class LogHandler:
     return ActionResult(ActionStatus.SUCCESS, data)
 
 
-@action("transform_data")
+@action("transform_data", inline=True)
 class TransformDataHandler:
   def execute(self, instance_id, data, config=None, **kwargs):
     config = config or {}
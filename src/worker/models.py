@@ -13,6 +13,7 @@ class ActionStatus(Enum):
 STEP_COMPLETE_EVENT = EventType.STEP_COMPLETE.value
 STEP_FAILED_EVENT = EventType.STEP_FAILED.value
 STEP_COMPLETED_STATUS = "completed"
+INSTANCE_CANCELLED_STATUS = "cancelled"
 
 
 @dataclass
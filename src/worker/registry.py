@@ -1,10 +1,14 @@
 _HANDLERS: dict[str, type] = {}
+# Actions the engine may run itself: pure in-memory work on the instance data, no I/O or credentials
+_INLINE: set[str] = set()
 
 
-def action(name: str):
+def action(name: str, inline: bool = False):
     """Decorator to auto-register an action handler."""
     def decorator(cls):
         _HANDLERS[name] = cls
+        if inline:
+            _INLINE.add(name)
         return cls
     return decorator
 
@@ -18,3 +22,8 @@ def get_registry() -> dict:
     import src.worker.handlers.postgresql        # noqa: F401
     import src.worker.handlers.python_executor   # noqa: F401
     return {name: cls() for name, cls in _HANDLERS.items()}
+
+
+def get_inline_registry() -> dict:
+    """Instantiated handlers for the actions registered with `inline=True`."""
+    return {name: handler for name, handler in get_registry().items() if name in _INLINE}
@@ -1,24 +1,37 @@
-import json
+from datetime import datetime, timedelta, timezone
 
 from celery.exceptions import Reject
 
 from src.shared.logging_config import log
-from src.shared.constants import ORCHESTRATION_QUEUE
+from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
 from src.shared.db import db_cursor
+from src.shared import outbox, timers
+from src.shared.cancellations import CancelledInstances
+from src.shared.action_limits import ActionLimiter
+from src.shared.metrics import actions_deferred_total
 
 from src.worker.models import (
     ActionResult, ActionStatus,
-    STEP_COMPLETE_EVENT, STEP_FAILED_EVENT, STEP_COMPLETED_STATUS,
+    STEP_COMPLETE_EVENT, STEP_FAILED_EVENT, STEP_COMPLETED_STATUS, INSTANCE_CANCELLED_STATUS,
 )
 
 
 class WorkerService:
-    def __init__(self, registry: dict):
+    def __init__(self, registry: dict, cancellations: CancelledInstances = None, limiter: ActionLimiter = None):
         self.registry = registry
+        self.cancellations = cancellations
+        self.limiter = limiter
 
-    def execute_action(self, action_name: str, instance_id: str, step_name: str = None, config: dict = None, connection_id: str = None, task_context=None):
+    def execute_action(self, action_name: str, instance_id: str, step_name: str = None, config: dict = None, connection_id: str = None, task_context=None,
+                       item=None, item_index: int = None):
         step_name = step_name or action_name
         config = config or {}
+        message_config = config
+        # Checked before taking a connection, so a mass cancellation drains the queue without touching the database
+        if self.cancellations is not None and self.cancellations.is_cancelled(instance_id):
+            log.info("Instance cancelled; skipping action", action=action_name, step=step_name, instance_id=instance_id)
+            return
+
         log.info("Executing action", action=action_name, step=step_name, instance_id=instance_id)
 
         with db_cursor() as cur:
@@ -35,10 +48,13 @@ class WorkerService:
                 return
 
             # Load instance data
-            cur.execute("SELECT id, data FROM workflow_instances WHERE id = %s", (instance_id,))
+            cur.execute("SELECT id, data, status FROM workflow_instances WHERE id = %s", (instance_id,))
             instance_row = cur.fetchone()
             if not instance_row:
                 raise Reject(f"No instance found for id: {instance_id}", requeue=False)
+            if instance_row["status"] == INSTANCE_CANCELLED_STATUS:
+                log.info("Instance cancelled; skipping action", action=action_name, step=step_name, instance_id=instance_id)
+                return
 
             # Resolve connection credentials
             if connection_id:
@@ -57,11 +73,37 @@ class WorkerService:
                 log.error("No handler found for action", action=action_name)
                 raise Reject(f"No handler for action: {action_name}", requeue=False)
 
+            limits = self.limiter.limits_for(action_name, connection_id, config) if self.limiter else []
+            lease, wait_seconds = self.limiter.acquire(limits) if limits else (None, 0)
+            if wait_seconds > 0:
+                # Back on a timer rather than sleeping here, so the slot goes to an action that can run
+                payload = {"action": action_name, "step_name": step_name, "instance_id": str(instance_id),
+                           "config": message_config}
+                if connection_id:
+                    payload["connection_id"] = connection_id
+                if item_index is not None:
+                    payload.update(item=item, item_index=item_index)
+                fire_at = datetime.now(timezone.utc) + timedelta(seconds=wait_seconds)
+                timers.schedule(cur, timers.timer_id(str(instance_id), timers.THROTTLE, step_name), str(instance_id),
+                                fire_at, ACTIONS_QUEUE, payload)
+                actions_deferred_total.labels(action=action_name, deferred_by="worker").inc()
+                log.info("Action over its limits; deferred", action=action_name, step=step_name,
+                         instance_id=instance_id, wait_seconds=round(wait_seconds, 3))
+                return
+
+            data = instance_row["data"] or {}
+            if item_index is not None:
+                # A map step item: the action sees its item next to the instance data
+                data = {**data, "item": item, "item_index": item_index}
+
             try:
-                result: ActionResult = handler.execute(instance_id, instance_row["data"] or {}, config=config, task_context=task_context)
+                result: ActionResult = handler.execute(instance_id, data, config=config, task_context=task_context)
             except Exception as e:
                 log.error("Action handler raised exception", action=action_name, error=str(e), exc_info=True)
                 result = ActionResult(status=ActionStatus.FAILURE, error_message=str(e))
+            finally:
+                if lease is not None:
+                    self.limiter.release(limits, lease)
 
             # Send result back to orchestrator via outbox
             event_type = STEP_COMPLETE_EVENT if result.status == ActionStatus.SUCCESS else STEP_FAILED_EVENT
@@ -69,9 +111,6 @@ class WorkerService:
             if result.updated_data:
                 payload["data"] = result.updated_data
 
-            cur.execute(
-                "INSERT INTO outbox (destination, payload) VALUES (%s, %s)",
-                (ORCHESTRATION_QUEUE, json.dumps(payload))
-            )
+            outbox.insert_message(cur, ORCHESTRATION_QUEUE, payload)
 
             log.info("Action finished", action=action_name, step=step_name, status=result.status.value)
@@ -1,5 +1,7 @@
 from src.shared.celery_app import app
 from src.shared.constants import ACTIONS_QUEUE
+from src.shared.cancellations import cancelled_instances
+from src.shared.action_limits import action_limiter
 
 from src.worker.service import WorkerService
 from src.worker.registry import get_registry
@@ -14,7 +16,7 @@ registry = get_registry()
     bind=True,
 )
 def execute_action(self, message: dict):
-    service = WorkerService(registry)
+    service = WorkerService(registry, cancelled_instances, action_limiter)
     service.execute_action(
         action_name=message.get("action"),
         instance_id=message.get("instance_id"),
@@ -22,4 +24,6 @@ def execute_action(self, message: dict):
         config=message.get("config"),
         connection_id=message.get("connection_id"),
         task_context=self,
+        item=message.get("item"),
+        item_index=message.get("item_index"),
     )
@@ -0,0 +1,117 @@
+"""Unit tests for the distributed action limiter."""
+from src.shared.action_limits import ActionLimit, ActionLimiter, CONNECTION, CONNECTOR, HOST, target_host
+
+
+class FakeScript:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __call__(self, keys, args):
+        if self.redis.fail:
+            raise ConnectionError("redis down")
+        self.redis.calls.append((keys, args))
+        return self.redis.wait_ms
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def zrem(self, key, member):
+        self.redis.released.append((key, member))
+
+    def execute(self):
+        return []
+
+
+class FakeRedis:
+    def __init__(self, wait_ms=0, fail=False):
+        self.wait_ms = wait_ms
+        self.fail = fail
+        self.calls = []
+        self.released = []
+
+    def register_script(self, script):
+        return FakeScript(self)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+LIMITS = [
+    ActionLimit(CONNECTION, "c1", max_in_flight=5),
+    ActionLimit(CONNECTOR, "http", rate_per_second=2.5),
+    ActionLimit(HOST, "db.internal", max_in_flight=20, rate_per_second=100, burst=10),
+]
+
+
+def limiter(redis, limits=LIMITS):
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return limits
+    return ActionLimiter(redis, loader=loader, ttl_seconds=60), loads
+
+
+class TestActionLimiter:
+    """Tests for ActionLimiter and target_host."""
+
+    def test_limits_match_connection_connector_and_host(self):
+        """Test that an action picks up the limits for its connection, its connector and its target host."""
+        actions, loads = limiter(FakeRedis())
+
+        found = actions.limits_for("http_request", "c1", {"url": "https://db.internal:8443/q"})
+        assert [limit.scope for limit in found] == [CONNECTION, CONNECTOR, HOST]
+        assert actions.limits_for("log", "c2", {}) == []
+        assert len(loads) == 1
+
+    def test_target_host_skips_templated_hosts(self):
+        """Test that a host is read from a URL or DSN but not from a template still to be filled in."""
+        assert target_host({"connection_string": "postgresql://u:p@db.internal:5432/app"}) == "db.internal"
+        assert target_host({"url": "https://{{host}}/x"}) is None
+        assert target_host({"url": "/relative"}) is None
+
+    def test_acquire_takes_a_lease_or_reports_the_wait(self):
+        """Test that a free limit hands out a lease, a full one a wait with jitter, and releases only touch in-flight sets."""
+        redis = FakeRedis()
+        actions, _ = limiter(redis)
+        found = actions.limits_for("http_request", "c1", {"url": "https://db.internal"})
+
+        lease, wait = actions.acquire(found)
+        keys, args = redis.calls[-1]
+        assert wait == 0 and lease == args[0]
+        assert keys[:2] == ["limit:connection:c1:in_flight", "limit:connection:c1:bucket"]
+        assert args[3:] == [5, 0, 1, 0, 2.5, 3, 20, 100, 10]
+
+        actions.release(found, lease)
+        assert [key for key, _ in redis.released] == ["limit:connection:c1:in_flight", "limit:host:db.internal:in_flight"]
+
+        redis.wait_ms = 400
+        lease, wait = actions.acquire(found)
+        assert lease is None and 0.4 <= wait <= 0.44
+
+    def test_delay_checks_without_a_lease(self):
+        """Test that the engine's check passes an empty lease, which the script treats as look-only."""
+        redis = FakeRedis(wait_ms=1000)
+        actions, _ = limiter(redis)
+
+        assert actions.delay(actions.limits_for("http_request")) >= 1.0
+        assert redis.calls[-1][1][0] == ""
+
+    def test_no_limits_means_no_redis_call(self):
+        """Test that actions without limits never reach Redis."""
+        redis = FakeRedis()
+        actions, _ = limiter(redis, limits=[])
+
+        assert actions.acquire(actions.limits_for("http_request", "c1")) == (None, 0.0)
+        assert redis.calls == []
+
+    def test_redis_failure_lets_actions_through(self):
+        """Test that a Redis outage neither raises nor defers the action."""
+        actions, _ = limiter(FakeRedis(fail=True))
+        found = actions.limits_for("http_request", "c1")
+
+        lease, wait = actions.acquire(found)
+        assert wait == 0
+        actions.release(found, lease)
@@ -0,0 +1,111 @@
+"""Unit tests for the asyncio outbox relay."""
+import asyncio
+import json
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from src.shared.celery_app import app as celery_app
+from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
+from src.relay.async_engine import AsyncRelay, COMPLETE_SQL
+
+
+def make_relay(**kwargs):
+    return AsyncRelay(celery_app, dsn="postgresql://test", amqp_url="amqp://test", relay_id="relay-1", **kwargs)
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        pool = self
+
+        class _Ctx:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Ctx()
+
+
+class TestAsyncRelay:
+    """Tests for AsyncRelay pipelines and message building."""
+
+    def test_one_pipeline_per_destination(self):
+        """Test that each routed destination gets its own pipeline."""
+        relay = make_relay()
+
+        assert {p.destination for p in relay.pipelines} == {ORCHESTRATION_QUEUE, ACTIONS_QUEUE}
+
+    def test_build_message_matches_celery_protocol(self):
+        """Test that built messages carry the Celery task headers and JSON body."""
+        relay = make_relay()
+        pipeline = next(p for p in relay.pipelines if p.destination == ORCHESTRATION_QUEUE)
+        row = {
+            "id": "msg-1",
+            "payload": json.dumps({"instance_id": "inst-1"}),
+            "request_id": "req-1",
+            "publish_at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        }
+
+        message = pipeline.build_message(row)
+
+        assert message.headers["task"] == "engine.orchestrate"
+        assert message.headers["id"] == "msg-1"
+        assert message.headers["request_id"] == "req-1"
+        assert message.content_type == "application/json"
+        args, kwargs, _ = json.loads(message.body)
+        assert args == [{"instance_id": "inst-1"}]
+
+    def test_settle_loop_batches_ids_into_one_update(self):
+        """Test that ids settled within the flush window share one UPDATE."""
+        relay = make_relay(ack_flush_seconds=0.05)
+        conn = MagicMock()
+        conn.execute = AsyncMock()
+        relay.pool = FakePool(conn)
+        pipeline = relay.pipelines[0]
+
+        async def scenario():
+            for msg_id in ("a", "b", "c"):
+                pipeline.ack_queue.put_nowait(msg_id)
+            task = asyncio.create_task(pipeline.settle_loop(pipeline.ack_queue, COMPLETE_SQL, "Relayed messages."))
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(scenario())
+
+        conn.execute.assert_awaited_once_with(COMPLETE_SQL, ["a", "b", "c"], "relay-1")
+
+    def test_rows_of_one_instance_share_a_publish_lane(self):
+        """Test that an instance's rows always land in the same lane, so they are published in order."""
+        relay = make_relay(publish_concurrency=8)
+        pipeline = relay.pipelines[0]
+
+        def row(msg_id, instance_id):
+            return {"id": msg_id, "payload": json.dumps({"instance_id": instance_id})}
+
+        assert len(pipeline.lanes) == 8
+        assert pipeline.lane_for(row("a", "inst-1")) is pipeline.lane_for(row("b", "inst-1"))
+        assert len({id(pipeline.lane_for(row(str(n), f"inst-{n}"))) for n in range(50)}) > 1
+
+    def test_row_past_its_publish_deadline_is_released(self):
+        """Test that a row held back until its lease runs short is released instead of published."""
+        relay = make_relay()
+        pipeline = relay.pipelines[0]
+        pipeline.exchange = MagicMock()
+        pipeline.exchange.publish = AsyncMock()
+        row = {"id": "late", "payload": json.dumps({"instance_id": "inst-1"}), "request_id": None}
+
+        async def scenario():
+            lane = pipeline.lane_for(row)
+            lane.put_nowait((row, 0.0))
+            task = asyncio.create_task(pipeline.publish_loop(lane))
+            released = await asyncio.wait_for(pipeline.release_queue.get(), 1)
+            task.cancel()
+            return released
+
+        assert asyncio.run(scenario()) == "late"
+        pipeline.exchange.publish.assert_not_awaited()
+        assert pipeline.ack_queue.empty()
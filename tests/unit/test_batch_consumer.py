@@ -0,0 +1,149 @@
+"""Unit tests for the orchestration batch consumer."""
+from datetime import datetime, timedelta, timezone
+
+from src.orchestration.application.orchestration_service import RetryableError, NonRetryableError
+from src.shared.constants import ORCHESTRATION_QUEUE
+from src.shared.partitioning import partition_queue, partition_for
+from src.orchestration.entrypoint.batch_consumer import BatchConsumer, ORCHESTRATE_TASK
+
+
+class FakeMessage:
+    def __init__(self, body, task=ORCHESTRATE_TASK, retries=0, eta=None):
+        self.headers = {"task": task, "retries": retries, "eta": eta}
+        self.body = body
+        self.state = None
+
+    def decode(self):
+        return [self.body], {}, {}
+
+    def ack(self):
+        self.state = "acked"
+
+    def reject(self, requeue=False):
+        self.state = "requeued" if requeue else "dead-lettered"
+
+
+class FakeCeleryApp:
+    def __init__(self):
+        self.sent = []
+        self.tasks = {}
+
+    def send_task(self, name, **options):
+        self.sent.append((name, options))
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.prefetch = None
+
+    def qos(self, prefetch_count):
+        self.prefetch = prefetch_count
+
+
+class FakeService:
+    def __init__(self, errors):
+        self.errors = errors
+        self.batches = []
+
+    def process_batch(self, events):
+        self.batches.append(events)
+        return [self.errors.get(e.instance_id) for e in events]
+
+
+def make_consumer(errors, partitions=None):
+    app = FakeCeleryApp()
+    service = FakeService(errors)
+    return BatchConsumer(app, lambda: service, partitions=partitions), app, service
+
+
+class TestBatchConsumer:
+    """Tests for settling a batch after process_batch."""
+
+    def test_batch_is_processed_together_and_acked(self):
+        """Test that buffered events go to the service as one batch and are acked after it."""
+        consumer, _, service = make_consumer({})
+        messages = [FakeMessage({"instance_id": "i1", "type": "START_WORKFLOW"}),
+                    FakeMessage({"instance_id": "i2", "type": "START_WORKFLOW"})]
+        consumer.buffer = [(ORCHESTRATION_QUEUE, m) for m in messages]
+
+        consumer.flush()
+
+        assert len(service.batches) == 1
+        assert [e.instance_id for e in service.batches[0]] == ["i1", "i2"]
+        assert [m.state for m in messages] == ["acked", "acked"]
+
+    def test_failures_are_settled_per_event(self):
+        """Test that a retryable failure is republished and a non-retryable one dead-lettered."""
+        consumer, app, _ = make_consumer({"i2": RetryableError("locked"), "i3": NonRetryableError("gone")})
+        messages = [FakeMessage({"instance_id": i, "type": "START_WORKFLOW"}, retries=2) for i in ("i1", "i2", "i3")]
+        consumer.buffer = [(ORCHESTRATION_QUEUE, m) for m in messages]
+
+        consumer.flush()
+
+        assert [m.state for m in messages] == ["acked", "acked", "dead-lettered"]
+        ((name, options),) = app.sent
+        assert name == ORCHESTRATE_TASK
+        assert options["retries"] == 3
+        assert options["args"] == [{"instance_id": "i2", "type": "START_WORKFLOW"}]
+
+    def test_malformed_event_is_dead_lettered(self):
+        """Test that an event with an unknown type is rejected without reaching the service."""
+        consumer, _, service = make_consumer({})
+        message = FakeMessage({"instance_id": "i1", "type": "NOT_A_TYPE"})
+        consumer.buffer = [(ORCHESTRATION_QUEUE, message)]
+
+        consumer.flush()
+
+        assert message.state == "dead-lettered"
+        assert service.batches == []
+
+    def test_shared_queue_events_are_forwarded_to_their_partition(self, monkeypatch):
+        """Test that a partitioned consumer republishes shared-queue events and processes partition events."""
+        monkeypatch.setattr("src.orchestration.entrypoint.batch_consumer.route_queue",
+                            lambda destination, payload: partition_queue(partition_for(payload["instance_id"], 8)))
+        consumer, app, service = make_consumer({}, partitions=object())
+        shared = FakeMessage({"instance_id": "i1", "type": "START_WORKFLOW"})
+        owned = FakeMessage({"instance_id": "i2", "type": "START_WORKFLOW"})
+        consumer.buffer = [(ORCHESTRATION_QUEUE, shared), (partition_queue(partition_for("i2", 8)), owned)]
+
+        consumer.flush()
+
+        assert [e.instance_id for e in service.batches[0]] == ["i2"]
+        ((_, options),) = app.sent
+        assert options["queue"] == partition_queue(partition_for("i1", 8))
+        assert options["countdown"] is None
+        assert shared.state == owned.state == "acked"
+
+    def test_retried_event_waits_for_its_countdown(self, monkeypatch):
+        """Test that a republished event is held unacked until its eta, with the prefetch raised meanwhile."""
+        clock = [100.0]
+        monkeypatch.setattr("src.orchestration.entrypoint.batch_consumer.time.monotonic", lambda: clock[0])
+        consumer, app, service = make_consumer({})
+        consumer.consumers[ORCHESTRATION_QUEUE] = queue = FakeConsumer()
+        eta = (datetime.now(timezone.utc) + timedelta(seconds=5)).isoformat()
+        retried = FakeMessage({"instance_id": "i1", "type": "START_WORKFLOW"}, retries=1, eta=eta)
+
+        consumer._on_message(ORCHESTRATION_QUEUE, retried)
+        consumer._release_due()
+        consumer.flush()
+
+        assert service.batches == [] and retried.state is None
+        assert queue.prefetch == consumer.batch_size + 1
+
+        clock[0] += 5
+        consumer._release_due()
+        consumer.flush()
+
+        assert [e.instance_id for e in service.batches[0]] == ["i1"]
+        assert retried.state == "acked"
+        assert queue.prefetch == consumer.batch_size
+
+    def test_lock_failure_is_republished_with_its_countdown(self):
+        """Test that a lock failure comes back after the same countdown the Celery task uses."""
+        consumer, app, _ = make_consumer({"i1": RetryableError("locked")})
+        consumer.buffer = [(ORCHESTRATION_QUEUE, FakeMessage({"instance_id": "i1", "type": "START_WORKFLOW"}))]
+
+        consumer.flush()
+
+        ((_, options),) = app.sent
+        assert options["countdown"] == 5
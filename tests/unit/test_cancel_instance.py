@@ -0,0 +1,86 @@
+"""Unit tests for cancelling instances through the API service and repository."""
+from contextlib import contextmanager
+from unittest.mock import Mock, patch
+
+import pytest
+
+from src.api.errors import InstanceNotFoundError, InvalidStateError
+from src.api.repository import WorkflowRepository
+from src.api.service import WorkflowManagementService
+from src.shared.connectors.registry import ConnectorRegistry
+from src.shared.constants import ACTIONS_QUEUE, ORCHESTRATION_QUEUE
+
+
+@contextmanager
+def fake_cursor():
+    yield Mock()
+
+
+class TestCancelInstance:
+    """Tests for WorkflowManagementService.cancel_instance."""
+
+    def setup_method(self):
+        """Patch the database and the post-commit side effects."""
+        self.repo = Mock()
+        self.repo.release_admission.return_value = []
+        self.repo.purge_scheduled_work.return_value = []
+        patches = [
+            patch("src.api.service.db_cursor", fake_cursor),
+            patch("src.api.service.WorkflowRepository", return_value=self.repo),
+            patch.object(WorkflowManagementService, "_stop_cancelled"),
+        ]
+        for p in patches:
+            p.start()
+        self.patches = patches
+        self.service = WorkflowManagementService(ConnectorRegistry())
+
+    def teardown_method(self):
+        """Undo the patches."""
+        for p in self.patches:
+            p.stop()
+
+    def test_cancels_through_the_guarded_update(self):
+        """Test that the status change only goes through the update that skips finished instances."""
+        self.repo.cancel_instances.return_value = [
+            {"id": "i1", "workflow_version_id": "v1", "admitted": True, "parent_instance_id": None, "parent_step": None}]
+
+        assert self.service.cancel_instance("i1")["instance_id"] == "i1"
+        self.repo.cancel_instances.assert_called_once_with(["i1"])
+        self.repo.update_instance_status.assert_not_called()
+        self.repo.release_admission.assert_called_once_with("v1", 1)
+
+    def test_finished_instance_keeps_its_status_and_slot(self):
+        """Test that an instance finished by the engine is refused without releasing its admission slot again."""
+        self.repo.cancel_instances.return_value = []
+        self.repo.get_instance.return_value = {"id": "i1", "status": "completed", "admitted": True}
+
+        with pytest.raises(InvalidStateError):
+            self.service.cancel_instance("i1")
+        self.repo.release_admission.assert_not_called()
+        self.repo.update_instance_status.assert_not_called()
+
+    def test_unknown_instance(self):
+        """Test that cancelling an instance that does not exist is reported as not found."""
+        self.repo.cancel_instances.return_value = []
+        self.repo.get_instance.return_value = None
+
+        with pytest.raises(InstanceNotFoundError):
+            self.service.cancel_instance("missing")
+
+
+class TestPurgeScheduledWork:
+    """Tests for WorkflowRepository.purge_scheduled_work."""
+
+    def test_only_rows_in_flight_are_revoked(self):
+        """Test that only deleted action rows still leased for publishing are revoked, with no scan of processed rows."""
+        cursor = Mock()
+        cursor.fetchall.return_value = [
+            {"id": "leased", "destination": ACTIONS_QUEUE, "lease_owner": "direct:host:1"},
+            {"id": "queued", "destination": ACTIONS_QUEUE, "lease_owner": None},
+            {"id": "event", "destination": ORCHESTRATION_QUEUE, "lease_owner": "relay-1"},
+        ]
+
+        assert WorkflowRepository(cursor).purge_scheduled_work(["i1"]) == ["leased"]
+        outbox_sql = cursor.execute.call_args_list[-1][0][0]
+        assert outbox_sql.startswith("DELETE FROM outbox") and "processed_at IS NULL" in outbox_sql
+        assert "processed_at IS NOT NULL" not in outbox_sql
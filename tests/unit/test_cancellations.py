@@ -0,0 +1,77 @@
+"""Unit tests for the cancelled-instance cache."""
+from src.shared.cancellations import CancelledInstances, KEY_PREFIX
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def set(self, key, value, ex=None):
+        self.ops.append(("set", key, ex))
+
+    def exists(self, key):
+        self.ops.append(("exists", key, None))
+
+    def execute(self):
+        self.redis.round_trips += 1
+        results = []
+        for op, key, ex in self.ops:
+            if op == "set":
+                self.redis.keys[key] = ex
+                results.append(True)
+            else:
+                results.append(1 if key in self.redis.keys else 0)
+        return results
+
+
+class FakeRedis:
+    def __init__(self, fail=False):
+        self.keys = {}
+        self.round_trips = 0
+        self.fail = fail
+
+    def pipeline(self, transaction=True):
+        if self.fail:
+            raise ConnectionError("redis down")
+        return FakePipeline(self)
+
+
+class TestCancelledInstances:
+    """Tests for CancelledInstances."""
+
+    def test_mark_is_seen_by_other_processes(self):
+        """Test that marked instances are written with a TTL and found by a fresh cache."""
+        redis = FakeRedis()
+        CancelledInstances(redis, ttl_seconds=60).mark(["i1", "i2"])
+
+        other = CancelledInstances(redis)
+        assert redis.keys == {KEY_PREFIX + "i1": 60, KEY_PREFIX + "i2": 60}
+        assert other.cancelled(["i1", "i3", "i2"]) == {"i1", "i2"}
+
+    def test_positive_answers_are_remembered(self):
+        """Test that an instance found cancelled is not looked up in Redis again."""
+        redis = FakeRedis()
+        CancelledInstances(redis).mark(["i1"])
+        cache = CancelledInstances(redis)
+
+        assert cache.is_cancelled("i1")
+        trips = redis.round_trips
+        assert cache.is_cancelled("i1")
+        assert redis.round_trips == trips
+
+    def test_many_instances_are_checked_in_chunks(self):
+        """Test that a large check costs one round trip per chunk, not per instance."""
+        redis = FakeRedis()
+        cache = CancelledInstances(redis)
+
+        assert cache.cancelled([f"i{n}" for n in range(2500)]) == set()
+        assert redis.round_trips == 3
+
+    def test_redis_failure_reads_as_not_cancelled(self):
+        """Test that a Redis outage neither raises nor reports unknown instances as cancelled."""
+        cache = CancelledInstances(FakeRedis(fail=True))
+
+        cache.mark(["i1"])
+        assert cache.is_cancelled("i1")
+        assert not cache.is_cancelled("i2")
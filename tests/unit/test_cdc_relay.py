@@ -0,0 +1,119 @@
+"""Unit tests for the logical replication (CDC) outbox relay."""
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+from src.relay.cdc import CdcRelay, DelayedScheduler
+from src.relay.pgoutput import PgOutputDecoder, Insert
+from src.shared.constants import ORCHESTRATION_QUEUE
+from src.shared.publisher import OutboundMessage
+
+COLUMNS = ["id", "destination", "payload", "publish_at", "created_at", "processed_at", "request_id"]
+
+
+def relation_message(relation_id=16384, columns=COLUMNS):
+    data = b"R" + struct.pack("!I", relation_id) + b"public\x00outbox\x00" + b"d" + struct.pack("!h", len(columns))
+    for column in columns:
+        data += b"\x00" + column.encode() + b"\x00" + struct.pack("!Ii", 25, -1)
+    return data
+
+
+def insert_message(values, relation_id=16384):
+    data = b"I" + struct.pack("!I", relation_id) + b"N" + struct.pack("!h", len(values))
+    for value in values:
+        if value is None:
+            data += b"n"
+        else:
+            encoded = value.encode()
+            data += b"t" + struct.pack("!i", len(encoded)) + encoded
+    return data
+
+
+def begin_message(xid=1):
+    return b"B" + struct.pack("!QqI", 100, 0, xid)
+
+
+def commit_message(end_lsn):
+    return b"C" + struct.pack("!bQQq", 0, end_lsn - 1, end_lsn, 0)
+
+
+def outbox_row(msg_id, delay_seconds=0):
+    created = datetime.now(timezone.utc)
+    publish = created + timedelta(seconds=delay_seconds)
+    return [msg_id, ORCHESTRATION_QUEUE, json.dumps({"instance_id": msg_id}),
+            publish.isoformat(sep=" "), created.isoformat(sep=" "), None, None]
+
+
+class TestPgOutputDecoder:
+    """Tests for the pgoutput protocol decoder."""
+
+    def test_decodes_insert_against_relation(self):
+        """Test that insert tuples are mapped onto the columns of their relation."""
+        decoder = PgOutputDecoder()
+        decoder.decode(relation_message())
+
+        insert = decoder.decode(insert_message(["a", ORCHESTRATION_QUEUE, "{}", "2026-10-18 00:00:00+00", None, None, "req"]))
+
+        assert isinstance(insert, Insert)
+        assert insert.relation.name == "outbox"
+        assert insert.values["destination"] == ORCHESTRATION_QUEUE
+        assert insert.values["created_at"] is None
+        assert insert.values["request_id"] == "req"
+
+
+class TestCdcRelay:
+    """Tests for CdcRelay transaction buffering and LSN acknowledgement."""
+
+    def setup_method(self):
+        self.publisher = Mock()
+        self.relay = CdcRelay(Mock(), publisher=self.publisher)
+        self.relay.cursor = Mock()
+
+    def stream(self, *messages):
+        for message in messages:
+            self.relay.handle(message)
+
+    def test_flush_lsn_stops_before_unconfirmed_commit(self):
+        """Test that the slot only advances past commits whose messages were all confirmed."""
+        self.stream(
+            relation_message(),
+            begin_message(1), insert_message(outbox_row("a")), commit_message(200),
+            begin_message(2), insert_message(outbox_row("b")), commit_message(300),
+            begin_message(3), insert_message(outbox_row("c")), commit_message(400),
+        )
+        self.publisher.publish_batch.return_value = ["a", "c"]
+
+        self.relay.flush_pending()
+
+        self.relay.cursor.send_feedback.assert_called_once_with(flush_lsn=200)
+        assert [(lsn, [m.id for m in batch]) for lsn, batch in self.relay.pending] == [(300, ["b"]), (400, [])]
+
+    def test_delayed_rows_go_to_scheduler_after_commit(self):
+        """Test that delayed rows are scheduled, not published, and only once their transaction commits."""
+        self.stream(relation_message(), begin_message(), insert_message(outbox_row("later", delay_seconds=60)))
+        assert len(self.relay.scheduler) == 0
+
+        self.stream(commit_message(200))
+
+        assert len(self.relay.scheduler) == 1
+        assert self.relay.pending[0] == (200, [])
+
+
+class TestDelayedScheduler:
+    """Tests for the CDC relay's in-memory delay scheduler."""
+
+    def test_pops_due_in_order_and_dedupes(self):
+        """Test that due messages come out by publish_at and a re-added id is ignored."""
+        scheduler = DelayedScheduler()
+        now = datetime(2026, 10, 18, tzinfo=timezone.utc)
+        msg = lambda i: OutboundMessage(id=i, task_name="t", queue=ORCHESTRATION_QUEUE, payload={})
+        scheduler.add(now + timedelta(seconds=2), msg("b"))
+        scheduler.add(now + timedelta(seconds=1), msg("a"))
+        scheduler.add(now + timedelta(seconds=1), msg("a"))
+        scheduler.add(now + timedelta(seconds=30), msg("c"))
+
+        due = scheduler.pop_due(now + timedelta(seconds=5), limit=10)
+
+        assert [m.id for m in due] == ["a", "b"]
+        assert scheduler.seconds_until_next(now + timedelta(seconds=5)) == 25
@@ -0,0 +1,651 @@
+"""Unit tests for OrchestrationService on the in-memory adapters."""
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+from src.shared.constants import ACTIONS_QUEUE, ORCHESTRATION_QUEUE
+from src.orchestration.adapters.in_memory import (
+    InMemoryStore, InMemoryUnitOfWork, InMemoryLockService, InMemoryEventBuffer
+)
+from src.orchestration.application.orchestration_service import (
+    OrchestrationService, RetryableError, NonRetryableError
+)
+from src.orchestration.domain.events import WorkflowEvent
+from src.orchestration.domain.models import EventType, WorkflowVersion, WorkflowInstance, WorkflowStatus
+from src.orchestration.entrypoint.benchmark import ORDER_PRIORITY_DEFINITION, run_benchmark
+from src.worker.registry import get_inline_registry
+from src.shared.cancellations import CancelledInstances
+
+
+def make_service(definition, data=None, event_buffer=None, inline_handlers=None):
+    store = InMemoryStore()
+    store.add_version(WorkflowVersion(id="v1", definition=definition, workflow_name="test"))
+    store.add_instance(WorkflowInstance(id="i1", workflow_version_id="v1", status=WorkflowStatus.PENDING,
+                                        data=data or {}, created_at=datetime.now(timezone.utc)))
+    lock = InMemoryLockService()
+    return OrchestrationService(InMemoryUnitOfWork(store), lock, event_buffer, inline_handlers), store, lock
+
+
+class TestOrchestrationService:
+    """Tests for event handling through process_event."""
+
+    def test_start_dispatches_first_action(self):
+        """Test that starting a workflow runs its first step and writes one action message."""
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        instance = store.instances["i1"]
+        assert instance.status == WorkflowStatus.RUNNING
+        assert instance.current_step == "compute_priority"
+        assert [(m.destination, m.payload["action"]) for m in store.outbox] == [(ACTIONS_QUEUE, "python_execute")]
+
+    def test_branch_follows_completed_step_data(self):
+        """Test that step output is merged before the branch is evaluated."""
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "compute_priority", {"priority": "high"}))
+
+        assert store.instances["i1"].current_step == "set_expedited"
+        assert [s.step_name for s in store.step_executions["i1"]] == ["compute_priority", "check_priority", "set_expedited"]
+
+    def test_delay_step_schedules_resume(self):
+        """Test that a delay step sets a timer for a STEP_COMPLETE instead of writing to the outbox."""
+        definition = {"start_at": "wait", "steps": {"wait": {"type": "delay", "duration_seconds": 30, "next": "end"}}}
+        service, store, _ = make_service(definition)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.outbox == []
+        timer = store.timers["i1:delay:wait"]
+        assert timer.destination == ORCHESTRATION_QUEUE
+        assert timer.payload["type"] == EventType.STEP_COMPLETE.value
+        assert timer.fire_at > datetime.now(timezone.utc)
+
+    def test_wait_timeout_is_cancelled_when_event_arrives(self):
+        """Test that a wait step's timeout timer is dropped once the step completes."""
+        definition = {"start_at": "approve", "steps": {
+            "approve": {"type": "wait_for_event", "timeout_seconds": 3600, "next": "end"}}}
+        service, store, _ = make_service(definition)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        assert store.timers["i1:timeout:approve"].payload["type"] == EventType.STEP_FAILED.value
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "approve", {"approved": True}))
+
+        assert store.timers == {}
+        assert store.instances["i1"].status == WorkflowStatus.COMPLETED
+
+    def test_retry_backoff_uses_a_timer(self):
+        """Test that a retry with a delay waits in a timer and one without goes straight to the outbox."""
+        for delay, timers, messages in ((5, ["i1:retry:fetch"], 0), (0, [], 1)):
+            definition = {"start_at": "fetch", "steps": {"fetch": {
+                "action_id": "http_request", "retry": {"max_attempts": 2, "delay_seconds": delay}, "next": "end"}}}
+            service, store, _ = make_service(definition)
+            service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+            store.outbox.clear()
+
+            service.process_event(WorkflowEvent("i1", EventType.STEP_FAILED, "fetch", {"error": "503"}))
+
+            assert list(store.timers) == timers
+            assert len(store.outbox) == messages
+
+    def test_dangling_next_step_is_not_retryable(self):
+        """Test that a next step missing from the definition fails the event without writing anything."""
+        definition = {"start_at": "first", "steps": {"first": {"type": "delay", "duration_seconds": 1, "next": "gone"}}}
+        service, store, _ = make_service(definition)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        with pytest.raises(NonRetryableError):
+            service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "first"))
+        assert store.instances["i1"].current_step == "first"
+
+    def test_lock_contention_is_retryable(self):
+        """Test that an event for a locked instance raises RetryableError and changes nothing."""
+        service, store, lock = make_service(ORDER_PRIORITY_DEFINITION)
+        lock.acquire_lock("lock:instance:i1", 30)
+
+        with pytest.raises(RetryableError):
+            service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.instances["i1"].status == WorkflowStatus.PENDING
+
+
+class TestInlineActions:
+    """Tests for running inline-safe actions inside the engine."""
+
+    def test_inline_steps_chain_to_completion(self):
+        """Test that the seeded workflow needs one worker round trip when its internal steps run inline."""
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION, data={"order": {"quantity": 150}},
+                                         inline_handlers=get_inline_registry())
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        store.outbox.clear()
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "compute_priority", {"priority": "high"}))
+
+        instance = store.instances["i1"]
+        assert instance.status == WorkflowStatus.COMPLETED
+        assert instance.data["expedited"] is True
+        assert store.outbox == []
+        assert [s.status.value for s in store.step_executions["i1"]] == ["completed"] * 4
+
+    def test_failed_inline_action_retries_through_worker(self):
+        """Test that an inline action that raises is retried as a normal worker dispatch."""
+        class Broken:
+            def execute(self, instance_id, data, **kwargs):
+                raise ValueError("bad config")
+
+        definition = {"start_at": "shape", "steps": {"shape": {
+            "type": "action", "action_id": "transform_data", "retry": {"max_attempts": 3}, "next": "end"}}}
+        service, store, _ = make_service(definition, inline_handlers={"transform_data": Broken()})
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        instance = store.instances["i1"]
+        assert instance.status == WorkflowStatus.RUNNING
+        assert instance.current_step_attempts == 2
+        assert store.outbox == []
+        timer = store.timers["i1:retry:shape"]
+        assert (timer.destination, timer.payload["action"]) == (ACTIONS_QUEUE, "transform_data")
+
+
+PARALLEL_DEFINITION = {"start_at": "notify", "steps": {
+    "notify": {
+        "type": "parallel",
+        "branches": {
+            "slack": {"action_id": "slack_send_message", "config": {"text": "hi"}},
+            "issue": {"action_id": "github_create_issue", "config": {}, "retry": {"max_attempts": 2}},
+        },
+        "join": "all",
+        "next": "end",
+    },
+}}
+
+
+class TestParallelSteps:
+    """Tests for fanning out to parallel branches and joining them."""
+
+    def test_branches_are_dispatched_together(self):
+        """Test that every branch gets its own step execution and action message."""
+        service, store, _ = make_service(PARALLEL_DEFINITION)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert sorted(m.payload["step_name"] for m in store.outbox) == ["notify.issue", "notify.slack"]
+        assert [s.step_name for s in store.step_executions["i1"]] == ["notify", "notify.slack", "notify.issue"]
+        assert store.instances["i1"].current_step == "notify"
+
+    def test_join_all_merges_changes_from_every_branch(self):
+        """Test that the step completes after both branches, keeping each branch's own changes."""
+        service, store, _ = make_service(PARALLEL_DEFINITION, data={"shared": 0})
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "notify.slack", {"shared": 0, "ts": "1"}))
+        assert store.instances["i1"].status == WorkflowStatus.RUNNING
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "notify.issue", {"shared": 0, "issue": 7}))
+
+        instance = store.instances["i1"]
+        assert instance.status == WorkflowStatus.COMPLETED
+        assert instance.data == {"shared": 0, "ts": "1", "issue": 7}
+
+    def test_branch_failure_retries_then_fails_the_join(self):
+        """Test that a branch retries on its own policy and fails an 'all' join once it runs out."""
+        service, store, _ = make_service(PARALLEL_DEFINITION)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_FAILED, "notify.issue", {"error": "503"}))
+        assert store.timers["i1:retry:notify.issue"].payload["step_name"] == "notify.issue"
+        assert store.instances["i1"].status == WorkflowStatus.RUNNING
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_FAILED, "notify.issue", {"error": "503"}))
+        assert store.instances["i1"].status == WorkflowStatus.FAILED
+
+    def test_join_any_moves_on_and_ignores_late_branches(self):
+        """Test that the first completion satisfies 'any' and a later one is ignored as stale."""
+        definition = {"start_at": "notify", "steps": {
+            "notify": dict(PARALLEL_DEFINITION["steps"]["notify"], join="any", next="after"),
+            "after": {"type": "wait_for_event", "next": "end"},
+        }}
+        service, store, _ = make_service(definition)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "notify.issue", {"issue": 7}))
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "notify.slack", {"ts": "1"}))
+
+        instance = store.instances["i1"]
+        assert instance.current_step == "after"
+        assert instance.data == {"issue": 7}
+
+
+MAP_DEFINITION = {"start_at": "commits", "steps": {
+    "commits": {
+        "type": "map",
+        "items": "push.commits",
+        "action": {"action_id": "http_request", "config": {"url": "https://ci/{{item.sha}}"}, "retry": {"max_attempts": 2}},
+        "max_concurrency": 2,
+        "next": "end",
+    },
+}}
+
+
+def map_service(count):
+    return make_service(MAP_DEFINITION, data={"push": {"commits": [{"sha": f"c{i}"} for i in range(count)]}})
+
+
+class TestMapSteps:
+    """Tests for running an action per list item with bounded concurrency."""
+
+    def test_only_max_concurrency_items_are_in_flight(self):
+        """Test that items beyond max_concurrency wait until an earlier item settles."""
+        service, store, _ = map_service(3)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        assert [(m.payload["step_name"], m.payload["item"]) for m in store.outbox] == [
+            ("commits[0]", {"sha": "c0"}), ("commits[1]", {"sha": "c1"})]
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "commits[1]", {"status": 200}))
+        assert store.outbox[-1].payload["step_name"] == "commits[2]"
+        assert store.outbox[-1].payload["item_index"] == 2
+
+    def test_results_are_collected_in_item_order(self):
+        """Test that results land in instance data by index, whatever order items finish in."""
+        service, store, _ = map_service(3)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        for index in (1, 0, 2):
+            data = dict(store.instances["i1"].data, item={"sha": f"c{index}"}, item_index=index, status=200 + index)
+            service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, f"commits[{index}]", data))
+
+        instance = store.instances["i1"]
+        assert instance.status == WorkflowStatus.COMPLETED
+        assert instance.data["commits"] == [{"status": 200}, {"status": 201}, {"status": 202}]
+
+    def test_item_retries_then_fails_the_step(self):
+        """Test that an item is retried on its own and fails the workflow once out of attempts."""
+        service, store, _ = map_service(2)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_FAILED, "commits[0]", {"error": "timeout"}))
+        retry = store.timers["i1:retry:commits[0]"].payload
+        assert (retry["step_name"], retry["item"]) == ("commits[0]", {"sha": "c0"})
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_FAILED, "commits[0]", {"error": "timeout"}))
+        assert store.instances["i1"].status == WorkflowStatus.FAILED
+
+    def test_empty_list_completes_immediately(self):
+        """Test that a map over an empty list stores no results and moves on."""
+        service, store, _ = map_service(0)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.instances["i1"].status == WorkflowStatus.COMPLETED
+        assert store.instances["i1"].data["commits"] == []
+        assert store.outbox == []
+
+
+CALL_DEFINITION = {"start_at": "bill", "steps": {
+    "bill": {"type": "call_workflow", "workflow": "billing", "input": {"customer": "order.customer"},
+             "retry": {"max_attempts": 2, "delay_seconds": 0}, "next": "end"},
+}}
+CHILD_DEFINITION = {"start_at": "charge", "steps": {"charge": {"action_id": "http_request", "next": "end"}}}
+
+
+def call_service():
+    service, store, lock = make_service(CALL_DEFINITION, data={"order": {"customer": "acme", "total": 3}})
+    store.add_version(WorkflowVersion(id="v2", definition=CHILD_DEFINITION, workflow_name="billing"))
+    return service, store, lock
+
+
+def deliver(service, store):
+    """Take every outbox message, applying the engine's own until none are left; returns the action messages."""
+    actions = []
+    while store.outbox:
+        message = store.outbox.pop(0)
+        if message.destination == ACTIONS_QUEUE:
+            actions.append(message.payload)
+            continue
+        payload = message.payload
+        service.process_event(WorkflowEvent(payload["instance_id"], EventType(payload["type"]),
+                                            payload.get("step_name"), payload.get("data")))
+    return actions
+
+
+class TestCallWorkflow:
+    """Tests for starting a child workflow and resuming the parent when it ends."""
+
+    def test_child_starts_with_projected_data(self):
+        """Test that the step starts a pending child of the active version with the input projection."""
+        service, store, _ = call_service()
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        child = next(i for i in store.instances.values() if i.parent_instance_id == "i1")
+        assert (child.workflow_version_id, child.status, child.parent_step) == ("v2", WorkflowStatus.PENDING, "bill")
+        assert child.data == {"customer": "acme"}
+        assert store.outbox[-1].payload == {"type": "START_WORKFLOW", "instance_id": child.id, "request_id": None}
+
+    def test_child_completion_resumes_parent_with_its_data(self):
+        """Test that the child's final data lands under the step's result key and the parent moves on."""
+        service, store, _ = call_service()
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        [action] = deliver(service, store)
+
+        service.process_event(WorkflowEvent(action["instance_id"], EventType.STEP_COMPLETE, "charge",
+                                            {"customer": "acme", "charged": True}))
+        deliver(service, store)
+
+        parent = store.instances["i1"]
+        assert parent.status == WorkflowStatus.COMPLETED
+        assert parent.data["bill"] == {"customer": "acme", "charged": True}
+
+    def test_failed_child_is_retried_then_fails_parent(self):
+        """Test that a failed child starts a new one, and a stale result from the old child is ignored."""
+        service, store, _ = call_service()
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        [first] = deliver(service, store)
+
+        service.process_event(WorkflowEvent(first["instance_id"], EventType.STEP_FAILED, "charge", {"error": "402"}))
+        [second] = deliver(service, store)
+        assert second["instance_id"] != first["instance_id"]
+        assert store.instances["i1"].status == WorkflowStatus.RUNNING
+
+        stale = {"child_instance_id": first["instance_id"], "data": {}}
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "bill", stale))
+        assert store.instances["i1"].status == WorkflowStatus.RUNNING
+
+        service.process_event(WorkflowEvent(second["instance_id"], EventType.STEP_FAILED, "charge", {"error": "402"}))
+        deliver(service, store)
+        assert store.instances["i1"].status == WorkflowStatus.FAILED
+
+    def test_missing_workflow_fails_the_parent(self):
+        """Test that calling a workflow with no active version fails the step instead of waiting forever."""
+        service, store, _ = make_service(CALL_DEFINITION)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.instances["i1"].status == WorkflowStatus.FAILED
+        assert "no active version" in store.step_executions["i1"][0].error_details
+
+
+class FixedDelayLimiter:
+    """Limiter stub that reports every limited action as over its limits for a while."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def limits_for(self, action_id, connection_id=None, config=None):
+        return ["limit"] if action_id == "http_request" else []
+
+    def delay(self, limits):
+        return self.seconds if limits else 0.0
+
+
+class TestActionLimits:
+    """Tests for deferring dispatches that are already over their limits."""
+
+    def test_over_limit_action_goes_to_a_timer(self):
+        """Test that an action over its limits is dispatched through a timer instead of the outbox."""
+        service, store, _ = make_service(CHILD_DEFINITION)
+        service.limiter = FixedDelayLimiter(3)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.outbox == []
+        assert store.timers["i1:retry:charge"].payload["action"] == "http_request"
+
+    def test_action_within_limits_is_dispatched_at_once(self):
+        """Test that a free limit leaves the dispatch unchanged."""
+        service, store, _ = make_service(CHILD_DEFINITION)
+        service.limiter = FixedDelayLimiter(0)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert [m.payload["step_name"] for m in store.outbox] == ["charge"]
+        assert store.timers == {}
+
+
+ADMISSION_DEFINITION = {"start_at": "approve", "max_concurrent_instances": 1,
+                       "steps": {"approve": {"type": "wait_for_event", "next": "end"}}}
+
+
+def admission_service(count):
+    service, store, lock = make_service(ADMISSION_DEFINITION)
+    for n in range(2, count + 1):
+        store.add_instance(WorkflowInstance(id=f"i{n}", workflow_version_id="v1", status=WorkflowStatus.PENDING,
+                                            created_at=datetime.now(timezone.utc)))
+    for n in range(1, count + 1):
+        service.process_event(WorkflowEvent(f"i{n}", EventType.START_WORKFLOW))
+    return service, store, lock
+
+
+class TestAdmission:
+    """Tests for max_concurrent_instances and first-in, first-out admission."""
+
+    def test_starts_beyond_the_limit_wait_in_order(self):
+        """Test that only one instance runs and the others stay pending in the order they started."""
+        _, store, _ = admission_service(3)
+
+        assert [store.instances[i].status for i in ("i1", "i2", "i3")] == [
+            WorkflowStatus.RUNNING, WorkflowStatus.PENDING, WorkflowStatus.PENDING]
+        assert (store.admission["v1"].running, store.admission["v1"].queue) == (1, ["i2", "i3"])
+
+    def test_finishing_instance_hands_its_slot_to_the_oldest_waiter(self):
+        """Test that completion admits the next instance with a START_WORKFLOW instead of freeing the slot."""
+        service, store, _ = admission_service(3)
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "approve", {}))
+
+        assert store.instances["i2"].admitted and not store.instances["i1"].admitted
+        assert store.outbox[-1].payload == {"type": "START_WORKFLOW", "instance_id": "i2"}
+        service.process_event(WorkflowEvent("i2", EventType.START_WORKFLOW))
+        assert store.instances["i2"].status == WorkflowStatus.RUNNING
+        assert (store.admission["v1"].running, store.admission["v1"].queue) == (1, ["i3"])
+
+    def test_redelivered_start_does_not_queue_twice(self):
+        """Test that a duplicate START_WORKFLOW for a waiting instance leaves the queue as it was."""
+        service, store, _ = admission_service(2)
+
+        service.process_event(WorkflowEvent("i2", EventType.START_WORKFLOW))
+
+        assert store.admission["v1"].queue == ["i2"]
+
+    def test_last_instance_frees_the_slot(self):
+        """Test that the running count drops when nobody is waiting."""
+        service, store, _ = admission_service(1)
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "approve", {}))
+
+        assert store.admission["v1"].running == 0
+
+
+class TestParkedEvents:
+    """Tests for coalescing events that arrive while the instance is locked."""
+
+    def test_contended_event_is_parked_and_drained_by_holder(self):
+        """Test that an event arriving under the lock is applied by the next lock holder."""
+        buffer = InMemoryEventBuffer()
+        service, store, lock = make_service(ORDER_PRIORITY_DEFINITION, event_buffer=buffer)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        lock.acquire_lock("lock:instance:i1", 30)
+
+        service.process_event(WorkflowEvent("i1", EventType.STEP_COMPLETE, "compute_priority", {"priority": "high"}))
+        assert buffer.pending("i1") == 1
+        assert store.instances["i1"].current_step == "compute_priority"
+
+        lock.release_lock("lock:instance:i1")
+        service.drain_parked("i1")
+
+        assert buffer.pending("i1") == 0
+        assert store.instances["i1"].current_step == "set_expedited"
+        assert not lock.held
+
+    def test_duplicate_events_are_coalesced(self):
+        """Test that identical parked events are applied once."""
+        buffer = InMemoryEventBuffer()
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION, event_buffer=buffer)
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+        completed = WorkflowEvent("i1", EventType.STEP_COMPLETE, "compute_priority", {"priority": "normal"})
+        buffer.park(completed)
+        buffer.park(completed)
+
+        service.drain_parked("i1")
+
+        assert [s.step_name for s in store.step_executions["i1"]] == ["compute_priority", "check_priority", "set_standard"]
+
+    def test_failed_batch_restores_parked_events(self):
+        """Test that parked events are put back when the batch transaction fails."""
+        buffer = InMemoryEventBuffer()
+        service, store, lock = make_service(ORDER_PRIORITY_DEFINITION, event_buffer=buffer)
+        buffer.park(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        def fail(events):
+            raise RuntimeError("database went away")
+        service._handle_events = fail
+
+        with pytest.raises(RuntimeError):
+            service.drain_parked("i1")
+
+        assert buffer.pending("i1") == 1
+        assert store.instances["i1"].status == WorkflowStatus.PENDING
+        assert not lock.held
+
+
+class TestProcessBatch:
+    """Tests for applying events of several instances in one transaction."""
+
+    def test_failing_instance_is_rolled_back_alone(self):
+        """Test that one instance failing mid-batch keeps the other instances' writes."""
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION)
+        store.add_instance(WorkflowInstance(id="i2", workflow_version_id="v1", status=WorkflowStatus.PENDING, data={}))
+        apply_event = service._apply_event
+
+        def fail_after_writing(event):
+            apply_event(event)
+            if event.instance_id == "i2":
+                raise RuntimeError("boom")
+        service._apply_event = fail_after_writing
+
+        results = service.process_batch([
+            WorkflowEvent("i1", EventType.START_WORKFLOW),
+            WorkflowEvent("i2", EventType.START_WORKFLOW),
+            WorkflowEvent("missing", EventType.START_WORKFLOW),
+        ])
+
+        assert results[0] is None
+        assert isinstance(results[1], RuntimeError)
+        assert isinstance(results[2], NonRetryableError)
+        assert store.instances["i1"].status == WorkflowStatus.RUNNING
+        assert store.instances["i2"].status == WorkflowStatus.PENDING
+        assert [m.payload["instance_id"] for m in store.outbox] == ["i1"]
+
+    def test_events_for_locked_instance_are_retryable(self):
+        """Test that without an event buffer a locked instance's events report RetryableError."""
+        service, store, lock = make_service(ORDER_PRIORITY_DEFINITION)
+        lock.acquire_lock("lock:instance:i1", 30)
+
+        results = service.process_batch([WorkflowEvent("i1", EventType.START_WORKFLOW)])
+
+        assert isinstance(results[0], RetryableError)
+        assert store.instances["i1"].status == WorkflowStatus.PENDING
+
+
+class TestCancelledInstances:
+    """Tests for dropping events of cancelled instances before any lock or transaction."""
+
+    def test_event_is_dropped_without_taking_the_lock(self):
+        """Test that process_event ignores a cancelled instance even while another holder has its lock."""
+        service, store, lock = make_service(ORDER_PRIORITY_DEFINITION)
+        service.cancellations = CancelledInstances()
+        service.cancellations.mark(["i1"])
+        lock.acquire_lock("lock:instance:i1", 30)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.instances["i1"].status == WorkflowStatus.PENDING
+        assert store.outbox == []
+
+    def test_batch_skips_cancelled_instances(self):
+        """Test that a batch reports success for cancelled instances and applies the rest."""
+        service, store, lock = make_service(ORDER_PRIORITY_DEFINITION)
+        store.add_instance(WorkflowInstance(id="i2", workflow_version_id="v1", status=WorkflowStatus.PENDING, data={}))
+        service.cancellations = CancelledInstances()
+        service.cancellations.mark(["i2"])
+
+        results = service.process_batch([
+            WorkflowEvent("i1", EventType.START_WORKFLOW),
+            WorkflowEvent("i2", EventType.START_WORKFLOW),
+        ])
+
+        assert results == [None, None]
+        assert store.instances["i2"].status == WorkflowStatus.PENDING
+        assert [m.payload["instance_id"] for m in store.outbox] == ["i1"]
+
+
+def race_after_read(service, store, times):
+    """Make another writer save the instance right after each of our next `times` reads."""
+    apply_event = service._apply_event
+    remaining = [times]
+
+    def apply_with_race(event):
+        find_instance = service.uow.workflow.find_instance
+
+        def find_then_race(instance_id):
+            result = find_instance(instance_id)
+            if remaining[0] > 0:
+                remaining[0] -= 1
+                store.instances[instance_id].row_version += 1
+            return result
+        service.uow.workflow.find_instance = find_then_race
+        apply_event(event)
+    service._apply_event = apply_with_race
+
+
+class TestOptimisticConcurrency:
+    """Tests for compare-and-swap saves on row_version."""
+
+    def test_conflict_is_reapplied_from_a_fresh_read(self):
+        """Test that a save losing the race re-reads and applies the event once."""
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION)
+        race_after_read(service, store, times=1)
+
+        service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.instances["i1"].status == WorkflowStatus.RUNNING
+        assert store.instances["i1"].row_version == 2
+        assert len(store.step_executions["i1"]) == 1
+        assert len(store.outbox) == 1
+
+    def test_persistent_conflict_is_retryable(self):
+        """Test that an instance that keeps changing under us gives up with RetryableError."""
+        service, store, _ = make_service(ORDER_PRIORITY_DEFINITION)
+        race_after_read(service, store, times=OrchestrationService.MAX_CONFLICT_RETRIES)
+
+        with pytest.raises(RetryableError):
+            service.process_event(WorkflowEvent("i1", EventType.START_WORKFLOW))
+
+        assert store.instances["i1"].status == WorkflowStatus.PENDING
+        assert store.outbox == []
+
+
+class TestBenchmarkHarness:
+    """Tests for the in-process engine benchmark."""
+
+    def test_runs_every_workflow_to_completion(self):
+        """Test that each synthetic workflow completes all instances."""
+        for name in ("order_priority", "branch_heavy", "delay_heavy"):
+            report = run_benchmark(name, instances=5)
+
+            assert report.completed == 5
+            assert report.events == sum(stats.count for stats in report.transitions.values())
+
+    def test_imports_without_redis_or_postgres_settings(self):
+        """Test that the benchmark starts in a fresh interpreter with no REDIS_URL, DATABASE_URL or RABBITMQ_URL."""
+        env = {k: v for k, v in os.environ.items() if k not in ("REDIS_URL", "DATABASE_URL", "RABBITMQ_URL")}
+        result = subprocess.run([sys.executable, "-c", "import src.orchestration.entrypoint.benchmark"],
+                                env=env, cwd=os.path.join(os.path.dirname(__file__), "..", ".."),
+                                capture_output=True, text=True)
+
+        assert result.returncode == 0, result.stderr
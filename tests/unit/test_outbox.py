@@ -0,0 +1,95 @@
+"""Unit tests for the shared outbox writer and direct publish path."""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, Mock, patch
+
+from src.shared import outbox
+from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
+
+
+def make_cursor():
+    cursor = MagicMock()
+    cursor.connection = object()
+    return cursor
+
+
+class TestInsertMessage:
+    """Tests for outbox.insert_message."""
+
+    def test_plain_insert_when_direct_publish_off(self):
+        """Test that rows are left unleased for the relay when direct publish is off."""
+        cursor = make_cursor()
+        with patch.object(outbox, "DIRECT_PUBLISH", False):
+            outbox.insert_message(cursor, ORCHESTRATION_QUEUE, {"type": "x"})
+
+        assert "lease_owner" not in cursor.execute.call_args[0][0]
+        assert outbox.take_pending(cursor.connection) == []
+
+    def test_immediate_row_leased_and_queued(self):
+        """Test that a due row is inserted leased and queued on its connection."""
+        cursor = make_cursor()
+        with patch.object(outbox, "DIRECT_PUBLISH", True):
+            msg_id = outbox.insert_message(cursor, ACTIONS_QUEUE, {"action": "a"}, request_id="req-1")
+
+        assert "lease_owner" in cursor.execute.call_args[0][0]
+        pending = outbox.take_pending(cursor.connection)
+        assert [m.id for m in pending] == [msg_id]
+        assert pending[0].task_name == "worker.execute_action"
+        assert pending[0].headers == {"request_id": "req-1"}
+        assert outbox.take_pending(cursor.connection) == []
+
+    def test_delayed_row_left_to_relay(self):
+        """Test that future-dated rows are never published directly."""
+        cursor = make_cursor()
+        later = datetime.now(timezone.utc) + timedelta(minutes=5)
+        with patch.object(outbox, "DIRECT_PUBLISH", True):
+            outbox.insert_message(cursor, ACTIONS_QUEUE, {"action": "a"}, publish_at=later)
+
+        assert "lease_owner" not in cursor.execute.call_args[0][0]
+        assert outbox.take_pending(cursor.connection) == []
+
+
+class TestPublishPending:
+    """Tests for outbox.publish_pending."""
+
+    def setup_method(self):
+        self.cur = MagicMock()
+
+        @contextmanager
+        def fake_db_cursor():
+            yield self.cur
+
+        self.db_patch = patch("src.shared.db.db_cursor", fake_db_cursor)
+        self.db_patch.start()
+        self.publisher = Mock()
+        self.publisher_patch = patch.object(outbox, "_publisher", self.publisher)
+        self.publisher_patch.start()
+
+    def teardown_method(self):
+        self.db_patch.stop()
+        self.publisher_patch.stop()
+
+    def messages(self):
+        return [
+            outbox.OutboundMessage(id="a", task_name="engine.orchestrate", queue=ORCHESTRATION_QUEUE, payload={}),
+            outbox.OutboundMessage(id="b", task_name="engine.orchestrate", queue=ORCHESTRATION_QUEUE, payload={}),
+        ]
+
+    def test_confirmed_completed_and_rest_released(self):
+        """Test that confirmed rows are marked processed and the rest handed back to the relay."""
+        self.publisher.publish_batch.return_value = ["a"]
+
+        outbox.publish_pending(self.messages())
+
+        (complete_sql, complete_args), (release_sql, release_args) = [c[0] for c in self.cur.execute.call_args_list]
+        assert "processed_at = NOW()" in complete_sql and complete_args[0] == ["a"]
+        assert "processed_at" not in release_sql and release_args[0] == ["b"]
+
+    def test_publish_error_does_not_raise(self):
+        """Test that a broker failure after commit releases the leases instead of raising."""
+        self.publisher.publish_batch.side_effect = ConnectionError("broker down")
+
+        outbox.publish_pending(self.messages())
+
+        release_sql, release_args = self.cur.execute.call_args[0]
+        assert "processed_at" not in release_sql and release_args[0] == ["a", "b"]
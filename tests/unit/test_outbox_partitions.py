@@ -0,0 +1,46 @@
+"""Unit tests for outbox partition retention."""
+from datetime import date
+
+from src.relay.partitions import OutboxPartitionManager, partition_day
+
+
+class TestPartitionDay:
+    """Tests for partition name parsing."""
+
+    def test_daily_partition(self):
+        """Test parsing a daily partition name."""
+        assert partition_day("outbox_p20261018") == date(2026, 10, 18)
+
+    def test_non_daily_tables(self):
+        """Test that the default partition and other tables are ignored."""
+        assert partition_day("outbox_default") is None
+        assert partition_day("outbox_p2026101") is None
+
+
+class TestExpiredPartitions:
+    """Tests for OutboxPartitionManager.expired_partitions."""
+
+    def test_only_partitions_past_retention(self):
+        """Test that a partition expires once its whole day is older than the retention window."""
+        manager = OutboxPartitionManager(retention_days=2)
+        partitions = [
+            "outbox_default",
+            "outbox_p20261014",
+            "outbox_p20261015",
+            "outbox_p20261016",
+            "outbox_p20261017",
+            "outbox_p20261018",
+            "outbox_p20261021",
+        ]
+
+        expired = manager.expired_partitions(partitions, today=date(2026, 10, 18))
+
+        assert expired == ["outbox_p20261014", "outbox_p20261015"]
+
+    def test_zero_retention_keeps_today(self):
+        """Test that today's partition is never expired."""
+        manager = OutboxPartitionManager(retention_days=0)
+
+        expired = manager.expired_partitions(["outbox_p20261017", "outbox_p20261018"], today=date(2026, 10, 18))
+
+        assert expired == ["outbox_p20261017"]
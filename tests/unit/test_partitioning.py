@@ -0,0 +1,28 @@
+"""Unit tests for orchestration queue partitioning."""
+import uuid
+
+from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
+from src.shared.partitioning import jump_hash, partition_for, route_queue
+
+
+class TestPartitioning:
+    """Tests for routing orchestration messages to partition queues."""
+
+    def test_routes_only_orchestration_messages(self):
+        """Test that actions and unpartitioned setups keep their destination queue."""
+        payload = {"instance_id": "abc"}
+
+        assert route_queue(ACTIONS_QUEUE, payload, partitions=8) == ACTIONS_QUEUE
+        assert route_queue(ORCHESTRATION_QUEUE, payload, partitions=0) == ORCHESTRATION_QUEUE
+        assert route_queue(ORCHESTRATION_QUEUE, payload, partitions=8) == f"{ORCHESTRATION_QUEUE}.p{partition_for('abc', 8)}"
+
+    def test_growing_partitions_moves_few_instances(self):
+        """Test that adding a partition only moves instances onto the new one."""
+        ids = [str(uuid.UUID(int=i)) for i in range(2000)]
+        before = {i: partition_for(i, 8) for i in ids}
+        after = {i: partition_for(i, 9) for i in ids}
+
+        moved = [i for i in ids if before[i] != after[i]]
+        assert all(after[i] == 8 for i in moved)
+        assert 150 < len(moved) < 300
+        assert {jump_hash(k, 8) for k in range(1000)} == set(range(8))
@@ -0,0 +1,132 @@
+"""Unit tests for compiling workflow definitions into execution plans."""
+from src.orchestration.domain.models import WorkflowVersion
+from src.orchestration.domain.plan import StepKind, Condition, compile_plan, check_plan
+from src.orchestration.entrypoint.benchmark import ORDER_PRIORITY_DEFINITION
+
+
+class TestCompilePlan:
+    """Tests for step kinds, successors and conditions."""
+
+    def test_step_kinds_and_successors(self):
+        """Test that steps get their kind and resolved successors, with 'end' as None."""
+        plan = compile_plan(ORDER_PRIORITY_DEFINITION, inline_actions={"transform_data", "log"})
+
+        assert plan.start_at == "compute_priority"
+        assert plan.step("compute_priority").kind == StepKind.ACTION
+        assert plan.step("check_priority").successors() == ("set_expedited", "set_standard")
+        assert plan.step("set_expedited").kind == StepKind.INLINE
+        assert plan.step("log_result").next is None
+
+    def test_connection_keeps_inline_action_on_worker(self):
+        """Test that a step with a connection is never marked inline."""
+        definition = {"start_at": "a", "steps": {"a": {"action_id": "log", "connection_id": "c1", "next": "end"}}}
+        assert compile_plan(definition, {"log"}).step("a").kind == StepKind.ACTION
+
+    def test_condition_resolves_nested_fields(self):
+        """Test that compiled conditions read dot paths and treat non-dict parents as missing."""
+        condition = Condition.compile({"field": "order.quantity", "operator": "gte", "value": 100})
+
+        assert condition.evaluate({"order": {"quantity": 150}})
+        assert not condition.evaluate({"order": {"quantity": 5}})
+        assert not condition.evaluate({"order": "oops"})
+        assert not Condition.compile({"field": "x", "operator": "nope"}).evaluate({"x": 1})
+
+    def test_parallel_branches_and_join(self):
+        """Test that parallel branches compile as worker actions named after their step, with the join count."""
+        definition = {"start_at": "p", "steps": {"p": {
+            "type": "parallel", "join": 2, "next": "end",
+            "branches": {"a": {"action_id": "log"}, "b": {"action_id": "http_request"}, "c": {"action_id": "log"}},
+        }}}
+        plan = compile_plan(definition, {"log"})
+
+        assert plan.step("p").join == 2
+        assert plan.branch("p", "p.a").kind == StepKind.ACTION
+        assert plan.branch("p", "p.a").name == "p.a"
+        assert plan.branch("p", "p.z") is None
+        assert check_plan(plan) == []
+
+    def test_map_items_and_item_names(self):
+        """Test that a map step reads its list through a compiled accessor and recognises item step names."""
+        definition = {"start_at": "m", "steps": {"m": {
+            "type": "map", "items": "push.commits", "action": {"action_id": "log"}, "next": "end"}}}
+        plan = compile_plan(definition, {"log"})
+        step = plan.step("m")
+
+        assert step.items({"push": {"commits": [1, 2]}}) == [1, 2]
+        assert step.item_action.kind == StepKind.ACTION
+        assert (step.max_concurrency, step.max_failures, step.result_key) == (10, 0, "m")
+        assert plan.map_item("m", "m[12]") == 12
+        assert plan.map_item("m", "m[x]") is None
+        assert check_plan(plan) == []
+
+    def test_call_workflow_projects_parent_data(self):
+        """Test that a call step names its workflow and builds the child's data from dot paths."""
+        definition = {"start_at": "c", "steps": {"c": {
+            "type": "call_workflow", "workflow": "billing", "input": {"customer": "order.customer"}, "next": "end"}}}
+        plan = compile_plan(definition)
+        step = plan.step("c")
+
+        assert (step.kind, step.workflow, step.result_key) == (StepKind.CALL, "billing", "c")
+        assert step.child_data({"order": {"customer": "acme", "total": 3}}) == {"customer": "acme"}
+        assert check_plan(plan) == []
+        assert check_plan(compile_plan({"start_at": "c", "steps": {"c": {"type": "call_workflow"}}})) == [
+            "Step 'c': call_workflow step needs a 'workflow' name"]
+
+    def test_max_concurrent_instances(self):
+        """Test that the instance limit is read from the definition and rejected unless a positive integer."""
+        steps = {"a": {"action_id": "log", "next": "end"}}
+
+        assert compile_plan({"start_at": "a", "steps": steps, "max_concurrent_instances": 5}).max_concurrent_instances == 5
+        assert compile_plan({"start_at": "a", "steps": steps}).max_concurrent_instances is None
+        assert check_plan(compile_plan({"start_at": "a", "steps": steps, "max_concurrent_instances": 0})) == [
+            "max_concurrent_instances must be an integer of at least 1"]
+
+    def test_version_compiles_once(self):
+        """Test that a version hands out the same plan for the same inline actions."""
+        version = WorkflowVersion(id="v1", definition=ORDER_PRIORITY_DEFINITION)
+        assert version.plan({"log"}) is version.plan({"log"})
+        assert version.plan({"log"}) is not version.plan()
+
+
+class TestCheckPlan:
+    """Tests for the static checks run before a definition is saved."""
+
+    def test_valid_definition_has_no_errors(self):
+        """Test that the seeded workflow passes."""
+        assert check_plan(compile_plan(ORDER_PRIORITY_DEFINITION)) == []
+
+    def test_dangling_and_unreachable_steps(self):
+        """Test that a missing target and an orphan step are both reported."""
+        definition = {"start_at": "a", "steps": {"a": {"next": "missing"}, "orphan": {"next": "end"}}}
+        errors = check_plan(compile_plan(definition))
+
+        assert "Step 'a': next step 'missing' does not exist" in errors
+        assert "Step 'orphan' is unreachable from 'a'" in errors
+        assert len(errors) == 2
+
+    def test_cycle_without_exit_is_rejected(self):
+        """Test that a loop that can never reach the end is reported, but a loop with a branch exit is not."""
+        trapped = {"start_at": "a", "steps": {"a": {"next": "b"}, "b": {"next": "a"}}}
+        polling = {"start_at": "wait", "steps": {
+            "wait": {"type": "delay", "duration_seconds": 5, "next": "check"},
+            "check": {"type": "branch", "condition": {"field": "done", "operator": "eq", "value": True},
+                      "on_true": "end", "on_false": "wait"},
+        }}
+
+        assert len(check_plan(compile_plan(trapped))) == 2
+        assert check_plan(compile_plan(polling)) == []
+
+    def test_bad_parallel_join(self):
+        """Test that a join larger than the number of branches is rejected."""
+        definition = {"start_at": "p", "steps": {"p": {
+            "type": "parallel", "join": 3, "branches": {"a": {"action_id": "log"}}}}}
+        assert check_plan(compile_plan(definition)) == ["Step 'p': join must be 'all', 'any' or a number from 1 to 1"]
+
+    def test_bad_start_and_settings(self):
+        """Test that a missing start step, an unknown type and a non-integer delay are reported."""
+        assert check_plan(compile_plan({"start_at": "x", "steps": {"a": {}}})) == ["start_at 'x' is not a step"]
+        errors = check_plan(compile_plan({"start_at": "a", "steps": {
+            "a": {"type": "delay", "duration_seconds": "soon", "next": "b"},
+            "b": {"type": "teleport", "next": "end"},
+        }}))
+        assert errors == ["Step 'a': duration_seconds must be an integer", "Step 'b': unknown type 'teleport'"]
@@ -0,0 +1,117 @@
+"""Unit tests for the confirm-mode batch publisher."""
+import socket
+from collections import defaultdict
+from unittest.mock import Mock
+
+from src.shared.publisher import ConfirmingPublisher, OutboundMessage
+
+
+class FakeChannel:
+    def __init__(self):
+        self.events = defaultdict(set)
+
+    def confirm_select(self):
+        pass
+
+
+class FakeConnection:
+    """Replays scripted broker confirms when drained."""
+
+    def __init__(self, confirms):
+        self.channel_obj = FakeChannel()
+        self.confirms = list(confirms)
+        self.released = False
+
+    def ensure_connection(self, max_retries=None):
+        return self
+
+    def channel(self):
+        return self.channel_obj
+
+    def drain_events(self, timeout=None):
+        if not self.confirms:
+            raise socket.timeout()
+        kind, tag, multiple = self.confirms.pop(0)
+        for callback in self.channel_obj.events[kind]:
+            callback(tag, multiple)
+
+    def release(self):
+        self.released = True
+
+
+def make_app(connection):
+    app = Mock()
+    app.connection_for_write.return_value = connection
+    return app
+
+
+def make_messages(n):
+    return [
+        OutboundMessage(id=f"msg-{i}", task_name="engine.orchestrate", queue="orchestration_queue", payload={"i": i})
+        for i in range(n)
+    ]
+
+
+class TestConfirmingPublisher:
+    """Tests for ConfirmingPublisher."""
+
+    def test_all_acked(self):
+        """Test that individually acked messages are all confirmed."""
+        conn = FakeConnection([("basic_ack", 1, False), ("basic_ack", 2, False), ("basic_ack", 3, False)])
+        app = make_app(conn)
+        publisher = ConfirmingPublisher(app, confirm_timeout=1)
+
+        confirmed = publisher.publish_batch(make_messages(3))
+
+        assert confirmed == ["msg-0", "msg-1", "msg-2"]
+        assert not conn.released
+        # Tasks carry their outbox row id, so cancellation can revoke them
+        assert [c.kwargs["task_id"] for c in app.send_task.call_args_list] == ["msg-0", "msg-1", "msg-2"]
+
+    def test_multiple_ack(self):
+        """Test that a multiple-ack settles every tag up to it."""
+        conn = FakeConnection([("basic_ack", 3, True)])
+        publisher = ConfirmingPublisher(make_app(conn), confirm_timeout=1)
+
+        confirmed = publisher.publish_batch(make_messages(3))
+
+        assert sorted(confirmed) == ["msg-0", "msg-1", "msg-2"]
+
+    def test_nacked_messages_not_confirmed(self):
+        """Test that nacked messages are left for retry."""
+        conn = FakeConnection([("basic_ack", 1, False), ("basic_nack", 2, False), ("basic_ack", 3, False)])
+        publisher = ConfirmingPublisher(make_app(conn), confirm_timeout=1)
+
+        confirmed = publisher.publish_batch(make_messages(3))
+
+        assert confirmed == ["msg-0", "msg-2"]
+
+    def test_unconfirmed_drops_channel(self):
+        """Test that a confirm timeout reports only acked messages and resets the channel."""
+        conn = FakeConnection([("basic_ack", 1, False)])
+        publisher = ConfirmingPublisher(make_app(conn), confirm_timeout=1)
+
+        confirmed = publisher.publish_batch(make_messages(2))
+
+        assert confirmed == ["msg-0"]
+        assert conn.released
+
+    def test_publish_error_confirms_nothing(self):
+        """Test that a failed publish mid-batch confirms nothing."""
+        conn = FakeConnection([])
+        app = make_app(conn)
+        app.send_task.side_effect = [None, ConnectionError("broker gone")]
+        publisher = ConfirmingPublisher(app, confirm_timeout=1)
+
+        assert publisher.publish_batch(make_messages(2)) == []
+        assert conn.released
+
+    def test_delivery_tags_continue_across_batches(self):
+        """Test that the channel is reused and tags keep counting across batches."""
+        conn = FakeConnection([("basic_ack", 1, False), ("basic_ack", 2, False)])
+        app = make_app(conn)
+        publisher = ConfirmingPublisher(app, confirm_timeout=1)
+
+        assert publisher.publish_batch(make_messages(1)) == ["msg-0"]
+        assert publisher.publish_batch(make_messages(1)) == ["msg-0"]
+        app.connection_for_write.assert_called_once()
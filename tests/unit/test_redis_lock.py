@@ -0,0 +1,22 @@
+"""Unit tests for choosing the engine's lock service."""
+from unittest.mock import Mock
+
+import pytest
+
+from src.orchestration.adapters.redis_lock import NoopLockService, RedisLockService, make_lock_service
+
+
+class TestMakeLockService:
+    """Tests for make_lock_service."""
+
+    def test_modes(self):
+        """Test that "lock" locks in Redis and "optimistic" skips the lock."""
+        redis = Mock()
+
+        assert isinstance(make_lock_service(redis, "lock"), RedisLockService)
+        assert isinstance(make_lock_service(redis, "optimistic"), NoopLockService)
+
+    def test_unknown_mode_is_refused(self):
+        """Test that a misspelled mode fails instead of quietly falling back to Redis locks."""
+        with pytest.raises(ValueError, match="optimisitc"):
+            make_lock_service(Mock(), "optimisitc")
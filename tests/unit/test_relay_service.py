@@ -0,0 +1,179 @@
+"""Unit tests for the outbox relay service."""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, Mock, patch
+
+from prometheus_client import REGISTRY
+
+from src.relay.listener import OutboxListener, wait_timeout
+from src.relay.service import RelayService, record_backlog
+from src.shared.constants import ORCHESTRATION_QUEUE, ACTIONS_QUEUE
+
+
+def make_row(msg_id, destination, offset=0, request_id=None):
+    return {
+        "id": msg_id,
+        "destination": destination,
+        "payload": {"instance_id": f"inst-{msg_id}"},
+        "request_id": request_id,
+        "publish_at": datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=offset),
+        "lag_seconds": 0.2,
+    }
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestRelayService:
+    """Tests for RelayService claim/publish/complete cycle."""
+
+    def setup_method(self):
+        self.publisher = Mock()
+        self.service = RelayService(Mock(), publisher=self.publisher, relay_id="relay-1")
+        self.service.claim_batch = Mock()
+        self.service.complete = Mock()
+        self.service.release = Mock()
+
+    def test_no_messages(self):
+        """Test that an empty claim publishes nothing."""
+        self.service.claim_batch.return_value = []
+
+        assert self.service.relay_messages() == 0
+        self.publisher.publish_batch.assert_not_called()
+
+    def test_confirmed_rows_completed_and_rest_released(self):
+        """Test that only confirmed rows are completed and the rest are released."""
+        self.service.claim_batch.return_value = [
+            make_row("a", ORCHESTRATION_QUEUE, request_id="req-1"),
+            make_row("b", ACTIONS_QUEUE, offset=1),
+        ]
+        self.publisher.publish_batch.return_value = ["a"]
+
+        assert self.service.relay_messages() == 1
+
+        outbound = self.publisher.publish_batch.call_args[0][0]
+        assert [m.task_name for m in outbound] == ["engine.orchestrate", "worker.execute_action"]
+        assert outbound[0].headers == {"request_id": "req-1"}
+        self.service.complete.assert_called_once_with(["a"])
+        self.service.release.assert_called_once_with(["b"])
+
+    def test_unknown_destination_skipped(self):
+        """Test that rows without a task mapping are not published."""
+        self.service.claim_batch.return_value = [make_row("a", "mystery_queue")]
+        self.publisher.publish_batch.return_value = []
+
+        assert self.service.relay_messages() == 0
+        assert self.publisher.publish_batch.call_args[0][0] == []
+        self.service.complete.assert_not_called()
+        self.service.release.assert_not_called()
+
+    def test_relay_metrics_recorded_per_destination(self):
+        """Test that lag, relayed and failed counts are labelled by destination."""
+        self.service.claim_batch.return_value = [
+            make_row("a", ORCHESTRATION_QUEUE),
+            make_row("b", ACTIONS_QUEUE, offset=1),
+        ]
+        self.publisher.publish_batch.return_value = ["a"]
+        lag_before = sample("outbox_relay_lag_seconds_count", destination=ORCHESTRATION_QUEUE)
+        relayed_before = sample("outbox_relayed_total", destination=ORCHESTRATION_QUEUE)
+        failed_before = sample("outbox_publish_failures_total", destination=ACTIONS_QUEUE)
+
+        self.service.relay_messages()
+
+        assert sample("outbox_relay_lag_seconds_count", destination=ORCHESTRATION_QUEUE) == lag_before + 1
+        assert sample("outbox_relayed_total", destination=ORCHESTRATION_QUEUE) == relayed_before + 1
+        assert sample("outbox_publish_failures_total", destination=ACTIONS_QUEUE) == failed_before + 1
+
+
+class TestRecordBacklog:
+    """Tests for the outbox backlog gauge."""
+
+    def test_missing_destinations_reset_to_zero(self):
+        """Test that destinations absent from the sample read zero instead of a stale value."""
+        record_backlog([{"destination": ACTIONS_QUEUE, "due": 7, "scheduled": 3}])
+        record_backlog([{"destination": ORCHESTRATION_QUEUE, "due": 2, "scheduled": 0}])
+
+        assert sample("outbox_backlog", destination=ORCHESTRATION_QUEUE, state="due") == 2
+        assert sample("outbox_backlog", destination=ACTIONS_QUEUE, state="due") == 0
+        assert sample("outbox_backlog", destination=ACTIONS_QUEUE, state="scheduled") == 0
+
+
+class FakeListenConnection:
+    """A LISTEN connection whose poll() reads the notifications queued in `pending`."""
+
+    def __init__(self, pending=()):
+        self.pending = list(pending)
+        self.notifies = []
+        self.polls = 0
+
+    def poll(self):
+        self.polls += 1
+        self.notifies.extend(self.pending)
+        self.pending = []
+
+
+class TestNotifyWait:
+    """Tests for how long the notify-mode relay sleeps and how it wakes."""
+
+    def setup_method(self):
+        self.cur = MagicMock()
+
+        @contextmanager
+        def fake_db_cursor():
+            yield self.cur
+
+        self.db_patch = patch("src.relay.service.db_cursor", fake_db_cursor)
+        self.db_patch.start()
+        self.service = RelayService(Mock(), publisher=Mock(), relay_id="relay-1")
+
+    def teardown_method(self):
+        self.db_patch.stop()
+
+    def test_timeout_capped_by_earliest_scheduled_row(self):
+        """Test that the wait ends when the earliest future-dated row is due, and never past the safety poll."""
+        self.cur.fetchone.return_value = {"wait_seconds": 1.5}
+        assert wait_timeout(self.service.seconds_until_next_due(), 5.0) == 1.5
+
+        self.cur.fetchone.return_value = {"wait_seconds": 30.0}
+        assert wait_timeout(self.service.seconds_until_next_due(), 5.0) == 5.0
+
+        self.cur.fetchone.return_value = {"wait_seconds": -0.2}
+        assert self.service.seconds_until_next_due() == 0.0
+        assert "publish_at > NOW()" in self.cur.execute.call_args[0][0]
+
+    def test_nothing_scheduled(self):
+        """Test that no future-dated row means no wakeup before the safety poll."""
+        self.cur.fetchone.return_value = {"wait_seconds": None}
+
+        assert self.service.seconds_until_next_due() is None
+        assert wait_timeout(None, 5.0) == 5.0
+
+    def test_wait_returns_on_notification(self):
+        """Test that a notification ends the wait, including one already read off the socket."""
+        listener = OutboxListener()
+        listener.conn = FakeListenConnection(pending=["outbox_ready"])
+
+        with patch("src.relay.listener.select.select") as select:
+            assert listener.wait(5.0) is True
+        select.assert_not_called()
+        assert listener.conn.notifies == []
+
+        conn = listener.conn = FakeListenConnection()
+
+        def notify_during_select(readable, writable, errors, timeout):
+            conn.pending.append("outbox_ready")
+            return readable, [], []
+
+        with patch("src.relay.listener.select.select", side_effect=notify_during_select):
+            assert listener.wait(5.0) is True
+        assert conn.polls == 2
+
+    def test_wait_times_out(self):
+        """Test that the wait gives up after the timeout, and a negative timeout does not block."""
+        listener = OutboxListener()
+        listener.conn = FakeListenConnection()
+
+        with patch("src.relay.listener.select.select", return_value=([], [], [])) as select:
+            assert listener.wait(-1.0) is False
+        assert select.call_args[0][3] == 0
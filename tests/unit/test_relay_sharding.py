@@ -0,0 +1,81 @@
+"""Unit tests for sharded relay ownership."""
+from contextlib import contextmanager
+from unittest.mock import MagicMock, Mock, patch
+
+from src.relay.service import RelayService
+from src.relay.sharding import SHARD_COUNT, ShardCoordinator, assign_shards
+
+
+class TestAssignShards:
+    """Tests for rendezvous shard assignment."""
+
+    def test_every_shard_has_exactly_one_owner(self):
+        """Test that the assignment partitions all shards across the members."""
+        assignment = assign_shards(["relay-a", "relay-b", "relay-c"])
+
+        owned = [shard for shards in assignment.values() for shard in shards]
+        assert sorted(owned) == list(range(SHARD_COUNT))
+        assert all(shards for shards in assignment.values())
+
+    def test_join_only_moves_shards_to_new_member(self):
+        """Test that a joining replica takes shards without reshuffling the others."""
+        before = assign_shards(["relay-a", "relay-b"])
+        after = assign_shards(["relay-a", "relay-b", "relay-c"])
+
+        for member in ("relay-a", "relay-b"):
+            assert after[member] <= before[member]
+        assert after["relay-c"] == (before["relay-a"] - after["relay-a"]) | (before["relay-b"] - after["relay-b"])
+
+
+class TestShardCoordinator:
+    """Tests for ShardCoordinator lease handling."""
+
+    def test_ownership_lapses_without_renewal(self):
+        """Test that shards are given up locally once the lease may have expired."""
+        coordinator = ShardCoordinator("relay-a", lease_seconds=15)
+        coordinator.heartbeat = Mock(return_value=["relay-a"])
+        coordinator.rebalance = Mock(side_effect=lambda members: setattr(coordinator, "owned", {1, 2}))
+
+        with patch("src.relay.sharding.time.monotonic", return_value=100.0):
+            coordinator.run_if_due()
+            assert coordinator.owned_shards() == [1, 2]
+        with patch("src.relay.sharding.time.monotonic", return_value=116.0):
+            assert coordinator.owned_shards() == []
+
+    def test_relay_claims_nothing_without_shards(self):
+        """Test that a sharded relay with no owned shards does not touch the outbox."""
+        shards = Mock()
+        shards.owned_shards.return_value = []
+        service = RelayService(Mock(), publisher=Mock(), relay_id="relay-a", shards=shards)
+
+        with patch("src.relay.service.db_cursor") as db_cursor:
+            assert service.claim_batch() == []
+            db_cursor.assert_not_called()
+
+    def test_direct_publish_fences_its_instance_not_its_shard(self):
+        """Test that a row still being published directly holds back later rows of its instance only.
+
+        The interleaving: a direct publish leases an instance's earlier row,
+        and a later row for the same instance is due. The shard stays
+        claimable, but the claim must skip rows whose instance has an
+        unexpired direct lease.
+        """
+        shards = Mock()
+        shards.owned_shards.return_value = [3]
+        service = RelayService(Mock(), publisher=Mock(), relay_id="relay-a", shards=shards)
+        cur = MagicMock()
+        cur.fetchall.side_effect = [[], []]
+
+        @contextmanager
+        def fake_db_cursor():
+            yield cur
+
+        with patch("src.relay.service.db_cursor", fake_db_cursor):
+            service.claim_batch()
+
+        (fence_sql, _), (claim_sql, claim_params) = [c[0] for c in cur.execute.call_args_list]
+        assert "NOT LIKE 'direct:%%'" in fence_sql
+        assert claim_params[2] == [3]
+        fence = claim_sql[claim_sql.index("NOT EXISTS"):claim_sql.index("ORDER BY")]
+        assert "LIKE 'direct:%%'" in fence and "lease_expires_at >= NOW()" in fence
+        assert "d.payload->>'instance_id' = c.payload->>'instance_id'" in fence
@@ -0,0 +1,47 @@
+"""Unit tests for the timer service."""
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+from src.relay.timers import TimerService, FIRE_SQL
+from src.shared.constants import ORCHESTRATION_QUEUE
+
+
+class TestTimerService:
+    """Tests for moving due timers into the outbox."""
+
+    def setup_method(self):
+        self.cur = MagicMock()
+
+        @contextmanager
+        def fake_db_cursor():
+            yield self.cur
+
+        self.db_patch = patch("src.relay.timers.db_cursor", fake_db_cursor)
+        self.db_patch.start()
+
+    def teardown_method(self):
+        self.db_patch.stop()
+
+    def test_due_timers_move_to_outbox_in_one_statement(self):
+        """Test that due timers are deleted and written to the outbox by one statement."""
+        self.cur.fetchall.return_value = [
+            {"destination": ORCHESTRATION_QUEUE, "lag_seconds": 0.002},
+            {"destination": ORCHESTRATION_QUEUE, "lag_seconds": -0.001},
+        ]
+
+        assert TimerService(batch_size=10).fire_due() == 2
+
+        self.cur.execute.assert_called_once_with(FIRE_SQL, (10,))
+        assert "DELETE FROM workflow_timers" in FIRE_SQL and "INSERT INTO outbox" in FIRE_SQL
+        assert "SKIP LOCKED" in FIRE_SQL
+
+    def test_seconds_until_next(self):
+        """Test that the wait is read from the database clock and never negative."""
+        service = TimerService()
+
+        self.cur.fetchone.return_value = {"wait_seconds": 0.25}
+        assert service.seconds_until_next() == 0.25
+        self.cur.fetchone.return_value = {"wait_seconds": -1.0}
+        assert service.seconds_until_next() == 0.0
+        self.cur.fetchone.return_value = {"wait_seconds": None}
+        assert service.seconds_until_next() is None
@@ -0,0 +1,136 @@
+"""Unit tests for the workflow version cache."""
+import queue
+import time
+from unittest.mock import patch
+
+from src.orchestration.adapters.postgres_unit_of_work import PostgresWorkflowRepository
+from src.shared.version_cache import VersionCache, INVALIDATION_CHANNEL
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def subscribe(self, channel):
+        self.channel = channel
+
+    def listen(self):
+        # Reached once the listener has cleared what it may have missed while subscribing
+        self.redis.subscribed.put(self.channel)
+        while True:
+            yield {"channel": INVALIDATION_CHANNEL, "data": self.redis.messages.get()}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+        self.subscribed = queue.Queue()
+        self.messages = queue.Queue()
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+        self.messages.put(message)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakeCursor:
+    def __init__(self, active_id):
+        self.active_id = active_id
+
+    def execute(self, sql, params=()):
+        pass
+
+    def fetchone(self):
+        return {"id": self.active_id}
+
+
+class TestVersionCache:
+    """Tests for version and active-version caching."""
+
+    def test_versions_are_cached_by_id_with_lru_eviction(self):
+        """Test that versions load once and the least recently used one is evicted."""
+        cache = VersionCache(max_size=2)
+        loads = []
+
+        def loader(version_id):
+            return lambda: loads.append(version_id) or {"id": version_id}
+
+        cache.get("a", loader("a"))
+        cache.get("b", loader("b"))
+        cache.get("a", loader("a"))
+        cache.get("c", loader("c"))
+        cache.get("a", loader("a"))
+        cache.get("b", loader("b"))
+
+        assert loads == ["a", "b", "c", "b"]
+
+    def test_missing_version_is_not_cached(self):
+        """Test that a None from the loader is looked up again next time."""
+        cache = VersionCache()
+        loads = []
+        cache.get("a", lambda: loads.append(1))
+        cache.get("a", lambda: loads.append(1))
+        assert len(loads) == 2
+
+    def test_active_lookup_is_cached_until_invalidated(self):
+        """Test that an invalidation drops active lookups and is broadcast."""
+        redis = FakeRedis()
+        cache = VersionCache(redis_client=redis)
+        answers = iter(["v1", "v2"])
+
+        assert cache.active(("name", "wf"), lambda: next(answers)) == "v1"
+        assert cache.active(("name", "wf"), lambda: next(answers)) == "v1"
+        cache.invalidate_active()
+
+        assert cache.active(("name", "wf"), lambda: next(answers)) == "v2"
+        assert redis.published == [(INVALIDATION_CHANNEL, "active")]
+
+    def test_active_lookup_expires(self):
+        """Test that active lookups are reloaded after the TTL, covering a missed invalidation."""
+        cache = VersionCache(active_ttl_seconds=0)
+        answers = iter(["v1", "v2"])
+        cache.active(("name", "wf"), lambda: next(answers))
+        assert cache.active(("name", "wf"), lambda: next(answers)) == "v2"
+
+    def test_lookup_racing_an_invalidation_is_not_stored(self):
+        """Test that a value read before an invalidation is returned but not cached."""
+        cache = VersionCache()
+
+        def stale():
+            cache.invalidate_active(broadcast=False)
+            return "v1"
+
+        assert cache.active(("name", "wf"), stale) == "v1"
+        assert cache.active(("name", "wf"), lambda: "v2") == "v2"
+
+    def test_invalidation_clears_the_engine_call_workflow_lookup(self):
+        """Test that a published invalidation drops the active version an engine cached for call_workflow."""
+        redis = FakeRedis()
+        publisher, engine = VersionCache(redis_client=redis), VersionCache(redis_client=redis)
+        cursor = FakeCursor("v1")
+        repo = PostgresWorkflowRepository(cursor, versions=engine)
+        engine.start_listener()
+        redis.subscribed.get(timeout=5)
+
+        assert repo.find_active_version_id("child") == "v1"
+        cursor.active_id = "v2"
+        assert repo.find_active_version_id("child") == "v1"
+
+        publisher.invalidate_active()
+        deadline = time.monotonic() + 5
+        while repo.find_active_version_id("child") != "v2" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert repo.find_active_version_id("child") == "v2"
+
+    def test_listener_restarts_after_fork(self):
+        """Test that a forked process, which inherits the listener object but not its thread, starts its own."""
+        cache = VersionCache(redis_client=FakeRedis())
+        with patch("src.shared.version_cache.threading.Thread") as thread:
+            cache.start_listener()
+            cache.start_listener()
+            with patch("src.shared.version_cache.os.getpid", return_value=-1):
+                cache.start_listener()
+
+        assert thread.return_value.start.call_count == 2
@@ -0,0 +1,146 @@
+"""Unit tests for the buffered Postgres workflow repository."""
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from src.shared.constants import ACTIONS_QUEUE
+from src.orchestration.adapters.postgres_unit_of_work import PostgresWorkflowRepository
+from src.orchestration.domain.exceptions import ConcurrentUpdateError
+from src.orchestration.domain.models import (
+    StepExecutionStatus, WorkflowStatus, WorkflowStepExecution, WorkflowVersion
+)
+from src.shared.version_cache import VersionCache
+
+
+class FakeCursor:
+    def __init__(self, row=None, returned=None):
+        self.row = row
+        self.returned = returned or []
+        self.executed = []
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return self.row
+
+    def fetchall(self):
+        return self.returned
+
+
+def instance_row(instance_id, with_step=True):
+    now = datetime.now(timezone.utc)
+    row = {
+        "id": instance_id, "workflow_version_id": "v1", "status": "running", "current_step": "fetch",
+        "current_step_attempts": 1, "data": {"a": 1}, "created_at": now, "updated_at": now, "row_version": 3,
+        "parent_instance_id": None, "parent_step": None, "admitted": False,
+    }
+    step = {
+        "id": uuid.uuid4(), "step_name": "fetch", "status": "pending", "attempts": 1, "started_at": now,
+        "completed_at": None, "input_data": None, "output_data": None, "error_details": None,
+    }
+    row.update({f"step_{k}": (v if with_step else None) for k, v in step.items()})
+    return row
+
+
+def cached_versions():
+    versions = VersionCache()
+    versions.get("v1", lambda: WorkflowVersion(
+        id="v1", definition={"start_at": "fetch", "steps": {"fetch": {"next": "end"}}}, workflow_name="wf"))
+    return versions
+
+
+class TestPostgresWorkflowRepository:
+    """Tests for single-query loads and single-statement flushes."""
+
+    def test_load_includes_current_step_execution(self):
+        """Test that the instance and current step execution come from one query, with the version cached."""
+        cursor = FakeCursor(row=instance_row("i1"))
+        repo = PostgresWorkflowRepository(cursor, cached_versions())
+
+        instance, version = repo.find_instance("i1")
+        step = repo.find_current_step_execution("i1", "fetch")
+        repo.find_instance("i1")
+
+        assert len(cursor.executed) == 1
+        assert instance.row_version == 3 and version.workflow_name == "wf"
+        assert step.status == StepExecutionStatus.PENDING
+
+    def test_transition_writes_are_flushed_in_one_statement(self):
+        """Test that instance, step and outbox writes go out as one CTE statement checked on row_version."""
+        cursor = FakeCursor(row=instance_row("i1"), returned=[{"id": "i1"}])
+        repo = PostgresWorkflowRepository(cursor, cached_versions())
+        instance, _ = repo.find_instance("i1")
+        step = repo.find_current_step_execution("i1", "fetch")
+
+        step.status = StepExecutionStatus.COMPLETED
+        repo.save_step_execution(step)
+        instance.status = WorkflowStatus.RUNNING
+        instance.current_step = "next"
+        repo.save_instance(instance)
+        repo.add_step_execution(WorkflowStepExecution(
+            id=str(uuid.uuid4()), instance_id="i1", step_name="next", status=StepExecutionStatus.PENDING,
+            attempts=1, started_at=datetime.now(timezone.utc)))
+        repo.schedule_message(ACTIONS_QUEUE, {"instance_id": "i1"})
+        repo.flush()
+
+        (sql, params) = cursor.executed[-1]
+        assert len(cursor.executed) == 2
+        assert sql.lstrip().startswith("WITH w0 AS (")
+        assert "AND row_version = %s" in sql
+        assert sql.count("%s") == len(params)
+        assert params[6] == 3
+
+    def test_flush_raises_when_row_version_moved(self):
+        """Test that an instance UPDATE matching no row is reported as a conflict."""
+        cursor = FakeCursor(row=instance_row("i1", with_step=False), returned=[])
+        repo = PostgresWorkflowRepository(cursor, cached_versions())
+        instance, _ = repo.find_instance("i1")
+        repo.save_instance(instance)
+
+        with pytest.raises(ConcurrentUpdateError):
+            repo.flush()
+
+    def test_version_is_loaded_once_per_process(self):
+        """Test that a version missing from the cache is loaded and then shared across repositories."""
+        versions = VersionCache()
+        for _ in range(2):
+            cursor = FakeCursor(row=dict(instance_row("i1"), id="v1", definition={"steps": {}}, workflow_name="wf"))
+            PostgresWorkflowRepository(cursor, versions).find_instance("i1")
+
+        assert len(cursor.executed) == 1
+        assert versions.get("v1", lambda: None).workflow_name == "wf"
+
+    def test_step_executions_load_in_one_query(self):
+        """Test that several steps' latest executions come from one query and cached ones are not reloaded."""
+        now = datetime.now(timezone.utc)
+        row = {"id": uuid.uuid4(), "step_name": "p.a", "status": "completed", "attempts": 1, "started_at": now,
+               "completed_at": now, "input_data": None, "output_data": None, "error_details": None}
+        cursor = FakeCursor(returned=[row])
+        repo = PostgresWorkflowRepository(cursor, cached_versions())
+
+        first = repo.find_step_executions("i1", ["p.a", "p.b"])
+        again = repo.find_step_executions("i1", ["p.a", "p.b"])
+
+        assert len(cursor.executed) == 1
+        assert cursor.executed[0][1] == ("i1", ["p.a", "p.b"])
+        assert first["p.a"].status == StepExecutionStatus.COMPLETED and first["p.b"] is None
+        assert again["p.a"].status == StepExecutionStatus.COMPLETED
+
+    def test_timers_flush_with_the_transition(self):
+        """Test that timers are upserted or deleted in the same statement, the last call per id winning."""
+        cursor = FakeCursor()
+        repo = PostgresWorkflowRepository(cursor, cached_versions())
+        fire_at = datetime.now(timezone.utc)
+
+        repo.schedule_timer("i1:delay:wait", "i1", fire_at, ACTIONS_QUEUE, {"instance_id": "i1"})
+        repo.schedule_timer("i1:timeout:approve", "i1", fire_at, ACTIONS_QUEUE, {"instance_id": "i1"})
+        repo.cancel_timer("i1:timeout:approve")
+        repo.flush()
+
+        ((sql, params),) = cursor.executed
+        assert "ON CONFLICT (id) DO UPDATE" in sql
+        assert "DELETE FROM workflow_timers WHERE id = %s" in sql
+        assert params[0] == "i1:delay:wait" and params[-1] == "i1:timeout:approve"
+        assert sql.count("%s") == len(params)